@@ -9,24 +9,21 @@ dirname = '../data/timely_results/synthetic_orthants_D3_False_N16000_Nt4000_13/l
 
 # In[2]:
 
-# Load the stored classifier
-from tc.timely_classifier import TimelyClassifier
-import cPickle
-tc = cPickle.load(open(dirname + '/ticl.pickle'))
-print tc
-print tc.ds
+# Open the stored trajectories: only the offsets are read here, and
+# neither the classifier nor the data source are loaded.
+import tc
+store = tc.result_store.EpisodeStore(dirname + '/trajectories_final_data.h5')
+print store.data_source, len(store)
 
 
 # In[3]:
 
-# Adjust the filepaths
-tc.ds.data_filename = tc.ds.data_filename.replace('/n/banquet/df/sergeyk', '/Users/sergeyk')
-tc.logging_dirname = '../' + tc.logging_dirname
-tc.report.dirname = '../' + tc.report.dirname
-tc.report.html_filename = '../' + tc.report.html_filename
+# Load the episodes to plot. Pass inds=... to load only a subset.
+actions = store.get('actions')
+rewards = store.get('rewards')
 
 
 # In[5]:
 
-tc.evaluate(num_workers=4, force=True)
-
+tc.evaluation.plot_trajectories(
+    actions, rewards, store, filename=dirname + '/trajectories_final.png')
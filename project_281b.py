@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import h5py
-import subprocess
 import sklearn.datasets
 import sklearn.linear_model
 import sklearn.cross_validation
@@ -574,11 +573,17 @@ def run_experiment(dataset_name, policy_name, num_blocks, parallel=False):
         budgets = [0, .1, .2, .3, .4, .6, .8, 1]
 
     if parallel:
-        ps = [subprocess.Popen('{} {} {} {} {}'.format(
-            script_fname, budget, dataset_name, policy_name, num_blocks), shell=True)
+        # One process per budget, as many at a time as there are cores.
+        jobs = [
+            tc.scheduler.Job(
+                '{}_{}_{}_{}'.format(
+                    dataset_name, policy_name, num_blocks, budget),
+                tc.scheduler.python_cmd(script_fname, [
+                    str(budget), dataset_name, policy_name, str(num_blocks)]),
+                mem=0)
             for budget in budgets]
-        for p in ps:
-            p.communicate()
+        tc.scheduler.LocalScheduler(
+            status_filename=res_dirname + '/status.json').run(jobs)
     else:
         for budget in budgets:
             test_missing_value_methods_for_budget(budget, dataset_name, policy_name, num_blocks)
@@ -1,32 +1,54 @@
+"""
+Submodules, and the classes re-exported here, are imported on first access,
+so that e.g. a worker that only needs TimelyState, a policy and a classifier
+does not pay for importing plotting, reporting and every data source.
+"""
 import os
 repo_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
 
-import gg
-
-import util
-from report import Report
-from data_source import DataSource
-
-import evaluation
-import classifier
-import state_classifier
-from state_classifier import StateClassifier, StateClassifierImagenet
-import policy
-import data_sources
-import timely_classifier
-import hedging
-
-import mask_distribution
-from mask_distribution import MaskDistribution
-
-import mask_clustering
-from mask_clustering import MaskClustering
-
-from timely_classifier import TimelyClassifier
-from timely_state import TimelyState
-
-import aggregate_results
-from gaussian_nb import GaussianNB
-
-import imputer
-from imputer import MeanImputer, GaussianImputer
+from tc import lazy
+
+lazy.install(__name__, [
+    'gg',
+    'util',
+    'profiling',
+    'memory',
+    'cache',
+    'report',
+    'render',
+    'data_source',
+    'evaluation',
+    'result_store',
+    'classifier',
+    'state_classifier',
+    'policy',
+    'data_sources',
+    'timely_classifier',
+    'taxonomy',
+    'hedging',
+    'mask_distribution',
+    'mask_clustering',
+    'timely_state',
+    'anytime',
+    'feature_executor',
+    'batch_server',
+    'frozen',
+    'scheduler',
+    'sweep',
+    'aggregate_results',
+    'results_index',
+    'gaussian_nb',
+    'imputer',
+], {
+    'Report': 'report',
+    'DataSource': 'data_source',
+    'StateClassifier': 'state_classifier',
+    'StateClassifierImagenet': 'state_classifier',
+    'MaskDistribution': 'mask_distribution',
+    'MaskClustering': 'mask_clustering',
+    'TimelyClassifier': 'timely_classifier',
+    'TimelyState': 'timely_state',
+    'GaussianNB': 'gaussian_nb',
+    'MeanImputer': 'imputer',
+    'GaussianImputer': 'imputer',
+})
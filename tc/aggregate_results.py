@@ -7,78 +7,90 @@ import json
 import matplotlib.pyplot as plt
 import numpy as np
 from collections import OrderedDict
+import tc
 
+# Categories of settings compared in the summary, by their conditions.
+best_settings = OrderedDict([
+    ('Optimal', {'policy_method': 'manual_orthants'}),
+    ('Random', {'policy_method': 'random'}),
+    ('Static, greedy', {'policy_feat': 'static', 'gamma': 0}),
+    ('Static, DP greedy', {'policy_method': 'dp'}),
+    ('Static, non-myopic', {'policy_feat': 'static', 'gamma': 1}),
+    ('Dynamic, greedy', {'policy_feat': 'dynamic', 'gamma': 0}),
+    ('Dynamic, non-myopic', {'policy_feat': 'dynamic', 'gamma': 1}),
+])
 
-def get_experiment_results(dirname):
+
+def get_index(results_dirname):
+    """
+    Return the tc.results_index.ResultsIndex of a results directory.
+    """
+    return tc.results_index.ResultsIndex(
+        os.path.join(results_dirname, 'results_index.sqlite'))
+
+
+def results_df(rows):
+    """
+    Return DataFrame of rows of a tc.results_index.ResultsIndex query, with
+    a link to the report of each.
+    """
+    columns = tc.results_index.config_columns + ['dirname', 'link']
+    metrics = sorted(set(k for row in rows for k in row if k not in columns))
+    df = pandas.DataFrame(
+        [[row.get(c) for c in columns[:-1]] + [None] +
+         [row.get(m) for m in metrics] for row in rows],
+        columns=columns + metrics)
+    df['link'] = ['<a href="{}">report</a>'.format(
+        os.path.basename(d) + '.html') for d in df['dirname']]
+    return df
+
+
+def get_experiment_results(dirname, index=None):
     """
     Assemble a DataFrame from the results of an experiment, which are
-    present in a single directory.
+    present in a single directory, updating the results index of its parent
+    directory with any new results first.
+
+    Parameters
+    ----------
+    dirname: string
+    index: tc.results_index.ResultsIndex, optional
+        If not given, that of the parent directory is opened.
 
     Returns
     -------
     max_budget: float
     experiment_df: pandas.DataFrame
     """
-    reports = glob('{}/*/report.json'.format(dirname))
-    info_df = pandas.DataFrame()
-    perf_df = pandas.DataFrame()
-    max_budgets = []
-    for i, report in enumerate(reports):
-        with open(report) as f:
-            data = json.load(f)
-        max_budgets.append(data['info']['data_source']['max_budget'])
-        if 'perf' in data['eval']:
-            df = pandas.DataFrame(data['info'], columns=[
-                'max_iter', 'max_batches', 'batch_size',
-                'policy_feat', 'policy_method',
-                'rewards_mode', 'rewards_loss', 'gamma',
-                'clf_method', 'num_clf', 'random_start', 'impute_method',
-                'normalize_reward_locally', 'add_fully_observed'], index=[i])
-            df['dirname'] = os.path.dirname(report)
-            df['link'] = '<a href="{}">report</a>'.format(os.path.basename(os.path.dirname(report)) + '.html')
-            info_df = info_df.append(df)
-
-            df = pandas.DataFrame(data['eval']['perf'], index=[i])
-            perf_df = perf_df.append(df)
-    print('Found {} tried experimental conditions, with {} successfully evaluated.'.format(len(reports), perf_df.shape[0]))
+    dirname = os.path.normpath(dirname)
+    results_dirname, experiment = os.path.split(dirname)
+    if index is None:
+        index = get_index(results_dirname)
+    num_ingested = index.update(results_dirname, [experiment])
+    max_budgets, rows = index.experiment_results(experiment)
+    print('Found {} tried experimental conditions, with {} successfully evaluated ({} new).'.format(len(max_budgets), len(rows), num_ingested))
     assert(all(x == max_budgets[0] for x in max_budgets))
     max_budget = max_budgets[0]
-    experiment_df = info_df.join(perf_df)
+    experiment_df = results_df(rows)
     return max_budget, experiment_df
 
 
-def filter_best_results(experiment_df, select_lowest='loss_auc'):
+def filter_best_results(index, experiment, select_lowest='loss_auc'):
     """
-    Return DataFrame containing the best results for each one of the
-    listed settings (defined in the code below) in the experiment_df.
+    Return DataFrame containing the best results of the experiment for each
+    one of the best_settings, queried from its results index.
 
     Returns:
     best_df: pandas.DataFrame
     """
-    settings = OrderedDict([
-        ('Optimal', {'policy_method': 'manual_orthants'}),
-        ('Random', {'policy_method': 'random'}),
-        ('Static, greedy', {'policy_feat': 'static', 'gamma': 0}),
-        ('Static, DP greedy', {'policy_method': 'dp'}),
-        ('Static, non-myopic', {'policy_feat': 'static', 'gamma': 1}),
-        ('Dynamic, greedy', {'policy_feat': 'dynamic', 'gamma': 0}),
-        ('Dynamic, non-myopic', {'policy_feat': 'dynamic', 'gamma': 1}),
-    ])
-    df = experiment_df  # just shortening the name
-    best_inds = []
+    rows = []
     indices = []
-    for setting, conditions in settings.items():
-        try:
-            mask = reduce(
-                lambda a, b: a & b,
-                (df[k] == v for k, v in conditions.iteritems())
-            )
-            if mask.sum() > 0:
-                best_inds.append(df[mask][select_lowest].argmin())
-                indices.append(setting)
-        except Exception as e:
-            print(e)
-    best_df = df.ix[best_inds]
+    for setting, conditions in best_settings.items():
+        row = index.best_result(experiment, conditions, select_lowest)
+        if row is not None:
+            rows.append(row)
+            indices.append(setting)
+    best_df = results_df(rows)
     best_df.index = indices
     return best_df
 
@@ -105,10 +117,13 @@ def plot_single_results(single_df, ax):
 def plot_results(
         df, max_budget, single_df=None,
         fontsize=20, figsize=(20, 6), filename=None, nonincreasing=False,
-        ylim=[0, 1]):
+        ylim=[0, 1], curves=None):
     """
     Plot curves of Error vs. Cost and and bar chart of their AUCs on a
     1x2 subplot figure, optionally writing it to filename.
+
+    The curves are given as returned by ResultsIndex.curves(), or else loaded
+    from the evaluation_final.npz of each row's dirname.
     """
     plt.rc('font', **{'family': 'serif', 'serif': ['Computer Modern Roman']})
     plt.rc('text', usetex=True)
@@ -126,9 +141,15 @@ def plot_results(
 
     ax = fig.add_subplot(121)
     for index, row in df.iterrows():
-        data = np.load(row['dirname'] + '/evaluation_final.npz')
-        interp_points = data['interp_points']
-        means = data['means']
+        if curves is not None:
+            if row['dirname'] not in curves:
+                continue
+            interp_points, means, _ = curves[row['dirname']]
+            means = means.copy()
+        else:
+            data = np.load(row['dirname'] + '/evaluation_final.npz')
+            interp_points = data['interp_points']
+            means = data['means']
 
         if nonincreasing:
             for i in range(1, means.shape[0]):
@@ -360,16 +381,21 @@ if __name__ == '__main__':
         print("here")
         experiment_dirnames = [sys.argv[1]]
     else:
-        experiment_dirnames = glob('data/timely_results/*')
+        experiment_dirnames = [
+            d for d in glob('data/timely_results/*') if os.path.isdir(d)]
 
     for dirname in experiment_dirnames:
         print(dirname)
+        dirname = os.path.normpath(dirname)
+        results_dirname, experiment = os.path.split(dirname)
+        index = get_index(results_dirname)
         try:
-            max_budget, experiment_df = get_experiment_results(dirname)
+            max_budget, experiment_df = get_experiment_results(dirname, index)
         except:
             print("Directory could not be processed.")
+            index.close()
             continue
-        best_df = filter_best_results(experiment_df)
+        best_df = filter_best_results(index, experiment)
         best_df.save(dirname + '/best.df')
 
         html_filename = dirname + '/_summary.html'
@@ -396,7 +422,9 @@ if __name__ == '__main__':
 
         plot_filename = dirname + '/_summary.png'
         fig = plot_results(
-            best_df, max_budget, single_df, 20, (22, 6), plot_filename, True)
+            best_df, max_budget, single_df, 20, (22, 6), plot_filename, True,
+            curves=index.curves(best_df['dirname']))
+        index.close()
 
     # plot_scenes_vs_budgets('scene15')
     # plot_scenes_vs_budgets('ilsvrc65')
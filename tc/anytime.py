@@ -0,0 +1,83 @@
+"""
+Anytime inference: run the policy on a single instance and stream
+multi-class confidences after every action.
+"""
+import time
+import numpy as np
+
+
+def anytime_classify_instance(
+        instance, ds, policy, predict_proba, state, budget=None,
+        deadline=None):
+    """
+    Generator running sequential classification on a single instance.
+
+    Before any action is taken, yields (None, 0, confidences) for the empty
+    state. After every action, yields the action, the cumulative cost, and
+    the new confidences. Stops when the policy selects no action, when the
+    next action would exceed the budget, or when the deadline has passed.
+
+    The caller may stop iterating at any point: the last yielded
+    confidences are the best available answer.
+
+    Parameters
+    ----------
+    instance: (D,) ndarray or callable
+        Either a fully-observed feature vector, or a feature provider
+        called as provider(action_ind) and returning the (D_a,) observations
+        of that action, which is only called for actions actually taken.
+    ds: tc.DataSource
+        Only action_costs and max_budget are used.
+    policy: tc.Policy
+    predict_proba: callable
+        Maps (N, S) states to (N, K) confidences.
+    state: tc.TimelyState
+    budget: float, optional
+        Cost budget, defaults to ds.max_budget.
+        Costs are always normalized by ds.max_budget in the state, as in
+        training.
+    deadline: float, optional
+        Wall-clock seconds from the call after which no new actions are
+        started. An action in progress is not interrupted.
+
+    Yields
+    ------
+    action_ind: int or None
+    cumulative_cost: float
+    confidences: (K,) ndarray of float
+    """
+    if budget is None:
+        budget = ds.max_budget
+    t_end = None if deadline is None else time.time() + deadline
+
+    provider = None
+    if callable(instance):
+        provider = instance
+        instance = np.zeros(state.D)
+    else:
+        instance = np.asarray(instance)
+
+    action_inds = []
+    cumulative_cost = 0
+    state_vector = state.get_initial_state()
+    yield None, cumulative_cost, predict_proba(np.atleast_2d(state_vector))[0]
+
+    while True:
+        if t_end is not None and time.time() >= t_end:
+            return
+        action_ind = policy.select_action(state_vector)
+        if action_ind == -1:
+            return
+        new_cumulative_cost = cumulative_cost + ds.action_costs[action_ind]
+        if new_cumulative_cost > budget:
+            return
+
+        if provider is not None:
+            bounds = slice(*state.feature_bounds[action_ind])
+            instance[bounds] = provider(action_ind)
+        action_inds.append(action_ind)
+        cumulative_cost = new_cumulative_cost
+        norm_cost = float(cumulative_cost) / ds.max_budget
+        state_vector = state.get_state(instance, action_inds, norm_cost)
+        yield (action_ind, cumulative_cost,
+               predict_proba(np.atleast_2d(state_vector))[0])
@@ -0,0 +1,273 @@
+"""
+Micro-batching scheduler for serving many concurrent timely-classification
+requests.
+
+Every in-flight request is at some step of its own episode. On each tick, the
+scheduler stacks the current states of all in-flight requests, selects their
+next actions with one batched policy call, advances every request by one
+action, and computes all new confidences with one batched classifier call.
+Requests finish independently, when the policy selects no action or the next
+action would exceed the budget.
+
+Run as a script for a local load-test harness on SyntheticOrthants data.
+"""
+import time
+import threading
+import Queue
+import optparse
+import tempfile
+import numpy as np
+
+
+class Request(object):
+    """
+    A single timely-classification request.
+
+    Properties
+    ----------
+    instance: (D,) ndarray
+    action_inds: list of int
+        Actions taken so far.
+    cumulative_cost: float
+    confidences: (K,) ndarray or None
+        The current best answer.
+    arrival_time, finish_time: float
+    """
+    def __init__(self, instance):
+        self.instance = np.asarray(instance)
+        self.action_inds = []
+        self.cumulative_cost = 0
+        self.state_vector = None
+        self.confidences = None
+        self.arrival_time = time.time()
+        self.finish_time = None
+        self.done = threading.Event()
+
+    @property
+    def latency(self):
+        return self.finish_time - self.arrival_time
+
+    def result(self, timeout=None):
+        """
+        Block until the request is finished and return its confidences.
+        """
+        self.done.wait(timeout)
+        return self.confidences
+
+
+class BatchScheduler(object):
+    """
+    Parameters
+    ----------
+    ds: tc.DataSource
+        Only action_costs and max_budget are used.
+    policy: tc.Policy
+        Must implement select_actions().
+    predict_proba: callable
+        Maps (N, S) states to (N, K) confidences.
+    state: tc.TimelyState
+    max_batch_size: int, optional [64]
+        Maximum number of in-flight requests advanced per tick.
+    max_delay: float, optional [0.005]
+        When idle, seconds to wait after the first arrival for more requests
+        to batch with it.
+    """
+    def __init__(self, ds, policy, predict_proba, state,
+                 max_batch_size=64, max_delay=0.005):
+        self.ds = ds
+        self.policy = policy
+        self.predict_proba = predict_proba
+        self.state = state
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.pending = Queue.Queue()
+        self.active = []
+        self.num_ticks = 0
+        self.batch_sizes = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, instance):
+        """
+        Enqueue a new request and return it.
+        """
+        request = Request(instance)
+        self.pending.put(request)
+        return request
+
+    def _admit(self, block):
+        """
+        Move pending requests into the active set, up to max_batch_size.
+        If block and nothing is active, wait for a first request and then up
+        to max_delay for more.
+        """
+        if block and len(self.active) == 0:
+            try:
+                request = self.pending.get(timeout=0.1)
+            except Queue.Empty:
+                return
+            self._start(request)
+            t_end = time.time() + self.max_delay
+            while len(self.active) < self.max_batch_size:
+                remaining = t_end - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._start(self.pending.get(timeout=remaining))
+                except Queue.Empty:
+                    break
+        while len(self.active) < self.max_batch_size:
+            try:
+                self._start(self.pending.get_nowait())
+            except Queue.Empty:
+                break
+
+    def _start(self, request):
+        request.state_vector = self.state.get_initial_state()
+        self.active.append(request)
+
+    def tick(self):
+        """
+        Advance all active requests by one action, with one batched policy
+        call and one batched classifier call.
+        """
+        if len(self.active) == 0:
+            return
+        self.num_ticks += 1
+        self.batch_sizes.append(len(self.active))
+        costs = self.ds.action_costs
+        max_budget = self.ds.max_budget
+
+        states = np.array([r.state_vector for r in self.active])
+        action_inds = self.policy.select_actions(states)
+
+        finished = []
+        for request, action_ind in zip(self.active, action_inds):
+            if action_ind == -1 or \
+                    request.cumulative_cost + costs[action_ind] > max_budget:
+                finished.append(request)
+                continue
+            request.action_inds.append(action_ind)
+            request.cumulative_cost += costs[action_ind]
+            request.state_vector = self.state.get_state(
+                request.instance, request.action_inds,
+                float(request.cumulative_cost) / max_budget)
+            request.confidences = None
+
+        # Requests that moved, or finished before any confidences were
+        # computed, need new confidences.
+        to_score = [r for r in self.active if r.confidences is None]
+        if len(to_score) > 0:
+            confidences = self.predict_proba(
+                np.array([r.state_vector for r in to_score]))
+            for request, c in zip(to_score, confidences):
+                request.confidences = c
+
+        now = time.time()
+        for request in finished:
+            request.finish_time = now
+            request.done.set()
+        finished = set(finished)
+        self.active = [r for r in self.active if r not in finished]
+
+    def serve_forever(self):
+        """
+        Run the tick loop until stop() is called.
+        """
+        while not self._stop.is_set():
+            self._admit(block=True)
+            self.tick()
+
+    def start(self):
+        """
+        Run serve_forever() in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def benchmark(scheduler, instances, rate, num_requests):
+    """
+    Submit num_requests instances at Poisson arrivals of the given rate, wait
+    for all of them, and return throughput and latency statistics.
+
+    Parameters
+    ----------
+    scheduler: BatchScheduler
+        Must have been started.
+    instances: (N, D) ndarray
+        Sampled with replacement.
+    rate: float
+        Mean arrivals per second.
+    num_requests: int
+
+    Returns
+    -------
+    stats: dict
+    """
+    requests = []
+    t = time.time()
+    for i in np.random.choice(instances.shape[0], num_requests):
+        time.sleep(np.random.exponential(1. / rate))
+        requests.append(scheduler.submit(instances[i]))
+    for request in requests:
+        request.result()
+    elapsed = time.time() - t
+
+    latencies = np.array([r.latency for r in requests])
+    return {
+        'num_requests': num_requests,
+        'rate': rate,
+        'max_batch_size': scheduler.max_batch_size,
+        'max_delay': scheduler.max_delay,
+        'throughput': round(num_requests / elapsed, 1),
+        'latency_p50': round(np.percentile(latencies, 50), 4),
+        'latency_p99': round(np.percentile(latencies, 99), 4),
+        'mean_batch_size': round(np.mean(scheduler.batch_sizes), 1),
+    }
+
+
+if __name__ == '__main__':
+    import tc
+
+    parser = optparse.OptionParser()
+    parser.add_option('--frozen', help='Frozen model to serve.')
+    parser.add_option('--D', type='int', default=2)
+    parser.add_option('--num_requests', type='int', default=2000)
+    parser.add_option('--rates', default='100,500,2000')
+    parser.add_option('--max_batch_sizes', default='1,16,64')
+    parser.add_option('--max_delay', type='float', default=0.005)
+    opts, args = parser.parse_args()
+
+    ds = tc.data_sources.SyntheticOrthants(
+        tempfile.mkdtemp(), D=opts.D, N=2000, N_test=1000)
+    if opts.frozen is not None:
+        model = tc.frozen.load(opts.frozen)
+        policy, predict_proba = model.policy, model.predict_proba
+    else:
+        # The optimal policy needs no training; fit the classifier on states
+        # with random masks.
+        policy = tc.policy.ManualOrthantsPolicy(ds)
+        state = tc.TimelyState(ds.action_dims)
+        masks = np.random.rand(ds.X.shape[0], len(ds.actions)) > .5
+        clf = tc.StateClassifier(ds.action_dims, len(ds.labels))
+        clf.fit(state.get_states_from_mask(ds.X, masks), ds.y)
+        predict_proba = clf.predict_proba
+
+    X_test = ds.X_test
+    for max_batch_size in [int(x) for x in opts.max_batch_sizes.split(',')]:
+        for rate in [float(x) for x in opts.rates.split(',')]:
+            scheduler = BatchScheduler(
+                ds, policy, predict_proba, tc.TimelyState(ds.action_dims),
+                max_batch_size, opts.max_delay).start()
+            print(benchmark(scheduler, X_test, rate, opts.num_requests))
+            scheduler.stop()
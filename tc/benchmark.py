@@ -0,0 +1,295 @@
+"""
+Scaling benchmark of the training loop.
+
+For data sources of growing size, number of features and number of actions,
+times the stages of TimelyClassifier.fit() and of evaluation, and rollout
+throughput in states per second, for each given number of workers. Results
+are written as JSON, and can be compared against a baseline results file.
+
+Evaluation is timed without the plotting and file output of
+TimelyClassifier.evaluate(), which would dominate on small data.
+
+Run as a script; --quick runs a small grid in about a minute, for CI:
+
+    python tc/benchmark.py --quick --output=bench.json
+    python tc/benchmark.py --quick --baseline=bench.json
+"""
+import sys
+import time
+import json
+import shutil
+import platform
+import tempfile
+import optparse
+import subprocess
+import multiprocessing
+import numpy as np
+import tc
+
+# Stages of each fit() iteration, as named in its profile.
+fit_stages = [
+    'process_instances', 'impute_states', 'learn_classifier',
+    'compute_confidences', 'compute_rewards', 'learn_policy', 'val_policy']
+
+config = {
+    'max_iter': 3,
+    'min_iter': 3,
+    'batch_size': .5,
+    'max_batches': 2,
+    'random_start': True,
+    'policy_feat': 'dynamic',
+    'policy_method': 'linear_untaken',
+    'clf_method': 'logreg',
+    'impute_method': 'mean',
+    'rewards_mode': 'auc',
+    'rewards_loss': 'infogain',
+    'gamma': 1.,
+    'epsilons_mode': 'exp',
+}
+
+# (data source kind, parameters) grids.
+full_grid = [
+    ('orthants', {'D': 2, 'N': 2000}),
+    ('orthants', {'D': 2, 'N': 8000}),
+    ('orthants', {'D': 3, 'N': 8000}),
+    ('orthants', {'D': 4, 'N': 8000}),
+    ('random', {'A': 8, 'D': 32, 'N': 2000}),
+    ('random', {'A': 8, 'D': 32, 'N': 8000}),
+    ('random', {'A': 32, 'D': 128, 'N': 8000}),
+]
+full_workers = [1, 2, 4]
+
+quick_grid = [
+    ('orthants', {'D': 2, 'N': 400}),
+    ('random', {'A': 4, 'D': 8, 'N': 400}),
+]
+quick_workers = [1, 2]
+
+
+def make_data_source(kind, dirname, N, D, A=None):
+    """
+    Parameters
+    ----------
+    kind: string in ['orthants', 'random']
+        'orthants' is tc.data_sources.SyntheticOrthants with D dimensions,
+        which has D + 2 ** D actions. 'random' is tc.data_sources.Random
+        with A actions of equal dimension totaling D, random costs and half
+        of the total cost as budget.
+    dirname: string
+    N: int
+        Number of training instances; N / 4 test instances are generated.
+    D: int
+    A: int, optional
+    """
+    if kind == 'orthants':
+        return tc.data_sources.SyntheticOrthants(
+            dirname, D=D, N=N, N_test=N / 4)
+    elif kind == 'random':
+        action_dims = [D / A] * A
+        return tc.data_sources.Random(
+            ['a{}'.format(a) for a in range(A)], action_dims, range(4),
+            N, N / 4, budget_fraction=.5, dirname=dirname)
+    raise Exception('Unknown data source kind {}'.format(kind))
+
+
+def time_evaluation(ticl, num_workers):
+    """
+    Run the trained ticl on the test set of its data source, timing the
+    stages of evaluate() that do not plot or write files.
+
+    Returns
+    -------
+    times: dict of stage name to seconds
+    num_states: int
+    """
+    profiler = tc.profiling.Profiler()
+    instances = ticl.ds.X_test
+    labels = ticl.ds.y_test
+    profiler.tic('process_instances')
+    cumulative_costs, states, actions = ticl.process_instances(
+        instances, 0, num_workers)
+    profiler.toc('process_instances', quiet=True)
+
+    profiler.tic('compute_confidences')
+    confidences = ticl.predict_proba(states)
+    section_inds = np.cumsum([len(x) for x in cumulative_costs])
+    confidences = np.split(confidences, section_inds[:-1])
+    profiler.toc('compute_confidences', quiet=True)
+
+    profiler.tic('compute_rewards')
+    for i in xrange(len(confidences)):
+        ticl.compute_rewards(confidences[i], cumulative_costs[i], labels[i])
+    profiler.toc('compute_rewards', quiet=True)
+    return profiler.last_times(), states.shape[0]
+
+
+def fit_times(ticl):
+    """
+    Return dict of fit stage name to total seconds over all iterations, from
+    the profile of the last fit().
+    """
+    fit = [n for n in ticl.report.profile['fit']['children']
+           if n['name'] == 'fit'][0]
+    iteration = fit['children'][0]
+    times = dict((n['name'], n['total']) for n in iteration['children'])
+    times = dict((s, round(times.get(s, 0), 3)) for s in fit_stages)
+    times['total'] = round(fit['total'], 3)
+    return times
+
+
+def run_case(kind, params, num_workers, dirname, seed=0):
+    """
+    Fit and evaluate a TimelyClassifier on a fresh data source.
+
+    Returns
+    -------
+    result: dict
+    """
+    np.random.seed(seed)
+    ds = make_data_source(kind, dirname, **params)
+    ticl = tc.TimelyClassifier(ds, dirname, **config)
+    ticl.fit(num_workers, force=True)
+    eval_times, num_states = time_evaluation(ticl, num_workers)
+    return {
+        'name': '{}_{}_w{}'.format(
+            kind, '_'.join('{}{}'.format(k, params[k])
+                           for k in sorted(params)), num_workers),
+        'data_source': ds.name,
+        'num_actions': len(ds.actions),
+        'num_features': int(sum(ds.action_dims)),
+        'N': ds.N,
+        'N_test': ds.N_test,
+        'num_workers': num_workers,
+        'fit': fit_times(ticl),
+        'evaluate': eval_times,
+        'num_states': num_states,
+        'states_per_sec': round(
+            num_states / max(eval_times['process_instances'], 1e-3), 1),
+        'peak_rss_mb': round(tc.memory.peak_rss_mb(), 1)
+    }
+
+
+def environment():
+    try:
+        revision = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=tc.repo_dir).strip()
+    except Exception:
+        revision = None
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': revision,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count()
+    }
+
+
+def run(grid, workers, verbose=True):
+    """
+    Run all cases of the grid for each number of workers.
+
+    Returns
+    -------
+    results: dict
+        With the 'environment' and a list of 'cases'.
+    """
+    dirname = tempfile.mkdtemp()
+    cases = []
+    try:
+        for kind, params in grid:
+            for num_workers in workers:
+                case_dirname = tempfile.mkdtemp(dir=dirname)
+                cases.append(run_case(kind, params, num_workers, case_dirname))
+                if verbose:
+                    print(format_case(cases[-1]))
+    finally:
+        shutil.rmtree(dirname)
+    return {'environment': environment(), 'cases': cases}
+
+
+def format_case(case):
+    return '{:<36} fit {:>8.2f} s  eval {:>7.2f} s  {:>10.0f} states/s'.format(
+        case['name'], case['fit']['total'],
+        sum(case['evaluate'].values()), case['states_per_sec'])
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compare results against baseline results, case by case.
+
+    Parameters
+    ----------
+    results, baseline: dict
+        Outputs of run().
+    threshold: float, optional [0.2]
+        Relative slowdown above which a metric is a regression.
+
+    Returns
+    -------
+    rows: list of (case name, metric, baseline value, value, ratio)
+        For all metrics of cases present in both, where ratio > 1 is worse.
+    regressions: list
+        The rows with ratio > 1 + threshold.
+    """
+    baseline_cases = dict((c['name'], c) for c in baseline['cases'])
+    rows = []
+    for case in results['cases']:
+        if case['name'] not in baseline_cases:
+            continue
+        base = baseline_cases[case['name']]
+        metrics = [('fit.' + s, case['fit'][s], base['fit'].get(s))
+                   for s in sorted(case['fit'])]
+        metrics += [('evaluate.' + s, case['evaluate'][s],
+                     base['evaluate'].get(s))
+                    for s in sorted(case['evaluate'])]
+        for name, value, base_value in metrics:
+            if base_value is None:
+                continue
+            # Ignore noise on stages too short to time reliably.
+            ratio = max(value, 0.01) / max(base_value, 0.01)
+            rows.append((case['name'], name, base_value, value, ratio))
+        # Throughput: higher is better.
+        ratio = base['states_per_sec'] / max(case['states_per_sec'], 1e-3)
+        rows.append((case['name'], 'states_per_sec', base['states_per_sec'],
+                     case['states_per_sec'], ratio))
+    regressions = [r for r in rows if r[4] > 1 + threshold]
+    return rows, regressions
+
+
+if __name__ == '__main__':
+    import matplotlib as mpl
+    mpl.use('Agg')
+
+    parser = optparse.OptionParser()
+    parser.add_option('--quick', action='store_true',
+                      help='Run a small grid, for CI.')
+    parser.add_option('--workers',
+                      help='Comma-separated numbers of workers to run.')
+    parser.add_option('--output', help='Write results JSON here.')
+    parser.add_option('--baseline', help='Results JSON to compare against.')
+    parser.add_option('--threshold', type='float', default=0.2)
+    opts, args = parser.parse_args()
+
+    grid, workers = full_grid, full_workers
+    if opts.quick:
+        grid, workers = quick_grid, quick_workers
+    if opts.workers is not None:
+        workers = [int(w) for w in opts.workers.split(',')]
+
+    results = run(grid, workers)
+    if opts.output is not None:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Results written to {}'.format(opts.output))
+
+    if opts.baseline is not None:
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, opts.threshold)
+        for row in rows:
+            print('{:<36} {:<30} {:>10.3f} {:>10.3f} {:>6.2f}x'.format(*row))
+        if len(regressions) > 0:
+            print('{} regressions over {:.0%}.'.format(
+                len(regressions), opts.threshold))
+            sys.exit(1)
@@ -0,0 +1,264 @@
+"""
+Content-addressed cache of training artifacts.
+
+Results are stored under a hash of everything they depend on: the stage that
+produced them, the settings that stage uses, the identity of the data source
+and the version of the code. Settings a stage does not use are left out of
+its key, so that experiments differing only in them share it. For example,
+all settings of a sweep that differ only in gamma or policy_feat share the
+imputer fit and the rollouts and classifier fit of the first iteration, in
+which the policy is still random.
+
+    cache = ResultCache(dirname)
+    key = cache.key('imputer', ds, {'impute_method': 'mean'})
+    imputer, hit = cache.cached(key, fit_imputer)
+
+A MemoryCache shares results between experiments run in one process, such as
+those of a sweep (see tc.sweep), with or without a ResultCache behind it.
+"""
+import os
+import abc
+import json
+import hashlib
+import tempfile
+import cPickle as pickle
+import numpy as np
+import tc
+
+_code_version = None
+_file_digests = {}
+
+
+def code_version():
+    """
+    Return hex digest of the source of the tc package.
+    Any edit to it invalidates all cached results.
+    """
+    global _code_version
+    if _code_version is None:
+        h = hashlib.sha1()
+        tc_dirname = os.path.join(tc.repo_dir, 'tc')
+        for dirpath, dirnames, filenames in sorted(os.walk(tc_dirname)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                h.update(os.path.relpath(path, tc_dirname))
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+        _code_version = h.hexdigest()
+    return _code_version
+
+
+def file_digest(filename, block_size=2 ** 20):
+    """
+    Return hex digest of the contents of filename, memoized on its path,
+    modification time and size.
+    """
+    st = os.stat(filename)
+    memo_key = (os.path.realpath(filename), st.st_mtime, st.st_size)
+    if memo_key not in _file_digests:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), ''):
+                h.update(block)
+        _file_digests[memo_key] = h.hexdigest()
+    return _file_digests[memo_key]
+
+
+def data_source_key(ds, with_budget=True):
+    """
+    Return hex digest identifying the data source: its name, configuration,
+    and training data, which is hashed from its data file if it has one,
+    and from memory otherwise.
+
+    If not with_budget, the key leaves out max_budget, which is part of the
+    name of most data sources, for results that do not depend on it.
+    """
+    h = hashlib.sha1()
+    config = ds.__config__()
+    if with_budget:
+        h.update(ds.name)
+    else:
+        h.update(type(ds).__name__)
+        config.pop('max_budget', None)
+    h.update(json.dumps(config))
+    data_filename = getattr(ds, 'data_filename', None)
+    if data_filename is not None and os.path.exists(data_filename):
+        h.update(file_digest(data_filename))
+    else:
+        for arr in [ds.X, ds.y]:
+            arr = np.ascontiguousarray(arr)
+            h.update(str(arr.dtype) + str(arr.shape))
+            h.update(arr.data)
+    return h.hexdigest()
+
+
+def make_key(stage, ds, settings, with_budget=True):
+    """
+    Parameters
+    ----------
+    stage: string
+        Name of what is cached.
+    ds: tc.DataSource
+    settings: dict
+        JSON-serializable settings the result depends on. Numpy scalars are
+        converted to Python scalars.
+    with_budget: bool, optional [True]
+        If False, the key is shared by data sources that differ only in
+        max_budget; see data_source_key().
+
+    Returns
+    -------
+    key: string
+    """
+    return hashlib.sha1(json.dumps({
+        'stage': stage,
+        'settings': settings,
+        'data_source': data_source_key(ds, with_budget),
+        'code_version': code_version()
+    }, sort_keys=True, default=lambda x: x.item())).hexdigest()
+
+
+class Cache(object):
+    """
+    A Cache must implement get() and put().
+
+    Properties
+    ----------
+    persistent: bool
+        If True, results outlive the process, and may have been computed
+        before a forced refit.
+    hits, misses: int
+        Counts of get() calls, for reporting.
+    """
+    persistent = True
+
+    __metaclass__ = abc.ABCMeta
+
+    def key(self, stage, ds, settings, with_budget=True):
+        """
+        See make_key().
+        """
+        return make_key(stage, ds, settings, with_budget)
+
+    @abc.abstractmethod
+    def get(self, key, default=None):
+        """
+        Return the result stored under key, or default, counting the hit or
+        miss.
+        """
+        pass
+
+    @abc.abstractmethod
+    def put(self, key, value):
+        """
+        Store value under key.
+        """
+        pass
+
+    def cached(self, key, compute):
+        """
+        Return the result stored under key, or compute and store it.
+
+        Returns
+        -------
+        value: object
+        hit: bool
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        value = compute()
+        self.put(key, value)
+        return value, False
+
+
+class ResultCache(Cache):
+    """
+    Pickled results stored in dirname under their keys.
+
+    Writes are atomic, so that concurrent experiments of a sweep can share
+    the cache: when two compute the same result, the last write wins, and
+    both results are equally valid.
+
+    Parameters
+    ----------
+    dirname: string
+    """
+    def __init__(self, dirname):
+        self.dirname = dirname
+        tc.util.mkdir_p(dirname)
+        self.hits = 0
+        self.misses = 0
+
+    def filename(self, key):
+        return os.path.join(self.dirname, key[:2], key[2:] + '.pickle')
+
+    def get(self, key, default=None):
+        """
+        Return the result stored under key, or default.
+        Unreadable entries, as left by a crash of an old version, are misses.
+        """
+        try:
+            with open(self.filename(key), 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        filename = self.filename(key)
+        dirname = os.path.dirname(filename)
+        tc.util.mkdir_p(dirname)
+        fd, tmp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=2)
+        os.rename(tmp_filename, filename)
+
+
+class MemoryCache(Cache):
+    """
+    Results kept in memory for the life of the process.
+
+    Results are stored pickled, so that every get() returns a copy that can
+    be modified, as fit() goes on to modify the classifier it learned,
+    without affecting the stored result or other copies of it.
+
+    Parameters
+    ----------
+    backing: Cache, optional
+        If given, results are also stored in it, and looked up in it if not
+        in memory.
+    read_backing: bool, optional [True]
+        If False, results are only stored in the backing cache.
+    """
+    persistent = False
+
+    def __init__(self, backing=None, read_backing=True):
+        self.backing = backing
+        self.read_backing = read_backing
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self.results:
+            self.hits += 1
+            return pickle.loads(self.results[key])
+        if self.backing is not None and self.read_backing:
+            value = self.backing.get(key)
+            if value is not None:
+                self.hits += 1
+                self.results[key] = pickle.dumps(value, protocol=2)
+                return value
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.results[key] = pickle.dumps(value, protocol=2)
+        if self.backing is not None:
+            self.backing.put(key, value)
@@ -3,6 +3,9 @@ from hurry.filesize import size as hsize
 import sklearn.linear_model
 import sklearn.ensemble
 import sklearn.naive_bayes
+import sklearn.cross_validation
+import sklearn.grid_search
+import sklearn.metrics
 from sklearn.grid_search import GridSearchCV
 from sklearn.cross_validation import KFold
 import abc
@@ -30,11 +33,13 @@ class PredictorClassifier(object):
         return '{}: {}'.format(
             self.__class__.__name__, clf)
 
-    def plot_weights(self, filename=None):
+    def plot_weights(self, filename=None, plot=None):
+        if plot is None:
+            plot = tc.util.plot_weights
         if hasattr(self.clf, 'coef_'):
-            return tc.util.plot_weights(
-                self.clf.coef_, xlabel='weights on features',
-                ylabel='Classes', filename=filename)
+            plot(self.clf.coef_, xlabel='weights on features',
+                 ylabel='Classes', filename=filename)
+            return [filename]
         else:
             return None
 
@@ -100,6 +105,7 @@ class PredictorClassifier(object):
         assert(X.shape[0] == feature_mask.shape[0])
         assert(X.shape[1] == feature_mask.shape[1] + 1)
         print("X size is {}".format(hsize(X.nbytes)))
+        self.X_nbytes = X.nbytes
 
         X_val = np.hstack((
             self.state.slice_array(val_states_arr, 'observations'),
@@ -269,11 +275,13 @@ class SGDClassifier(PredictorClassifier):
 
 
 class GaussianNBClassifier(PredictorClassifier):
-    def plot_weights(self, filename=None):
+    def plot_weights(self, filename=None, plot=None):
+        if plot is None:
+            plot = tc.util.plot_weights
         if hasattr(self.clf, 'theta_'):
-            return tc.util.plot_weights(
-                self.clf.theta_, xlabel='weights on features',
-                ylabel='Classes', filename=filename)
+            plot(self.clf.theta_, xlabel='weights on features',
+                 ylabel='Classes', filename=filename)
+            return [filename]
         else:
             return None
 
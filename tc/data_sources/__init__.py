@@ -1,12 +1,16 @@
-from synthetic_orthants import SyntheticOrthants
+from tc import lazy
 
-from random_source import Random
-
-import imagenet
-from imagenet import ImageNet, ILSVRC65
-
-import scene15
-from scene15 import Scene15
-
-import ltrc
-from ltrc import LTRC
\ No newline at end of file
+lazy.install(__name__, [
+    'synthetic_orthants',
+    'random_source',
+    'imagenet',
+    'scene15',
+    'ltrc',
+], {
+    'SyntheticOrthants': 'synthetic_orthants',
+    'Random': 'random_source',
+    'ImageNet': 'imagenet',
+    'ILSVRC65': 'imagenet',
+    'Scene15': 'scene15',
+    'LTRC': 'ltrc',
+})
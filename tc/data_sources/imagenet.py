@@ -14,10 +14,6 @@ import os
 import cPickle as pickle
 import numpy as np
 import copy
-import networkx as nx
-import matplotlib.pyplot as plt
-from scipy.io import loadmat
-from sklearn.preprocessing import StandardScaler
 import h5py
 import tc
 from tc import DataSource
@@ -25,6 +21,9 @@ from tc import DataSource
 # data/imagenet should contain classifier output data.
 imagenet_dir = os.path.join(tc.repo_dir, 'data/imagenet')
 imagenet_pickle_filename = os.path.join(os.path.dirname(__file__), 'imagenet_%d_tax.pickle')
+# Compiled from the pickles on first use, see tc.taxonomy.
+imagenet_taxonomy_filename = os.path.join(os.path.dirname(__file__), 'imagenet_%d_tax.npz')
+ilsvrc65_taxonomy_filename = os.path.join(os.path.dirname(__file__), 'ilsvrc65_tax.npz')
 
 # The Hedging Your Bets code release should be extracted to the ext/ folder.
 # (Download from http://www.image-net.org/projects/hedging/).
@@ -36,45 +35,39 @@ ilsvrc65_clf_outputs_val = tc.repo_dir + '/test/support/ilsvrc65_clf_outputs_val
 ilsvrc65_clf_outputs_test = tc.repo_dir + '/test/support/ilsvrc65_clf_outputs_test.mat'
 
 
-def process_graph(g, nodes):
+def process_graph(g, nodes=None):
     """
     Parameters
     ----------
-    g : networkx.DiGraph
+    g : tc.taxonomy.Taxonomy or networkx.DiGraph
 
-    nodes : list
-        List of node names, all of which are in g.
+    nodes : list, optional
+        If g is a networkx.DiGraph, list of node names, all of which are in g.
         The first K nodes in this list correspond to the leaf nodes, and are in
         the same order as observations that we may see.
 
     Returns
     -------
     graph : dict
-        'g': the original graph, augmented with 'leaves' field
+        See tc.taxonomy.Taxonomy.graph(); with 'leaf_membership' as a sparse
+        K x N matrix.
+        'g': if given, the original graph, augmented with 'leaves' field
     """
-    assert(len(g.nodes()) == len(nodes))
-    N = len(nodes)
-
-    # augment graph with 'leaves' field
-    g = copy.deepcopy(g)
-    compute_leave_sets(g, nodes)
-
-    heights = np.array([g.node[node]['height'] for node in nodes]).flatten()
-    leaf_mask = np.atleast_2d(heights == 0)
-    K = leaf_mask.sum()
-
-    # Construct K x N matrix of leaf membership.
-    leaf_membership = np.zeros((K, N))
-    leaf_membership[:, :K] = np.eye(K)
-    for i in range(K, N):
-        leaf_membership[g.node[nodes[i]]['leaf_inds'], i] = 1
+    if isinstance(g, tc.taxonomy.Taxonomy):
+        taxonomy = g
+        g = None
+    else:
+        assert(len(g.nodes()) == len(nodes))
+        # augment graph with 'leaves' field
+        g = copy.deepcopy(g)
+        taxonomy = compute_leave_sets(g, nodes)
 
-    num_leaves = leaf_membership.sum(0)
-    rewards = np.log2(K / num_leaves).flatten()
+    K = (np.asarray(taxonomy.heights) == 0).sum()
+    assert(np.all(taxonomy.leaves == np.arange(K)))
 
-    graph = {
-        'g': g, 'nodes': nodes, 'heights': heights, 'rewards': rewards,
-        'leaf_membership': leaf_membership}
+    graph = taxonomy.graph()
+    if g is not None:
+        graph['g'] = g
     return graph
 
 
@@ -84,45 +77,32 @@ def compute_leave_sets(graph, nodes):
     the given key.
     This function is able to handle large graphs, as it is not recursive.
 
-    Code originally by my labmate Yangqing Jia.
+    Code originally by my labmate Yangqing Jia; the leaf sets are now
+    computed as bitsets by tc.taxonomy.
 
     Parameters
     ----------
     graph : nx.DiGraph
 
     nodes : list of strings
+
+    Returns
+    -------
+    taxonomy : tc.taxonomy.Taxonomy
     """
     leaves_key = 'leaves'
     leaf_inds_key = 'leaf_inds'
 
     if len(graph.nodes()) == 0:
         return
-    stack = [n for n in graph.nodes() if len(graph.predecessors(n)) == 0]
-    if len(stack) == 0:
-        raise ValueError('The graph does not have any root: possible cycles?')
-    expanded = set()
-    while len(stack) > 0:
-        node = stack[-1]
-        if stack[-1] in expanded:
-            # all children in this stack has been computed, so we can compute
-            # the node now.
-            if len(graph.successors(node)) == 0:
-                # I am a leaf
-                graph.node[node][leaves_key] = set([node])
-            else:
-                leaves = set()
-                for c in graph.successors(node):
-                    leaves.update(graph.node[c][leaves_key])
-                graph.node[node][leaves_key] = leaves
-            del stack[-1]
-        else:
-            expanded.add(node)
-            stack += graph.successors(node)
+    taxonomy = tc.taxonomy.Taxonomy.from_networkx(graph, nodes)
 
     # also store indices to nodes list
-    for node in nodes:
-        inds = [nodes.index(n) for n in graph.node[node][leaves_key]]
-        graph.node[node][leaf_inds_key] = sorted(inds)
+    for i, node in enumerate(nodes):
+        inds = taxonomy.leaves[taxonomy.leaf_inds(taxonomy.leaf_bits[i])]
+        graph.node[node][leaves_key] = set(nodes[j] for j in inds)
+        graph.node[node][leaf_inds_key] = list(inds)
+    return taxonomy
 
 
 class ILSVRC65(DataSource):
@@ -132,10 +112,10 @@ class ILSVRC65(DataSource):
     def __init__(self, dirname, max_budget=None):
         self.dirname = dirname
         self.graph = self.load_graph()
-        g = self.graph['g']
+        words = self.graph['words']
         # TODO: is this the right way to determine names?
-        self.labels = [g.node[node]['word'] for node in self.graph['nodes']]
-        self.actions = [g.node[node]['word'] for node in np.array(self.graph['nodes'])[self.graph['heights'] == 0]]
+        self.labels = list(words)
+        self.actions = [words[i] for i in np.flatnonzero(self.graph['heights'] == 0)]
         self.action_dims = np.ones(len(self.actions), dtype=int)
         self.action_costs = np.ones(len(self.actions), dtype=float)
         self.max_budget = max_budget
@@ -168,25 +148,35 @@ class ILSVRC65(DataSource):
 
     @staticmethod
     def load_graph():
+        taxonomy = tc.taxonomy.compiled(
+            ilsvrc65_taxonomy_filename, ilsvrc65_meta_filename,
+            ILSVRC65.compile_taxonomy)
+        return process_graph(taxonomy)
+
+    @staticmethod
+    def compile_taxonomy():
+        from scipy.io import loadmat
+
         ilsvrc65 = loadmat(ilsvrc65_meta_filename)
-        g65 = nx.DiGraph()
         # Load nodes in the order of the meta file (leaves first).
-        nodes = []
+        nodes, words, heights, edges = [], [], [], []
         for x in ilsvrc65['synsets']:
             nodes.append(x['WNID'][0][0])
-            g65.add_node(nodes[-1], {'word': x['words'][0][0], 'height': x['height'][0][0]})
+            words.append(x['words'][0][0])
+            heights.append(x['height'][0][0])
         for x in ilsvrc65['synsets']:
             node = x['WNID'][0][0]
             for child in x['children'][0][0]:
-                g65.add_edge(node, nodes[child - 1])
-        graph = process_graph(g65, nodes)
-        return graph
+                edges.append((node, nodes[child - 1]))
+        return tc.taxonomy.Taxonomy(nodes, edges, heights, words)
 
     @staticmethod
     def load_data():
         """
         Load the classifier outputs for val and test sets.
         """
+        from scipy.io import loadmat
+
         data = loadmat(ilsvrc65_clf_outputs_val)
         X = data['leaf_probs']
         y = data['labels'] - 1
@@ -216,18 +206,40 @@ class ImageNet(object):
         iteratively.
     """
     def __init__(self, max_leaves=200, method='size'):
-        num = 1000  # can be 7404 (for ImageNet10K?)
-        self.g = pickle.load(open(imagenet_pickle_filename % num))
-        self.nodes = self.g.nodes()
+        self.num = 1000  # can be 7404 (for ImageNet10K?)
+        self.taxonomy = self.load_taxonomy(self.num)
+        self.nodes = self.taxonomy.nodes
         if method == 'size':
-            self.groups = self.select_groups_by_size(self.g, self.nodes, max_leaves)
+            self.groups = self.select_groups_by_size(self.taxonomy, max_leaves)
         elif method == 'random':
             self.groups = self.select_groups_random
         else:
             raise('Unknown method!')
-        self.labels = self.g.nodes()
+        self.labels = self.taxonomy.nodes
         #self.X, self.y = self.load_data('val')
 
+    @staticmethod
+    def load_taxonomy(num):
+        """
+        Load the compiled taxonomy with num leaves, compiling it from the
+        pickled networkx graph if needed.
+        """
+        def compile_taxonomy():
+            with open(imagenet_pickle_filename % num) as f:
+                return tc.taxonomy.Taxonomy.from_networkx(pickle.load(f))
+        return tc.taxonomy.compiled(
+            imagenet_taxonomy_filename % num, imagenet_pickle_filename % num,
+            compile_taxonomy)
+
+    @property
+    def g(self):
+        """
+        The taxonomy as a networkx.DiGraph, for plotting.
+        """
+        if not hasattr(self, '_g'):
+            self._g = self.taxonomy.to_networkx()
+        return self._g
+
     @staticmethod
     def load_data(s):
         """
@@ -241,15 +253,13 @@ class ImageNet(object):
         return X, y
 
     @staticmethod
-    def select_groups_by_size(g, nodes, max_leaves):
+    def select_groups_by_size(taxonomy, max_leaves):
         """
         Select leaf node groups by inner-node sizes.
 
         Parameters
         ----------
-        g : networkx.DiGraph
-
-        nodes : list of strings
+        taxonomy : tc.taxonomy.Taxonomy
 
         max_leaves : int
             The desired number of leaf nodes per group.
@@ -260,29 +270,15 @@ class ImageNet(object):
         -------
         selected_groups : list of (node name, list of leaf node names) tuples.
         """
-        g = copy.deepcopy(g)
-        compute_leave_sets(g, nodes)
-        selected_groups = []
-        while True:
-            all_num_leaves = [len(g.node[node]['leaves']) for node in g.nodes()]
-            if sum(all_num_leaves) == 0:
-                break
-            ind = np.argsort(-np.array(all_num_leaves))
-            sorted_nodes = np.array(g.nodes())[ind]
-            for node in sorted_nodes:
-                leaves = g.node[node]['leaves']
-                if len(leaves) > 0 and len(leaves) <= max_leaves:
-                    selected_groups.append((node, leaves))
-                    for node_prime in np.array(g.nodes()):
-                        if node_prime == node:
-                            continue
-                        g.node[node_prime]['leaves'] -= leaves
-                    g.node[node]['leaves'] = set([])
-                    break
-        assert(sum(len(x[-1]) for x in selected_groups) == 1000)
+        selected_groups = taxonomy.select_groups_by_size(max_leaves)
+        assert(sum(len(x[-1]) for x in selected_groups) ==
+               taxonomy.leaves.shape[0])
         for group in selected_groups:
             node, leaves = group
-            print(node, g.node[node]['word'], len(leaves))
+            word = None
+            if taxonomy.words is not None:
+                word = taxonomy.words[taxonomy.index[node]]
+            print(node, word, len(leaves))
         return selected_groups
 
     @staticmethod
@@ -312,6 +308,9 @@ class ImageNet(object):
         filename : string, optional
             If given, write plot out to filename.
         """
+        import networkx as nx
+        import matplotlib.pyplot as plt
+
         fig = plt.figure(figsize=(12, 12))
 
         gray = (0.85, 0.85, 0.85, 1)
@@ -4,7 +4,7 @@ import tc
 
 class Random(tc.DataSource):
     """
-    Generates random data, for quick testing.
+    Generates random data, for quick testing and benchmarking.
     Random costs.
 
     Parameters
@@ -14,12 +14,31 @@ class Random(tc.DataSource):
     labels: list of string
     N: int
         Number of instances to generate.
+    N_test: int, optional
+        Number of test instances to generate. Defaults to N.
+    budget_fraction: float, optional [1.]
+        max_budget as a fraction of the total cost of all actions.
+    dirname: string, optional
+        Existing directory to save self to.
     """
-    def __init__(self, actions, action_dims, labels, N):
+    def __init__(self, actions, action_dims, labels, N, N_test=None,
+                 budget_fraction=1., dirname=None):
+        self.dirname = dirname
         self.actions = actions
         self.action_dims = action_dims
         self.action_costs = np.random.rand(len(self.actions))
+        self.max_budget = budget_fraction * float(self.action_costs.sum())
         self.labels = labels
-        self.X = np.random.rand(N, action_dims.sum())
+        self.N = N
+        self.N_test = N if N_test is None else N_test
+        self.X = np.random.rand(N, sum(action_dims))
         self.y = np.random.randint(len(self.labels), size=N)
+        self.X_test = np.random.rand(self.N_test, sum(action_dims))
+        self.y_test = np.random.randint(len(self.labels), size=self.N_test)
         self.validate()
+
+    @property
+    def name(self):
+        return 'random_A{}_D{}_K{}_N{}_Nt{}_{}'.format(
+            len(self.actions), sum(self.action_dims), len(self.labels),
+            self.N, self.N_test, self.max_budget)
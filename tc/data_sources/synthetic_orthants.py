@@ -1,7 +1,5 @@
 import numpy as np
 import itertools
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import h5py
 import tc
 
@@ -126,6 +124,10 @@ class SyntheticOrthants(tc.DataSource):
         """
         Plot the distribution of points in the space, colored by label.
         """
+        import matplotlib.pyplot as plt
+        # Registers the 3d projection.
+        from mpl_toolkits.mplot3d import Axes3D
+
         D = self.D
         coord = self.coordinates
         y = self.y
@@ -166,6 +168,8 @@ class SyntheticOrthants(tc.DataSource):
         """
         Plot a random sample of the data matrix.
         """
+        import matplotlib.pyplot as plt
+
         D = self.D
         if D > 4:
             print("Feature matrix is too high-dimensional to display.")
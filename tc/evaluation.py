@@ -1,6 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas
 import sklearn
 import sklearn.metrics
 from scipy.interpolate import interp1d
@@ -63,27 +61,37 @@ def evaluate_performance(confidences, labels, loss_func, cumulative_costs,
         np.savez(filename, interp_points=interp_points, means=means, stds=stds)
 
     if plot_figure:
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import colorConverter
+
         # also plot points aggregated in a different way
         scores = np.hstack(scores)
         cumulative_costs = np.hstack(cumulative_costs)
-        series = pandas.Series(scores, cumulative_costs).sort_index()
-        g = series.groupby(series.index)
+        unique_costs, cost_inds = np.unique(
+            cumulative_costs, return_inverse=True)
+        counts = np.bincount(cost_inds).astype('f')
+        mean = np.bincount(cost_inds, weights=scores) / counts
 
         # filter out points with little data
         count_fraction_threshold = 0.1
-        counts = g.count().astype('f')
         count_fractions = counts / counts[0]
         ind = count_fractions > count_fraction_threshold
         count_fractions = count_fractions[ind]
-        mean = g.mean()[ind]
-        ind = mean.index.values
+        mean = mean[ind]
+        ind = unique_costs[ind]
+
+        # Instead of a faint marker per point, one marker per bin of
+        # points, as opaque as 0.01 alpha markers stacked that many deep.
+        x, y, bin_counts = density_bins(cumulative_costs, scores)
+        colors = np.tile(colorConverter.to_rgba('b'), (len(x), 1))
+        colors[:, 3] = 1 - .99 ** bin_counts
 
         fig = plt.figure()
         ax = fig.add_subplot(111)
-        ax.plot(cumulative_costs, scores, 'o', alpha=0.01)
+        ax.scatter(x, y, 36, colors, 'o', linewidths=0)
         ax.plot(interp_points, means, '-k',
                 label='auc/final: {:.3f}/{:.3f}'.format(auc, means[-1]))
-        ax.scatter(ind, mean.values, 150 * count_fractions, 'r')
+        ax.scatter(ind, mean, 150 * count_fractions, 'r')
         try:
             ax.fill_between(
                 interp_points, means - stds, means + stds, alpha=0.1)
@@ -219,6 +227,8 @@ def plot_trajectories(
     rewards: list of ndarrays of float
 
     ds: tc.DataSource
+        Only the actions property is used, so a
+        tc.result_store.EpisodeStore works as well.
 
     N: int, optional
         Number of (randomly sampled w/o replacement) trajectories to plot.
@@ -237,6 +247,8 @@ def plot_trajectories(
     -------
     fig: matplotlib figure
     """
+    import matplotlib.pyplot as plt
+
     plt.rc('font', **{'family': 'serif', 'serif': ['Computer Modern Roman']})
     plt.rc('text', usetex=True)
 
@@ -245,25 +257,29 @@ def plot_trajectories(
     plt.rc('ytick', labelsize=fontsize)
     plt.rc('legend', fontsize=fontsize)
 
+    from matplotlib.collections import LineCollection
+
     fig = plt.figure(figsize=figsize)
 
     ax = fig.add_subplot(111)
-    num_actions = []
-    sc = None
-    for i in np.random.permutation(len(actions))[:N]:
-        # don't plot the last action, as it is not actually taken
-        a = actions[i].shape[0] - 1
-        num_actions.append(a)
-        if a > 0:
-            ax.plot(range(a), actions[i][:-1], '-', color='gray', alpha=0.04)
-            sc = ax.scatter(
-                range(a), actions[i][:-1],
-                c=rewards[i][:-1], cmap=plt.cm.RdBu_r, vmin=-1, vmax=1,
-                s=33, alpha=0.4, edgecolor='gray', linewidths=.1,
-            )
+    inds = np.random.permutation(len(actions))[:N]
+    # don't plot the last action, as it is not actually taken
+    num_actions, x, y, c = trajectory_points(
+        [actions[i] for i in inds], [rewards[i] for i in inds])
 
+    # All trajectories are drawn as one collection of lines and one of
+    # points, so drawing time does not grow with the number of artists.
     max_num_actions = 0
-    if sc is not None:
+    if x.shape[0] > 0:
+        points = np.column_stack((x, y))
+        ends = np.cumsum(num_actions)
+        segments = [s for s in np.split(points, ends[:-1]) if len(s) > 0]
+        ax.add_collection(LineCollection(
+            segments, colors='gray', alpha=0.04, linestyles='-'))
+        ax.scatter(
+            x, y, c=c, cmap=plt.cm.RdBu_r, vmin=-1, vmax=1,
+            s=33, alpha=0.4, edgecolor='gray', linewidths=.1,
+        )
         max_num_actions = int(np.percentile(num_actions, 80))
 
     ax.set_xlim([0, max_num_actions])
@@ -290,6 +306,63 @@ def plot_trajectories(
     plt.rc('text', usetex=False)
 
 
+def trajectory_points(actions, rewards):
+    """
+    Flatten trajectories, without their last action, into points.
+
+    Parameters
+    ----------
+    actions: list of ndarrays of int
+    rewards: list of ndarrays of float
+
+    Returns
+    -------
+    num_actions: (N,) ndarray of int
+        Number of points of each trajectory.
+    x: (M,) ndarray of int
+        Position of each point in its trajectory.
+    y: (M,) ndarray of int
+        Action of each point.
+    c: (M,) ndarray of float
+        Reward of each point.
+    """
+    num_actions = np.array(
+        [max(a.shape[0] - 1, 0) for a in actions], dtype='int')
+    if num_actions.sum() == 0:
+        empty = np.zeros(0, dtype='int')
+        return num_actions, empty, empty, np.zeros(0)
+    y = np.concatenate([a[:-1] for a in actions])
+    c = np.concatenate([r[:-1] for r in rewards]).astype('float')
+    starts = np.cumsum(num_actions) - num_actions
+    x = np.arange(y.shape[0]) - np.repeat(starts, num_actions)
+    return num_actions, x, y, c
+
+
+def density_bins(costs, scores, num_bins=50):
+    """
+    Bin (cost, score) points: scores into num_bins equal bins in [0, 1],
+    costs by their distinct values.
+
+    Returns
+    -------
+    x: (B,) ndarray of float
+        Cost of each non-empty bin.
+    y: (B,) ndarray of float
+        Center score of each non-empty bin.
+    counts: (B,) ndarray of int
+    """
+    unique_costs, cost_inds = np.unique(costs, return_inverse=True)
+    score_inds = np.clip(
+        (np.asarray(scores) * num_bins).astype('int'), 0, num_bins - 1)
+    counts = np.bincount(
+        cost_inds * num_bins + score_inds,
+        minlength=unique_costs.shape[0] * num_bins)
+    nonzero = np.flatnonzero(counts)
+    x = unique_costs[nonzero // num_bins]
+    y = (nonzero % num_bins + .5) / num_bins
+    return x, y, counts[nonzero]
+
+
 def zero_one_loss(confidences, labels):
     """
     Return the 0-1 loss of the given confidences: for each row, the most
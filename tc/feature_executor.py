@@ -0,0 +1,282 @@
+"""
+Parallel feature execution for timely classification, for deployments where
+actions are real feature extractors taking seconds to run (see the action
+costs of tc.data_sources.Scene15).
+
+The action chosen by the policy is run in a worker pool. While it runs, idle
+workers speculatively compute the next-most-valuable untaken actions, as
+ranked by the policy on the current state, so that their results are ready
+if the policy selects them next. When, after an action, the policy no
+longer ranks a speculative action among the next ones, it is abandoned.
+"""
+import time
+import Queue
+import threading
+import traceback
+import numpy as np
+from multiprocessing.pool import ThreadPool, Pool
+
+
+def _run_extractor(extractor, action_ind):
+    """
+    Run extractor in a worker, returning errors instead of raising them,
+    since apply_async callbacks are not called on errors.
+    """
+    try:
+        return action_ind, extractor(action_ind), None
+    except Exception:
+        return action_ind, None, traceback.format_exc()
+
+
+def rank_untaken_actions(policy, state, state_vector, costs, remaining,
+                         num=None):
+    """
+    Return up to num untaken actions that fit in the remaining budget, in the
+    policy's order of preference: its choice, then its choice were that
+    action taken, and so on.
+
+    Parameters
+    ----------
+    policy: tc.Policy
+        Must implement select_untaken_actions().
+    state: tc.TimelyState
+    state_vector: (S,) ndarray of float
+    costs: (A,) ndarray of float
+    remaining: float
+    num: int, optional
+        By default, all untaken actions that fit.
+    """
+    vector = state_vector.copy()
+    mask = state.slice_array(vector, 'mask')
+    mask[costs > remaining] = 0
+    if num is None:
+        num = state.F
+    ranked = []
+    while len(ranked) < num:
+        action_ind = policy.select_untaken_actions(np.atleast_2d(vector))[0]
+        if action_ind == -1:
+            break
+        ranked.append(action_ind)
+        mask[action_ind] = 0
+    return ranked
+
+
+class FeatureExecutor(object):
+    """
+    Run feature extractors in a pool, with policy lookahead.
+
+    Python threads and pool processes cannot be interrupted, so speculative
+    work is cancelled by abandoning it: results of abandoned tasks are
+    discarded when they arrive, and no new speculative task is started
+    while all workers are busy, including with abandoned tasks, of this or
+    earlier episodes. After each action, speculative tasks are abandoned
+    once the policy no longer ranks their action among the next num_workers
+    (see rank_untaken_actions()), or it no longer fits in the remaining
+    budget, and all outstanding tasks are abandoned when an episode ends.
+    Extractor errors are raised only once the policy selects their action.
+
+    Parameters
+    ----------
+    num_workers: int, optional [2]
+    use_processes: bool, optional [False]
+        If True, use a process pool: the extractor must then be picklable.
+    speculate: bool, optional [True]
+        If False, actions are only run once selected, one at a time.
+
+    Properties (of the last episode)
+    --------------------------------
+    num_speculative: int
+        Number of speculatively started actions.
+    num_hits: int
+        Number of selected actions that had been speculatively started.
+    num_wasted: int
+        Number of speculative actions whose results were not used.
+
+    Properties
+    ----------
+    num_running: int
+        Number of tasks submitted to the pool and not finished, abandoned or
+        not.
+    """
+    def __init__(self, num_workers=2, use_processes=False, speculate=True):
+        self.num_workers = num_workers
+        self.speculate = speculate
+        if use_processes:
+            self.pool = Pool(num_workers)
+        else:
+            self.pool = ThreadPool(num_workers)
+        self.num_speculative = self.num_hits = self.num_wasted = 0
+        self.num_running = 0
+        self._lock = threading.Condition()
+
+    def wait(self, timeout=None):
+        """
+        Block until no task is running, abandoned tasks included, or until
+        timeout seconds have passed. Return True if no task is running.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while self.num_running > 0:
+                if deadline is None:
+                    self._lock.wait()
+                elif time.time() >= deadline:
+                    break
+                else:
+                    self._lock.wait(deadline - time.time())
+            return self.num_running == 0
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def run(self, extractor, ds, policy, predict_proba, state, budget=None):
+        """
+        Generator running sequential classification on a single instance.
+
+        Parameters
+        ----------
+        extractor: callable
+            Called as extractor(action_ind) in a worker, returns the (D_a,)
+            observations of the action.
+        ds: tc.DataSource
+            Only action_costs and max_budget are used.
+        policy: tc.Policy
+            Must implement select_action() and select_untaken_actions().
+        predict_proba: callable
+            Maps (N, S) states to (N, K) confidences.
+        state: tc.TimelyState
+        budget: float, optional
+            Defaults to ds.max_budget.
+
+        Yields
+        ------
+        action_ind: int or None
+            None for the initial, empty state.
+        cumulative_cost: float
+            Nominal cost, as in training.
+        wall_clock: float
+            Seconds elapsed since the start of the episode.
+        confidences: (K,) ndarray of float
+        """
+        if budget is None:
+            budget = ds.max_budget
+        costs = ds.action_costs
+        done = Queue.Queue()
+        in_flight = set()
+        abandoned = set()
+        results = {}
+        self.num_speculative = self.num_hits = self.num_wasted = 0
+
+        def finish(result):
+            with self._lock:
+                self.num_running -= 1
+                self._lock.notify_all()
+            done.put(result)
+
+        def submit(action_ind):
+            in_flight.add(action_ind)
+            with self._lock:
+                self.num_running += 1
+            self.pool.apply_async(
+                _run_extractor, (extractor, action_ind), callback=finish)
+
+        def collect():
+            try:
+                action_ind, observations, error = done.get(timeout=0.1)
+            except Queue.Empty:
+                return
+            in_flight.discard(action_ind)
+            if action_ind in abandoned:
+                abandoned.discard(action_ind)
+                return
+            # A speculative action may fail without ever being selected.
+            results[action_ind] = (observations, error)
+
+        def abandon(action_ind):
+            self.num_wasted += 1
+            if action_ind in results:
+                del results[action_ind]
+            elif action_ind in in_flight:
+                abandoned.add(action_ind)
+
+        def start_speculative(state_vector, chosen, remaining):
+            idle = self.num_workers - self.num_running
+            if not self.speculate or idle <= 0:
+                return
+            # Rank as if the chosen action had been taken.
+            vector = state_vector.copy()
+            state.slice_array(vector, 'mask')[chosen] = 0
+            for action_ind in rank_untaken_actions(
+                    policy, state, vector, costs, remaining):
+                if idle <= 0:
+                    break
+                if (action_ind == chosen or action_ind in in_flight or
+                        action_ind in results):
+                    continue
+                submit(action_ind)
+                self.num_speculative += 1
+                idle -= 1
+
+        t = time.time()
+        instance = np.zeros(state.D)
+        action_inds = []
+        cumulative_cost = 0
+        state_vector = state.get_initial_state()
+        yield (None, cumulative_cost, time.time() - t,
+               predict_proba(np.atleast_2d(state_vector))[0])
+
+        try:
+            while True:
+                action_ind = policy.select_action(state_vector)
+                if action_ind == -1 or \
+                        cumulative_cost + costs[action_ind] > budget:
+                    break
+
+                if action_ind in abandoned:
+                    # The policy came back to an abandoned action that is
+                    # still running: use its result after all.
+                    abandoned.discard(action_ind)
+                    self.num_wasted -= 1
+                    self.num_hits += 1
+                elif action_ind in results or action_ind in in_flight:
+                    self.num_hits += 1
+                else:
+                    submit(action_ind)
+                remaining = budget - cumulative_cost - costs[action_ind]
+                start_speculative(state_vector, action_ind, remaining)
+
+                while action_ind not in results:
+                    collect()
+
+                observations, error = results.pop(action_ind)
+                if error is not None:
+                    raise Exception(
+                        'Extractor failed on action {}:\n{}'.format(
+                            action_ind, error))
+                instance[slice(*state.feature_bounds[action_ind])] = \
+                    observations
+                action_inds.append(action_ind)
+                cumulative_cost += costs[action_ind]
+                norm_cost = float(cumulative_cost) / ds.max_budget
+                state_vector = state.get_state(
+                    instance, action_inds, norm_cost)
+
+                # Abandon speculative work the policy no longer ranks among
+                # the next actions, or that no longer fits the budget.
+                remaining = budget - cumulative_cost
+                if len(in_flight - abandoned) > 0:
+                    ranked = rank_untaken_actions(
+                        policy, state, state_vector, costs, remaining,
+                        self.num_workers)
+                    for other in in_flight - abandoned:
+                        if other not in ranked:
+                            abandon(other)
+                for other in results.keys():
+                    if costs[other] > remaining:
+                        abandon(other)
+
+                yield (action_ind, cumulative_cost, time.time() - t,
+                       predict_proba(np.atleast_2d(state_vector))[0])
+        finally:
+            for other in list(in_flight - abandoned) + results.keys():
+                abandon(other)
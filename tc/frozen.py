@@ -0,0 +1,399 @@
+"""
+Compact, versioned export of everything a trained TimelyClassifier needs for
+inference, and nothing else: no data source, no report, no sklearn estimators.
+
+The file is a single flat container: a short JSON header followed by raw,
+aligned array data. Arrays are memory-mapped on load, so loading a model
+takes milliseconds regardless of the size of the training data.
+
+Layout
+------
+    'TCFROZEN' | uint32 version | uint32 header length | JSON header | arrays
+
+The JSON header holds scalar settings under 'meta' and, for each array, its
+dtype, shape and byte offset relative to the (aligned) start of array data.
+"""
+import os
+import json
+import struct
+import numpy as np
+from numpy.random import rand, randint
+from tc.timely_state import TimelyState
+from tc.anytime import anytime_classify_instance
+
+MAGIC = 'TCFROZEN'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+
+def _aligned(offset):
+    return offset + (-offset % ALIGN)
+
+
+def write(filename, meta, arrays):
+    """
+    Write meta dict and dict of ndarrays to filename, atomically.
+
+    Parameters
+    ----------
+    filename: string
+    meta: dict
+        JSON-serializable settings.
+    arrays: dict of string to ndarray
+        Arrays must not have object dtype.
+    """
+    layout = {}
+    offset = 0
+    contiguous = {}
+    for name in sorted(arrays.keys()):
+        arr = np.ascontiguousarray(arrays[name])
+        assert(arr.dtype != object)
+        offset = _aligned(offset)
+        layout[name] = {
+            'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        contiguous[name] = arr
+        offset += arr.nbytes
+    header = json.dumps({'meta': meta, 'arrays': layout})
+
+    prefix_len = len(MAGIC) + 8 + len(header)
+    data_start = _aligned(prefix_len)
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write('\0' * (data_start - prefix_len))
+        for name in sorted(contiguous.keys()):
+            pos = data_start + layout[name]['offset']
+            f.write('\0' * (pos - f.tell()))
+            f.write(contiguous[name].tobytes())
+    os.rename(tmp_filename, filename)
+    return filename
+
+
+def read(filename, mmap=True):
+    """
+    Read file written by write().
+
+    Returns
+    -------
+    meta: dict
+    arrays: dict of string to ndarray
+        Read-only memory maps if mmap, otherwise in-memory copies.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a frozen model file.'.format(filename))
+        version, header_len = struct.unpack('<II', f.read(8))
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported frozen model version {} (expected {}).'.format(
+                    version, FORMAT_VERSION))
+        header = json.loads(f.read(header_len))
+    data_start = _aligned(len(MAGIC) + 8 + header_len)
+
+    arrays = {}
+    for name, info in header['arrays'].iteritems():
+        dtype = np.dtype(str(info['dtype']))
+        shape = tuple(info['shape'])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+            continue
+        arr = np.memmap(filename, dtype=dtype, mode='r',
+                        offset=data_start + info['offset'], shape=shape)
+        arrays[name] = arr if mmap else np.array(arr)
+    return header['meta'], arrays
+
+
+def export(ticl, filename):
+    """
+    Export the inference parameters of a fit tc.TimelyClassifier.
+
+    Supported policies are the linear policies and RandomPolicy; supported
+    classifiers are StateClassifier and StateClassifierImagenet.
+
+    Parameters
+    ----------
+    ticl: tc.TimelyClassifier
+    filename: string
+
+    Returns
+    -------
+    filename: string
+    """
+    import tc
+    ds = ticl.ds
+    meta = {
+        'name': ticl.name,
+        'data_source': ds.name,
+        'actions': [str(a) for a in ds.actions],
+        'action_dims': [int(d) for d in ds.action_dims],
+        'labels': [str(l) for l in ds.labels],
+        'max_budget': float(ds.max_budget),
+        'has_been_fit': bool(ticl.has_been_fit),
+    }
+    arrays = {'action_costs': np.asarray(ds.action_costs, dtype='float64')}
+
+    # Policy
+    policy = ticl.policy
+    untaken_types = (
+        tc.policy.LinearUntakenPolicy, tc.policy.StaticLinearUntakenPolicy,
+        tc.policy.RandomPolicy)
+    policy_meta = {
+        'untaken': isinstance(policy, untaken_types),
+        'static': isinstance(policy, tc.policy.StaticLinearPolicy)
+    }
+    if isinstance(policy, tc.policy.LinearPolicy):
+        P = len(ds.actions) + 1 if policy_meta['static'] else ticl.state.S
+        weights = np.zeros((len(ds.actions), P))
+        trained = np.zeros(len(ds.actions), dtype=bool)
+        if getattr(policy, 'has_been_fit', False):
+            for i, regr in enumerate(policy.predictors):
+                if regr is not None:
+                    weights[i] = regr.coef_
+                    trained[i] = True
+        arrays['policy_weights'] = weights
+        arrays['policy_trained'] = trained
+        policy_meta['method'] = 'linear'
+    elif isinstance(policy, tc.policy.RandomPolicy):
+        policy_meta['method'] = 'random'
+    else:
+        raise Exception('Cannot export policy {}.'.format(policy))
+    meta['policy'] = policy_meta
+
+    # Classifier
+    clf = ticl.classifier
+    if isinstance(clf, tc.StateClassifierImagenet):
+        meta['classifier'] = {'method': 'imagenet'}
+    elif isinstance(clf, tc.StateClassifier):
+        if not clf.has_been_fit:
+            raise Exception('Cannot export a classifier that is not fit.')
+        clfs = [clf.clf] if clf.num_clf == 1 else clf.clfs
+        arrays['clf_coef'] = np.array([c.coef_ for c in clfs])
+        arrays['clf_intercept'] = np.array(
+            [np.atleast_1d(c.intercept_) * np.ones(c.coef_.shape[0])
+             for c in clfs])
+        if clf.num_clf != 1:
+            K = clf.num_clf if clf.num_clf >= 1 else clf.md.umasks.shape[0]
+            arrays['clf_umasks'] = clf.md.umasks[:K]
+        meta['classifier'] = {
+            'method': 'logreg', 'num_labels': int(clf.num_labels)}
+    else:
+        raise Exception('Cannot export classifier {}.'.format(clf))
+
+    # Imputer
+    imputer = ticl.imputer
+    meta['imputer'] = ticl.impute_method
+    if imputer is not None:
+        arrays['imputer_mean'] = imputer.mean
+        if isinstance(imputer, tc.GaussianImputer):
+            arrays['imputer_cov'] = imputer.S
+
+    return write(filename, meta, arrays)
+
+
+class FrozenLinearPolicy(object):
+    """
+    Inference-only counterpart of tc.policy.LinearPolicy and its variants.
+    Untrained actions get random scores, as in LinearPolicy.
+    """
+    def __init__(self, state, weights, trained, static, untaken):
+        self.state = state
+        self.F = state.F
+        self.weights = weights
+        self.trained = trained
+        self.static = static
+        self.untaken = untaken
+
+    def predict(self, states_arr):
+        if self.static:
+            states_arr = self.state.get_mask(states_arr, with_bias=True)
+        scores = np.dot(states_arr, self.weights.T)
+        untrained = np.flatnonzero(~self.trained)
+        if len(untrained) > 0:
+            if scores.ndim == 1:
+                scores[untrained] = rand(len(untrained))
+            else:
+                scores[:, untrained] = rand(scores.shape[0], len(untrained))
+        return scores
+
+    def select_action(self, state_vector, epsilon=0):
+        if self.untaken:
+            untaken_inds = np.flatnonzero(
+                self.state.slice_array(state_vector, 'mask'))
+            if len(untaken_inds) == 0:
+                return -1
+            if epsilon == 0 or rand() > epsilon:
+                return untaken_inds[
+                    self.predict(state_vector)[untaken_inds].argmax()]
+            return untaken_inds[randint(len(untaken_inds))]
+        if epsilon == 0 or rand() > epsilon:
+            return self.predict(state_vector).argmax()
+        return randint(self.F)
+
+    def select_actions(self, states_arr):
+        """
+        Batched select_action() with epsilon=0.
+        """
+        scores = np.atleast_2d(self.predict(states_arr))
+        if not self.untaken:
+            return scores.argmax(1)
+        return self.select_untaken_actions(states_arr, scores)
+
+    def select_untaken_actions(self, states_arr, scores=None):
+        """
+        Batched select_action() with epsilon=0, among untaken actions.
+        """
+        if scores is None:
+            scores = np.atleast_2d(self.predict(states_arr))
+        masks = np.atleast_2d(
+            self.state.slice_array(states_arr, 'mask')).astype(bool)
+        action_inds = np.where(masks, scores, -np.inf).argmax(1)
+        action_inds[~masks.any(1)] = -1
+        return action_inds
+
+
+class FrozenRandomPolicy(FrozenLinearPolicy):
+    """
+    Inference-only counterpart of tc.policy.RandomPolicy.
+    """
+    def __init__(self, state):
+        super(FrozenRandomPolicy, self).__init__(
+            state, np.zeros((state.F, state.S)), np.zeros(state.F, dtype=bool),
+            False, True)
+
+
+class FrozenLogisticClassifier(object):
+    """
+    Inference-only counterpart of tc.StateClassifier, computing one-vs-rest
+    logistic probabilities as sklearn's LogisticRegression does.
+    """
+    def __init__(self, state, coef, intercept, umasks=None):
+        self.state = state
+        self.coef = coef
+        self.intercept = intercept
+        self.umasks = umasks
+
+    def predict(self, states):
+        return self.predict_proba(states).argmax(1)
+
+    @staticmethod
+    def _proba(X, coef, intercept):
+        prob = 1. / (1 + np.exp(-(np.dot(X, coef.T) + intercept)))
+        if coef.shape[0] == 1:
+            return np.hstack((1 - prob, prob))
+        return prob / prob.sum(1)[:, np.newaxis]
+
+    def predict_proba(self, states):
+        states = np.atleast_2d(states)
+        X = np.hstack((
+            self.state.slice_array(states, 'observations'),
+            self.state.slice_array(states, 'bias')
+        ))
+        if self.umasks is None:
+            return self._proba(X, self.coef[0], self.intercept[0])
+
+        mask = self.state.get_mask(states).astype(bool)
+        mismatches = (mask[:, np.newaxis, :] != self.umasks).sum(2)
+        cluster_ind = mismatches.argmin(1)
+        proba = np.empty((states.shape[0], self.coef.shape[1]))
+        for ind in np.unique(cluster_ind):
+            rows = cluster_ind == ind
+            proba[rows] = self._proba(
+                X[rows], self.coef[ind], self.intercept[ind])
+        return proba
+
+
+class FrozenImagenetClassifier(object):
+    """
+    Inference-only counterpart of tc.StateClassifierImagenet.
+    """
+    def __init__(self, state):
+        self.state = state
+
+    def predict(self, states):
+        return self.predict_proba(states).argmax(1)
+
+    def predict_proba(self, states):
+        return self.state.slice_array(np.atleast_2d(states), 'observations')
+
+
+class FrozenTimelyClassifier(object):
+    """
+    A loaded frozen model.
+
+    Exposes the same action_costs, max_budget, actions and action_dims
+    properties as a tc.DataSource, so that it can be passed wherever
+    classify_instance() expects a data source.
+
+    Parameters
+    ----------
+    filename: string
+    mmap: bool, optional [True]
+    """
+    def __init__(self, filename, mmap=True):
+        meta, arrays = read(filename, mmap)
+        self.filename = filename
+        self.meta = meta
+        self.name = meta['name']
+        self.data_source_name = meta['data_source']
+        self.actions = meta['actions']
+        self.action_dims = meta['action_dims']
+        self.labels = meta['labels']
+        self.max_budget = meta['max_budget']
+        self.has_been_fit = meta['has_been_fit']
+        self.action_costs = arrays['action_costs']
+        self.state = TimelyState(self.action_dims)
+
+        if meta['policy']['method'] == 'linear':
+            self.policy = FrozenLinearPolicy(
+                self.state, arrays['policy_weights'], arrays['policy_trained'],
+                meta['policy']['static'], meta['policy']['untaken'])
+        else:
+            self.policy = FrozenRandomPolicy(self.state)
+
+        if meta['classifier']['method'] == 'imagenet':
+            self.classifier = FrozenImagenetClassifier(self.state)
+        else:
+            self.classifier = FrozenLogisticClassifier(
+                self.state, arrays['clf_coef'], arrays['clf_intercept'],
+                arrays.get('clf_umasks'))
+
+        self.imputer = None
+        if meta['imputer'] in ['mean', 'gaussian']:
+            from tc.imputer import MeanImputer, GaussianImputer
+            if meta['imputer'] == 'mean':
+                self.imputer = MeanImputer(self.action_dims)
+            else:
+                self.imputer = GaussianImputer(self.action_dims)
+                self.imputer.S = arrays['imputer_cov']
+            self.imputer.mean = arrays['imputer_mean']
+            self.imputer.has_been_fit = True
+
+    def __repr__(self):
+        return 'FrozenTimelyClassifier: {}'.format(self.name)
+
+    def predict_proba(self, states):
+        """
+        Impute unobserved values, if an imputer was used in training, and
+        return multi-class confidences for the given states.
+        """
+        if self.imputer is not None:
+            states = self.imputer.impute(states)
+        return self.classifier.predict_proba(states)
+
+    def predict_anytime(self, instance_or_feature_provider, budget=None,
+                        deadline=None):
+        """
+        As tc.TimelyClassifier.predict_anytime().
+        """
+        return anytime_classify_instance(
+            instance_or_feature_provider, self, self.policy,
+            self.predict_proba, self.state, budget, deadline)
+
+
+def load(filename, mmap=True):
+    """
+    Load a frozen model written by export().
+    """
+    return FrozenTimelyClassifier(filename, mmap)
@@ -167,6 +167,7 @@ class GaussianNB(BaseEstimator, ClassifierMixin):
 
 if __name__ == '__main__':
     import sklearn.datasets
+    import sklearn.preprocessing
     data = sklearn.datasets.load_iris()
     X = data['data']
     X = sklearn.preprocessing.StandardScaler().fit_transform(X)
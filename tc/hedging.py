@@ -1,43 +1,151 @@
 import numpy as np
+import scipy.sparse
 import scipy.stats
-import matplotlib.pyplot as plt
 import time
-import networkx as nx
+import multiprocessing
+import tc
+
+# Bound on the number of elements of the (lambdas, samples, nodes) score
+# arrays that darts_predict() builds at once.
+max_score_elements = 2 ** 24
+
+# Number of rows of leaf probabilities corrupted at once by corrupt_chunks().
+corrupt_chunk_size = 1024
+
+# Read-only data of the budget sweep of iterative_missing_data(), set before
+# the worker pool is started, so that forked workers share it instead of
+# receiving pickled copies.
+_sweep_data = {}
+
+
+def sparse_hierarchy(graph):
+    """
+    Return the sparse representation of the hierarchy of the graph,
+    computing it on first use and storing it in graph['sparse'].
+
+    Parameters
+    ----------
+    graph : dict
+        With 'leaf_membership', a dense or sparse (k, m) matrix with 1 where
+        the node is the leaf or one of its ancestors, and 'heights'. Graphs
+        of a tc.taxonomy.Taxonomy provide the representation precompiled.
+
+    Returns
+    -------
+    hierarchy : dict
+        'leaf_membership': (k, m) scipy.sparse.csr_matrix of float.
+        'ancestor_bits': (k, ceil(m / 8)) ndarray of uint8
+            For each leaf, bit j of np.unpackbits(row) is set if node j is
+            the leaf or one of its ancestors.
+        'num_heights': int
+    """
+    if 'sparse' in graph:
+        return graph['sparse']
+    if 'taxonomy' in graph:
+        leaf_membership = graph['taxonomy'].leaf_membership
+        ancestor_bits = graph['taxonomy'].ancestor_bits
+    else:
+        leaf_membership = scipy.sparse.csr_matrix(
+            graph['leaf_membership'], dtype='float')
+        leaf_membership.eliminate_zeros()
+        ancestor_bits = tc.taxonomy.pack_rows(
+            leaf_membership.indptr, leaf_membership.indices,
+            leaf_membership.shape[1])
+    graph['sparse'] = {
+        'leaf_membership': leaf_membership,
+        'ancestor_bits': ancestor_bits,
+        'num_heights': len(np.unique(graph['heights']))}
+    return graph['sparse']
+
+
+def node_posteriors(leaf_probs, graph):
+    """
+    Return the (n, m) posterior probabilities of all nodes, the sums of the
+    (n, k) leaf_probs under each node.
+    """
+    leaf_membership = sparse_hierarchy(graph)['leaf_membership']
+    return np.ascontiguousarray(leaf_membership.T.dot(leaf_probs.T).T)
+
+
+def is_correct(preds, labels, graph):
+    """
+    Return boolean array, True where the predicted node is the labeled leaf
+    or one of its ancestors.
+
+    Parameters
+    ----------
+    preds : ndarray of int
+        Predicted nodes.
+    labels : ndarray of int
+        Labeled leaves, broadcastable to preds.
+    graph : dict
+    """
+    ancestor_bits = sparse_hierarchy(graph)['ancestor_bits']
+    bits = ancestor_bits[labels, preds >> 3]
+    return (bits >> (7 - (preds & 7)).astype('uint8')) & 1 > 0
+
+
+def eval_rewards(preds, labels, rewards, graph, fast=False):
+    """
+    Evaluate several sets of predictions of the same samples.
+
+    Parameters
+    ----------
+    preds : (L, n) ndarray of int
+    labels : (n,) ndarray of int
+    rewards : (m,) ndarray of float
+    fast : boolean, optional
+        If True, then do not compute height_portions and height_accs; return
+        None for them.
+
+    Returns
+    -------
+    rewards, accs : (L,) ndarray of float
+    height_portions, height_accs : (num_heights, L) ndarray of float
+    """
+    L, n = preds.shape
+    correct = is_correct(preds, labels[np.newaxis, :], graph)
+    accs = correct.sum(1) / float(n)
+    reward = (rewards[preds] * correct).sum(1) / float(n)
+
+    height_accs = height_portions = None
+    if not fast:
+        # Count predictions of each set by height, with a bincount over
+        # (set, height) pairs.
+        num_heights = sparse_hierarchy(graph)['num_heights']
+        inds = (graph['heights'][preds] +
+                num_heights * np.arange(L)[:, np.newaxis]).ravel()
+        height_counts = np.bincount(
+            inds, minlength=L * num_heights).reshape(L, num_heights).T
+        height_goods = np.bincount(
+            inds, correct.ravel(), minlength=L * num_heights
+        ).reshape(L, num_heights).T
+        height_counts = height_counts.astype('float')
+        height_accs = height_goods / height_counts
+        height_portions = height_counts / n
+
+    return reward, accs, height_portions, height_accs
 
 
 def eval_reward(preds, labels, rewards, graph, fast=False):
     """
     Parameters
     ----------
+    preds : (n,) ndarray of int
+    labels : (n,) ndarray of int
+    rewards : (m,) ndarray of float
     fast : boolean, optional
         If True, then do not compute height_portion and height_acc; return None
         for them.
+
+    See eval_rewards().
     """
-    n = preds.shape[0]
-    m = len(graph['nodes'])
-    heights = graph['heights'] + 1  # to make the height stats calculations work
-    k = (heights == 1).sum()
-
-    pred_vec = np.zeros((n, m))
-    pred_vec[np.arange(n), preds] = 1
-    gt_vec = np.zeros((n, k))
-    gt_vec[np.arange(n), labels] = 1
-    gt_vec_full = np.dot(gt_vec, graph['leaf_membership'])
-
-    correct_vec = gt_vec_full * pred_vec
-    acc = np.sum(correct_vec) / n
-    reward = np.sum(correct_vec * rewards) / n
-
-    height_acc = height_portion = None
+    reward, acc, height_portion, height_acc = eval_rewards(
+        preds[np.newaxis, :], labels, rewards, graph, fast)
     if not fast:
-        height_pred_vec = pred_vec * heights
-        height_counts = 1. * np.histogram(height_pred_vec, 1 + np.arange(np.max(heights) + 1))[0]
-        height_correct_vec = correct_vec * heights
-        height_goods = 1. * np.histogram(height_correct_vec, 1 + np.arange(np.max(heights) + 1))[0]
-        height_acc = height_goods / height_counts
-        height_portion = height_counts / n
-
-    return reward, acc, height_portion, height_acc
+        height_portion = height_portion[:, 0]
+        height_acc = height_acc[:, 0]
+    return reward[0], acc[0], height_portion, height_acc
 
 
 def binofit_scalar(x, n, alpha):
@@ -76,58 +184,168 @@ def binofit_scalar(x, n, alpha):
     return (Psuccess, ConfIntervals)
 
 
+def binofit(x, n, alpha):
+    """
+    Vectorized binofit_scalar(): Clopper-Pearson confidence intervals,
+    from quantiles of the beta distribution, which equal the F distribution
+    quantiles used there.
+
+    Parameters
+    ----------
+    x : ndarray of int
+        Numbers of successes.
+    n : int or ndarray of int
+        Numbers of trials, at least 1.
+    alpha : float
+
+    Returns
+    -------
+    p : ndarray of float
+    lb, ub : ndarray of float
+        Lower and upper bounds of the 1 - alpha confidence intervals.
+    """
+    x = np.asarray(x, dtype='float')
+    n = np.asarray(n, dtype='float')
+    p = x / n
+    # Quantiles at x == 0 and x == n are undefined; the bounds are 0 and 1.
+    lb = scipy.stats.beta.ppf(
+        alpha / 2, np.maximum(x, 1), n - np.maximum(x, 1) + 1)
+    lb = np.where(x == 0, 0, lb)
+    ub = scipy.stats.beta.ppf(
+        1 - alpha / 2, np.minimum(x, n - 1) + 1, n - np.minimum(x, n - 1))
+    ub = np.where(x == n, 1, ub)
+    return p, lb, ub
+
+
+def darts_predict(node_probs, rewards, lambdas):
+    """
+    Return the DARTS predictions for each lambda: the node maximizing the
+    expected reward, with rewards offset by lambda.
+
+    Parameters
+    ----------
+    node_probs : (n, m) ndarray of float
+        Posterior probabilities of all nodes, see node_posteriors().
+    rewards : (m,) ndarray of float
+    lambdas : (L,) ndarray of float
+
+    Returns
+    -------
+    preds : (L, n) ndarray of int
+    """
+    n, m = node_probs.shape
+    preds = np.empty((len(lambdas), n), dtype='int')
+    chunk = max(1, max_score_elements // (n * m))
+    for i in xrange(0, len(lambdas), chunk):
+        used_rewards = rewards + lambdas[i:i + chunk, np.newaxis]
+        scores = node_probs * used_rewards[:, np.newaxis, :]
+        preds[i:i + chunk] = scores.argmax(2)
+    return preds
+
+
 def darts_bisection(leaf_probs, acc_guarantees, labels, graph, num_bs_iters, confidence):
+    """
+    Find the smallest lambda for each accuracy guarantee such that the lower
+    bound of the confidence interval of the accuracy of darts_predict()
+    exceeds it.
+
+    All guarantees are bisected together: the node posteriors are computed
+    once, each step evaluates the vector of current lambdas, and the
+    confidence bounds of all possible numbers of correct predictions are
+    tabulated up front.
+
+    Parameters
+    ----------
+    leaf_probs : (n, k) ndarray of float, or callable
+        A callable returns an iterable of (start, chunk) as in darts_eval(),
+        covering the n labels. It is called at each step, and the numbers
+        of correct predictions are accumulated over the chunks, so corrupted
+        copies of the data are never held in memory together.
+    acc_guarantees : (G,) ndarray of float
+    labels : (n,) ndarray of int
+    graph : dict
+    num_bs_iters : int
+    confidence : float
+
+    Returns
+    -------
+    lambdas : (G,) ndarray of float
+    """
     t = time.time()
     labels = labels.flatten()
-    n = leaf_probs.shape[0]
-    lambdas = []
-    for ag in acc_guarantees:
-        eps = 1 - ag
-        desired_alpha = (1 - confidence) * 2.
-        min_lambda = 0
-        max_lambda = ((1 - eps) * np.max(graph['rewards']) - np.min(graph['rewards'])) / eps
-        for j in xrange(num_bs_iters):
-            cur_lambda = (min_lambda + max_lambda) / 2.
-            used_rewards = graph['rewards'] + cur_lambda
-            preds = (np.dot(leaf_probs, graph['leaf_membership']) * used_rewards).argmax(1)
-            reward, accuracy, _, _ = eval_reward(preds, labels, used_rewards, graph, fast=True)
-            _, acc_bounds = binofit_scalar(accuracy * n, n, desired_alpha)
-            if acc_bounds[0] > ag:
-                max_lambda = cur_lambda
-            else:
-                min_lambda = cur_lambda
-        lambdas.append(max_lambda)
+    n = labels.shape[0]
+    acc_guarantees = np.asarray(acc_guarantees, dtype='float').flatten()
+    rewards = graph['rewards']
+    if isinstance(leaf_probs, np.ndarray):
+        assert(leaf_probs.shape[0] == n)
+        node_probs = node_posteriors(leaf_probs, graph)
+        node_chunks = lambda: [(0, node_probs)]
+    else:
+        node_chunks = lambda: (
+            (start, node_posteriors(chunk, graph))
+            for start, chunk in leaf_probs())
+
+    desired_alpha = (1 - confidence) * 2.
+    _, acc_lower_bounds, _ = binofit(np.arange(n + 1), n, desired_alpha)
+    acc_lower_bounds = acc_lower_bounds.flatten()
+
+    eps = 1 - acc_guarantees
+    min_lambdas = np.zeros_like(acc_guarantees)
+    max_lambdas = ((1 - eps) * np.max(rewards) - np.min(rewards)) / eps
+    for j in xrange(num_bs_iters):
+        cur_lambdas = (min_lambdas + max_lambdas) / 2.
+        num_correct = np.zeros(len(acc_guarantees), dtype='int')
+        for start, node_probs in node_chunks():
+            preds = darts_predict(node_probs, rewards, cur_lambdas)
+            chunk_labels = labels[start:start + preds.shape[1]]
+            num_correct += is_correct(
+                preds, chunk_labels[np.newaxis, :], graph).sum(1)
+        met = acc_lower_bounds[num_correct] > acc_guarantees
+        max_lambdas = np.where(met, cur_lambdas, max_lambdas)
+        min_lambdas = np.where(met, min_lambdas, cur_lambdas)
     print('darts_bisection took {:.3f} s'.format(time.time() - t))
-    return np.array(lambdas)
+    return max_lambdas
 
 
 def darts_eval(leaf_probs, labels, lambdas, graph):
-    assert(leaf_probs.shape[0] == labels.shape[0])
+    """
+    Evaluate DARTS predictions for each lambda.
 
+    Parameters
+    ----------
+    leaf_probs : (n, k) ndarray of float, or iterable of (start, chunk)
+        Chunks are (r, k) ndarrays of the leaf probabilities of samples
+        start to start + r, as yielded by corrupt_chunks().
+    labels : (n,) ndarray of int
+    lambdas : (L,) ndarray of float
+    graph : dict
+
+    Returns
+    -------
+    rewards, accuracies : (L,) ndarray of float
+    height_portions, height_accs : (num_heights, L) ndarray of float
+    """
     t = time.time()
     labels = labels.flatten()
     normed_rewards = graph['rewards'] / np.max(graph['rewards'])
 
-    num_heights = len(np.unique(graph['heights']))
-    rewards = np.zeros_like(lambdas)
-    accuracies = np.zeros_like(lambdas)
-    height_portions = np.zeros((num_heights, lambdas.shape[0]))
-    height_accs = np.zeros((num_heights, lambdas.shape[0]))
-
-    for i, lam in enumerate(lambdas):
-        used_rewards = graph['rewards'] + lam
-        preds = (np.dot(leaf_probs, graph['leaf_membership']) * used_rewards).argmax(1)
-        reward, acc, height_portion, height_acc = eval_reward(
-            preds, labels, normed_rewards, graph, fast=False)
-        rewards[i] = reward
-        accuracies[i] = acc
-        height_portions[:, i] = height_portion
-        height_accs[:, i] = height_acc
+    if isinstance(leaf_probs, np.ndarray):
+        assert(leaf_probs.shape[0] == labels.shape[0])
+        leaf_probs = [(0, leaf_probs)]
+    preds = np.empty((len(lambdas), labels.shape[0]), dtype='int')
+    for start, chunk in leaf_probs:
+        node_probs = node_posteriors(chunk, graph)
+        preds[:, start:start + chunk.shape[0]] = darts_predict(
+            node_probs, graph['rewards'], lambdas)
+    rewards, accuracies, height_portions, height_accs = eval_rewards(
+        preds, labels, normed_rewards, graph, fast=False)
     print('darts_eval took {:.3f} s'.format(time.time() - t))
     return rewards, accuracies, height_portions, height_accs
 
 
 def plot_accuracy_vs_specificity(rewards, accuracies, labels=None):
+    import matplotlib.pyplot as plt
+
     if rewards.ndim == 1:
         rewards = np.atleast_2d(rewards)
         accuracies = np.atleast_2d(accuracies)
@@ -168,6 +386,8 @@ def plot_accuracy_vs_specificity(rewards, accuracies, labels=None):
 
 
 def meta_evaluate(graph, budgets, rewards, accuracies, height_portions):
+    import matplotlib.pyplot as plt
+
     plot_accuracy_vs_specificity(
         rewards, accuracies, labels=['{:.1f}'.format(b) for b in budgets])
 
@@ -207,7 +427,10 @@ def plot_height_portions(graph, budgets, height_portions):
     For a few budget points, plot the average portion of predictions (across all accuracies)
     by filling in the ILSVRC65 nodes.
     """
-    g = graph['g']
+    import networkx as nx
+    import matplotlib.pyplot as plt
+
+    g = graph['g'] if 'g' in graph else graph['taxonomy'].to_networkx()
     nodes = graph['nodes']
     pos = nx.pygraphviz_layout(g, prog='twopi')
 
@@ -248,8 +471,57 @@ def plot_height_portions(graph, budgets, height_portions):
     plt.legend()
 
 
+def corrupt_chunks(probs, budget, filling_method, fill=None, seed=0):
+    """
+    Generate the leaf probabilities with each value missing with probability
+    1 - budget, chunk by chunk.
+
+    The mask of each chunk is drawn from its own RandomState, seeded with
+    (seed, start), so the corruption does not depend on the order in which
+    chunks or budgets are processed.
+
+    Parameters
+    ----------
+    probs : (n, k) ndarray of float
+    budget : float in [0, 1]
+    filling_method : string in ['0', 'mean']
+    fill : (k,) ndarray of float
+        Values to fill in for filling_method 'mean'.
+    seed : int or list of int, optional [0]
+
+    Yields
+    ------
+    start : int
+    chunk : (r, k) ndarray of float
+        Corrupted copy of probs[start:start + r].
+    """
+    if filling_method == '0':
+        fill = 0
+    elif filling_method != 'mean':
+        raise ValueError('Unknown filling_method {}'.format(filling_method))
+    seed = list(np.atleast_1d(seed))
+    for start in xrange(0, probs.shape[0], corrupt_chunk_size):
+        chunk = probs[start:start + corrupt_chunk_size]
+        rs = np.random.RandomState(seed + [start])
+        mask = rs.rand(*chunk.shape) > budget
+        yield start, np.where(mask, fill, chunk)
+
+
+def _eval_budget(args):
+    """
+    Evaluate the hedged predictions on the test data corrupted to the given
+    budget, in a worker of the pool of iterative_missing_data().
+    """
+    budget, seed = args
+    d = _sweep_data
+    chunks = corrupt_chunks(
+        d['probs'], budget, d['filling_method'], d['fill'], seed)
+    return darts_eval(chunks, d['labels'], d['lambdas'], d['graph'])
+
+
 def iterative_missing_data(
-        imagenet, accuracy_guarantees, filling_method, lambdas_method):
+        imagenet, accuracy_guarantees, filling_method, lambdas_method,
+        num_budgets=5, num_workers=1, seed=0):
     """
     Parameters
     ----------
@@ -258,33 +530,31 @@ def iterative_missing_data(
     accuracy_guarantees: list of float
         Accuracy guarantees to compute hedging thresholds for.
 
-    filling_method : string in ['0', 'mean', 'smoothed']
+    filling_method : string in ['0', 'mean']
 
     lambdas_method: string in ['original', 'empirical']
         - original: train lambdas on full, original validation data
         - empirical: corrupt the validation data in ways that test data will be
             corrupted, and learn lambdas on that
+
+    num_budgets : int, optional [5]
+        Number of budgets, evenly spaced in [0, 1].
+
+    num_workers : int, optional [1]
+        Budgets are evaluated in a pool of this many processes, which share
+        the test data.
+
+    seed : int, optional [0]
+        Seed of the corruption masks.
     """
-    assert(filling_method in ['0', 'mean', 'smoothed'])
+    assert(filling_method in ['0', 'mean'])
     assert(lambdas_method in ['original', 'empirical'])
 
-    def apply_budget_to_probs(probs, budget, filling_method=filling_method):
-        probs = probs.copy()
-        mask = np.random.rand(*probs.shape) > budget
-        if filling_method == '0':
-            probs[mask] = 0
-        elif filling_method == 'mean':
-            probs[mask] = prior[mask]
-        elif filling_method == 'smoothed':
-            raise("Not implemented!")
-            # TODO
-        return probs
-
-    num_budgets = 5  # TODO increase this for fine-grainedness
     budgets = np.linspace(0, 1, num_budgets)
 
+    fill = None
     if filling_method == 'mean':
-        prior = np.tile(np.mean(imagenet.X, 0), (imagenet.X_test.shape[0], 1))
+        fill = np.mean(imagenet.X, 0)
 
     confidence = .95
     num_bs_iters = 30
@@ -293,13 +563,38 @@ def iterative_missing_data(
                                   imagenet.y, imagenet.graph, num_bs_iters, confidence)
     elif lambdas_method == 'empirical':
         # TODO: introduce sampling here?
-        noisy_val_leaf_probs = np.vstack([apply_budget_to_probs(imagenet.X, budget) for budget in budgets])
+        # The corrupted copies of the validation data follow each other,
+        # and are regenerated chunk by chunk at each bisection step.
+        n = imagenet.X.shape[0]
+
+        def noisy_val_leaf_probs():
+            for b, budget in enumerate(budgets):
+                for start, chunk in corrupt_chunks(
+                        imagenet.X, budget, filling_method, fill,
+                        [seed, 1, b]):
+                    yield b * n + start, chunk
         lambdas = darts_bisection(noisy_val_leaf_probs, accuracy_guarantees,
                                   np.tile(imagenet.y, (len(budgets), 1)), imagenet.graph, num_bs_iters, confidence)
 
-    r, a, hp, ha = zip(*[
-        darts_eval(apply_budget_to_probs(imagenet.X_test, budget), imagenet.y_test, lambdas, imagenet.graph)
-        for budget in budgets])
+    sparse_hierarchy(imagenet.graph)
+    _sweep_data.update({
+        'probs': imagenet.X_test, 'labels': imagenet.y_test,
+        'lambdas': lambdas, 'graph': imagenet.graph,
+        'filling_method': filling_method, 'fill': fill})
+    tasks = [(budget, [seed, 0, b]) for b, budget in enumerate(budgets)]
+    try:
+        if num_workers > 1:
+            pool = multiprocessing.Pool(num_workers)
+            try:
+                results = pool.map(_eval_budget, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_eval_budget, tasks)
+    finally:
+        _sweep_data.clear()
+    r, a, hp, ha = zip(*results)
     rewards = np.array(r)
     accuracies = np.array(a)
     height_portions = np.dstack(hp)
@@ -0,0 +1,63 @@
+"""
+Module-level lazy loading for packages.
+
+Python 2 has no module-level __getattr__, so the package module in
+sys.modules is replaced by a LazyModule, which imports listed submodules, and
+the names they export, on first attribute access.
+"""
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    """
+    Parameters
+    ----------
+    module: module
+        The package module being replaced.
+
+    submodules: list of string
+        Names of submodules to import on first access.
+
+    attributes: dict of string to string
+        Maps exported names to the submodule that defines them.
+    """
+    def __init__(self, module, submodules, attributes):
+        super(LazyModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # Keep the original module alive: when a module is collected,
+        # Python 2 sets its globals to None.
+        self._lazy_original = module
+        self._lazy_submodules = set(submodules)
+        self._lazy_attributes = dict(attributes)
+
+    def __getattr__(self, name):
+        if name.startswith('_lazy_'):
+            raise AttributeError(name)
+        if name in self._lazy_submodules:
+            value = importlib.import_module(self.__name__ + '.' + name)
+        elif name in self._lazy_attributes:
+            module = importlib.import_module(
+                self.__name__ + '.' + self._lazy_attributes[name])
+            value = getattr(module, name)
+        else:
+            raise AttributeError(
+                "'module' object has no attribute '{}'".format(name))
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(
+            set(self.__dict__) | self._lazy_submodules |
+            set(self._lazy_attributes))
+
+
+def install(name, submodules, attributes):
+    """
+    Replace the already-executing module name in sys.modules with a
+    LazyModule. Call at the end of the package's __init__.py.
+    """
+    module = LazyModule(sys.modules[name], submodules, attributes)
+    sys.modules[name] = module
+    return module
@@ -0,0 +1,141 @@
+"""
+Memory telemetry for training and evaluation: resident set sizes of the
+process and its workers, and sizes of the major buffers, by stage.
+
+Used to size cluster memory reservations; see suggest_reservation().
+"""
+import os
+import sys
+import math
+import resource
+from collections import OrderedDict
+import numpy as np
+
+MB = 2. ** 20
+
+
+def peak_rss_mb(children=False):
+    """
+    Return the peak resident set size in MB of this process, or, if children,
+    of the largest of its terminated child processes, such as those of a
+    finished multiprocessing pool.
+    """
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    maxrss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on OS X and in kilobytes on Linux.
+    if sys.platform == 'darwin':
+        return maxrss / MB
+    return maxrss / 1024.
+
+
+def rss_mb():
+    """
+    Return the current resident set size in MB, or None if /proc is not
+    available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / MB
+
+
+def nbytes(obj):
+    """
+    Return the total size in bytes of the ndarrays in obj, which may be an
+    ndarray or arbitrarily nested lists and tuples of them.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(x) for x in obj)
+    return 0
+
+
+class MemoryLog(object):
+    """
+    Record of memory use at the end of each stage of one iteration.
+
+    Properties
+    ----------
+    stages: OrderedDict of string to dict
+        Current and peak RSS of the process, and peak RSS of its largest
+        worker, in MB, at the end of each stage.
+    buffers: OrderedDict of string to float
+        Largest recorded size in MB of each named buffer.
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.buffers = OrderedDict()
+
+    def record(self, stage, **buffers):
+        """
+        Record RSS at the end of stage, and the sizes of the given buffers,
+        which can be anything accepted by nbytes(), or byte counts.
+        """
+        rss = rss_mb()
+        self.stages[stage] = {
+            'rss_mb': None if rss is None else round(rss, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'children_peak_rss_mb': round(peak_rss_mb(children=True), 1)
+        }
+        for name, buf in buffers.iteritems():
+            if buf is None:
+                continue
+            if isinstance(buf, (int, long, float)):
+                size = buf / MB
+            else:
+                size = nbytes(buf) / MB
+            self.buffers[name] = round(
+                max(size, self.buffers.get(name, 0)), 3)
+
+    def to_dict(self):
+        stages = self.stages.values()
+        return {
+            'peak_rss_mb': max([s['peak_rss_mb'] for s in stages] or [0]),
+            'children_peak_rss_mb': max(
+                [s['children_peak_rss_mb'] for s in stages] or [0]),
+            'stages': self.stages,
+            'buffers': self.buffers
+        }
+
+
+def suggest_reservation(reports, num_workers, headroom=1.25, round_to=1000):
+    """
+    Suggest a memory reservation in MB for a job, from the memory telemetry
+    in report.json files of previous runs of it or similar configurations.
+
+    The largest worker is assumed to be representative of all workers, so
+    the estimate is peak RSS of the main process plus num_workers times the
+    peak RSS of the largest worker. This double-counts memory shared with
+    forked workers, which errs on the safe side.
+
+    Parameters
+    ----------
+    reports: list of dict
+        Loaded report.json contents.
+    num_workers: int
+    headroom: float, optional [1.25]
+        Multiplier on the observed peak.
+    round_to: int, optional [1000]
+        The suggestion is rounded up to a multiple of this.
+
+    Returns
+    -------
+    mem: int or None
+        None if no report has memory telemetry.
+    """
+    peaks = []
+    for report in reports:
+        records = [it.get('memory') for it in report.get('iterations', [])]
+        records.append(report.get('eval', {}).get('memory'))
+        for memory in records:
+            if memory is None:
+                continue
+            peaks.append(
+                memory['peak_rss_mb'] +
+                num_workers * memory['children_peak_rss_mb'])
+    if len(peaks) == 0:
+        return None
+    return int(round_to * math.ceil(headroom * max(peaks) / round_to))
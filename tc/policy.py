@@ -2,6 +2,8 @@ import abc
 import numpy as np
 from numpy.random import rand, randint
 import sklearn
+import sklearn.cross_validation
+import sklearn.metrics
 from sklearn.linear_model import Ridge
 import tc
 
@@ -10,7 +12,8 @@ class Policy(object):
     """
     A Policy must implement the select_action() and predict() methods, and will
     get calls to fit() and plot_weights().
-    It's fine to return None for plot_weights().
+    It's fine to return None for plot_weights(). Its plot argument, if given,
+    replaces tc.util.plot_weights, e.g. to plot in the background.
 
     Parameters
     ----------
@@ -26,7 +29,7 @@ class Policy(object):
     def __repr__(self):
         return self.__class__.__name__
 
-    def plot_weights(self, filename=None):
+    def plot_weights(self, filename=None, plot=None):
         return None
 
     def fit(self, states_arr, actions, scores, num_workers=1):
@@ -82,6 +85,33 @@ class Policy(object):
             ind = randint(len(untaken_inds))
         return untaken_inds[ind]
 
+    def select_actions(self, states_arr):
+        """
+        Select greedy actions for many states at once.
+
+        Parameters
+        ----------
+        states_arr: (N, S) ndarray
+
+        Returns
+        -------
+        action_inds: (N,) ndarray of int
+            As select_action() with epsilon=0, for each row.
+        """
+        return np.array(
+            [self.select_action(s) for s in states_arr], dtype=int)
+
+    def select_untaken_actions(self, states_arr):
+        """
+        Batched select_untaken_action() with epsilon=0.
+        """
+        masks = self.state.slice_array(states_arr, 'mask').astype(bool)
+        scores = np.atleast_2d(self.predict(states_arr))
+        scores = np.where(masks, scores, -np.inf)
+        action_inds = scores.argmax(1)
+        action_inds[~masks.any(1)] = -1
+        return action_inds
+
     @abc.abstractmethod
     def predict(self, states_arr):
         """
@@ -173,6 +203,9 @@ class RandomPolicy(Policy):
     def select_action(self, state_vector, epsilon=0):
         return self.select_untaken_action(state_vector, epsilon)
 
+    def select_actions(self, states_arr):
+        return self.select_untaken_actions(states_arr)
+
     def predict(self, states_arr):
         return self.random_predict(states_arr)
 
@@ -213,6 +246,9 @@ class LinearPolicy(Policy):
             scores = scores.flatten()
         return scores
 
+    def select_actions(self, states_arr):
+        return np.atleast_2d(self.predict(states_arr)).argmax(1)
+
     def fit_(self, states_arr, actions, scores):
         """
         Fit F separate predictors, such that predictor number i is only fit
@@ -248,12 +284,14 @@ class LinearPolicy(Policy):
         self.fit_(states_arr, actions, scores)
         return mses.mean()
 
-    def plot_weights(self, filename=None):
+    def plot_weights(self, filename=None, plot=None):
         """
         Plot policy weights.
         """
         if not self.has_been_fit:
             return None
+        if plot is None:
+            plot = tc.util.plot_weights
         weights = []
         for r in self.predictors:
             if r is not None:
@@ -261,7 +299,7 @@ class LinearPolicy(Policy):
             else:
                 weights.append(np.zeros(self.state.S))
         try:
-            fig = tc.util.plot_weights(
+            fig = plot(
                 np.array(weights), xlabel='weights on $\phi(s)$',
                 ylabel='Actions', yticks=self.ds.actions,
                 filename=filename)
@@ -278,6 +316,9 @@ class LinearUntakenPolicy(LinearPolicy):
     def select_action(self, state, epsilon=0):
         return self.select_untaken_action(state, epsilon)
 
+    def select_actions(self, states_arr):
+        return self.select_untaken_actions(states_arr)
+
 
 class StaticLinearPolicy(LinearPolicy):
     """
@@ -298,3 +339,6 @@ class StaticLinearUntakenPolicy(StaticLinearPolicy):
     """
     def select_action(self, state, epsilon=0):
         return self.select_untaken_action(state, epsilon)
+
+    def select_actions(self, states_arr):
+        return self.select_untaken_actions(states_arr)
@@ -0,0 +1,297 @@
+"""
+Hierarchical timing spans.
+
+A Profiler keeps a tree of named spans with call counts and times, and a flat
+list of timed events for trace viewers. Spans opened inside other spans become
+their children:
+
+    profiler = Profiler()
+    with profiler.span('fit'):
+        with profiler.span('process_instances'):
+            ...
+
+or, as a drop-in replacement for tc.util.Timer, with tic() and toc().
+
+Worker processes build their own Profiler and send its tree and events back,
+to be merged into the parent with merge(), which tags the events with the
+name they are merged under, so that workers show as their own processes in
+the trace even when they ran in the parent process.
+
+The tree is exported to JSON with to_dict(), and the events to the Chrome
+trace event format with write_chrome_trace(), which can be opened in
+chrome://tracing or Perfetto.
+"""
+import os
+import time
+import json
+import threading
+from collections import OrderedDict
+
+
+class SpanNode(object):
+    """
+    Aggregate statistics of all calls of a span at one place in the tree.
+
+    Properties
+    ----------
+    count: int
+    total: float
+        Seconds spent in all calls.
+    last: float
+        Seconds spent in the last call.
+    children: OrderedDict of string to SpanNode
+    """
+    __slots__ = ['name', 'count', 'total', 'last', 'children']
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.
+        self.last = 0.
+        self.children = OrderedDict()
+
+    def child(self, name):
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = SpanNode(name)
+        return node
+
+    def add(self, duration, count=1):
+        self.count += count
+        self.total += duration
+        self.last = duration
+
+    def merge(self, d):
+        """
+        Add the statistics of a to_dict() tree to this node.
+        """
+        self.add(d['total'], d['count'])
+        self.last = d['last']
+        for child in d['children']:
+            self.child(child['name']).merge(child)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'count': self.count,
+            'total': round(self.total, 6),
+            'last': round(self.last, 6),
+            'children': [c.to_dict() for c in self.children.values()]
+        }
+
+
+class _Span(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.node = self.profiler._stack[-1].child(self.name)
+        self.profiler._stack.append(self.node)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        duration = time.time() - self.start
+        self.profiler._stack.pop()
+        self.node.add(duration)
+        self.profiler._record(self.name, self.start, duration)
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+
+class Profiler(object):
+    """
+    Parameters
+    ----------
+    enabled: bool, optional [True]
+        If False, span() returns a shared no-op context manager and nothing
+        is recorded.
+    detailed: bool, optional [False]
+        Flag for callers: if True, also instrument per-step work, such as
+        policy and state computations inside rollout workers.
+    max_events: int, optional [200000]
+        Events past this number are counted in num_dropped_events but not
+        kept for the trace. The span tree is always complete.
+    """
+    def __init__(self, enabled=True, detailed=False, max_events=200000):
+        self.enabled = enabled
+        self.detailed = enabled and detailed
+        self.max_events = max_events
+        self.root = SpanNode('root')
+        self._stack = [self.root]
+        self._open = []
+        self.events = []
+        self.num_dropped_events = 0
+        self.pid = os.getpid()
+        # Trace process ids of the names merged under, negative so as not
+        # to clash with real pids.
+        self.worker_pids = OrderedDict()
+
+    def span(self, name):
+        """
+        Return context manager timing a span with the given name, nested
+        under the currently open span.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def tic(self, name):
+        """
+        Open a span, as with tc.util.Timer. Spans opened with tic() must be
+        closed with toc() in reverse order.
+        """
+        if not self.enabled:
+            return
+        span = _Span(self, name)
+        span.__enter__()
+        self._open.append(span)
+
+    def qtoc(self, name):
+        return self.toc(name, quiet=True)
+
+    def toc(self, name, quiet=False):
+        """
+        Close the span opened by the matching tic() and return its duration.
+        """
+        if not self.enabled:
+            return
+        span = self._open.pop()
+        if span.name != name:
+            raise Exception('Closing span {} while {} is open.'.format(
+                name, span.name))
+        span.__exit__(None, None, None)
+        duration = round(span.node.last, 3)
+        if not quiet:
+            print('Profiler.{}: {} s'.format(name, duration))
+        return duration
+
+    def _record(self, name, start, duration, pid=None, tid=None):
+        if len(self.events) >= self.max_events:
+            self.num_dropped_events += 1
+            return
+        if pid is None:
+            pid = self.pid
+        if tid is None:
+            tid = threading.current_thread().ident
+        self.events.append((name, start, duration, pid, tid))
+
+    def add(self, name, duration, count=1):
+        """
+        Record a span measured elsewhere under the currently open span.
+        """
+        if not self.enabled:
+            return
+        self._stack[-1].child(name).add(duration, count)
+
+    def merge(self, name, d, events=None):
+        """
+        Merge the tree and events of another Profiler, e.g. one run in a
+        worker process, under the currently open span.
+
+        Parameters
+        ----------
+        name: string
+            Name of the node the other tree's top-level spans go under.
+        d: dict
+            Output of the other Profiler's to_dict().
+        events: list of tuples, optional
+            The other Profiler's events. They are recorded as those of a
+            process named name, whatever process they ran in.
+        """
+        if not self.enabled:
+            return
+        node = self._stack[-1].child(name)
+        total = sum(c['total'] for c in d['children'])
+        node.add(total)
+        for child in d['children']:
+            node.child(child['name']).merge(child)
+        if name not in self.worker_pids:
+            self.worker_pids[name] = -1 - len(self.worker_pids)
+        pid = self.worker_pids[name]
+        for event_name, start, duration, _, tid in events or []:
+            self._record(event_name, start, duration, pid, tid)
+
+    def last_times(self):
+        """
+        Return dict of the last durations of the children of the currently
+        open span, in the format of tc.util.Timer.report().
+        """
+        return OrderedDict(
+            (name, round(node.last, 3))
+            for name, node in self._stack[-1].children.iteritems())
+
+    def to_dict(self):
+        d = self.root.to_dict()
+        d['total'] = round(sum(c['total'] for c in d['children']), 6)
+        return d
+
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def write_chrome_trace(self, filename):
+        """
+        Write events in the Chrome trace event format.
+        """
+        t0 = min([e[1] for e in self.events] or [0])
+        process_names = dict(
+            (pid, name) for name, pid in self.worker_pids.iteritems())
+        process_names[self.pid] = 'main'
+        trace = []
+        for pid in sorted(set(e[3] for e in self.events)):
+            trace.append({
+                'name': 'process_name', 'ph': 'M', 'pid': pid,
+                'args': {'name': process_names.get(
+                    pid, 'process {}'.format(pid))}})
+        for name, start, duration, pid, tid in self.events:
+            trace.append({
+                'name': name, 'cat': 'tc', 'ph': 'X', 'pid': pid,
+                'tid': tid % 2 ** 31,
+                'ts': round((start - t0) * 1e6, 1),
+                'dur': round(duration * 1e6, 1)})
+        with open(filename, 'w') as f:
+            json.dump({
+                'traceEvents': trace,
+                'displayTimeUnit': 'ms',
+                'otherData': {'num_dropped_events': self.num_dropped_events}
+            }, f)
+
+NULL_PROFILER = Profiler(enabled=False)
+
+
+def format_tree(d, min_fraction=0.001):
+    """
+    Return a text rendering of a to_dict() tree, one span per line with its
+    call count, total time, and fraction of the root's time.
+
+    Parameters
+    ----------
+    d: dict
+    min_fraction: float, optional [0.001]
+        Spans taking less than this fraction of the total are omitted.
+    """
+    total = max(d['total'], 1e-9)
+    lines = ['{:<40} {:>8} {:>11} {:>7}'.format(
+        'span', 'count', 'total (s)', '%')]
+
+    def visit(node, depth):
+        for child in node['children']:
+            fraction = child['total'] / total
+            if fraction < min_fraction:
+                continue
+            lines.append('{:<40} {:>8d} {:>11.3f} {:>7.1f}'.format(
+                '  ' * depth + child['name'], child['count'],
+                child['total'], 100 * fraction))
+            visit(child, depth + 1)
+    visit(d, 0)
+    return '\n'.join(lines)
@@ -3,12 +3,22 @@ Baseline to select classifiers based on information gain, solved as a DP
 problem without any MDP machinery.
 The goal is to show that the MDP comes out with the same solution, and
 to have a way to initialize policies.
+
+The exact baseline searches the lattice of subsets of actions, keyed by
+packed action masks (see pack_mask()), by beam search or, for few actions,
+exhaustively. The classifier of each subset is fit and evaluated once by a
+SubsetLattice, whose results do not depend on the budget, so that sweeping
+max_budget reuses them, in memory and, with a cache directory, across
+processes.
 """
 import optparse
 import sys
 import os
 import json
+import multiprocessing
 import sklearn
+import sklearn.cross_validation
+import sklearn.metrics
 from sklearn.cross_validation import train_test_split
 import bottleneck as bn
 import numpy as np
@@ -35,14 +45,50 @@ def get_states_from_mask_distribution(ds, md, instances, labels, N, mi=None):
     return states, labels
 
 
-def get_states(ds, instances, action_inds, mi=None):
+# Data shared with the workers of the pool of SubsetLattice.evaluate(), set
+# before the pool is created so that the workers inherit it.
+_lattice_data = {}
+
+# Subsets expanded per level of the lattice by default: with A actions, the
+# search fits at most default_beam_width * A subsets per action taken.
+default_beam_width = 4
+
+# Exhaustive search refuses lattices that may have more subsets under the
+# budget than this.
+max_exact_subsets = 2 ** 16
+
+
+def pack_mask(action_inds):
+    """
+    Return the int whose bits are set at the given action indices.
+    """
+    bits = 0
+    for ind in action_inds:
+        bits |= 1 << int(ind)
+    return bits
+
+
+def unpack_mask(bits, A):
+    """
+    Return (A,) ndarray of bool, True for the actions set in bits.
+    """
+    return np.array([(bits >> a) & 1 for a in xrange(A)], dtype=bool)
+
+
+def get_states(ds, instances, action_inds, mi=None, max_budget=None):
+    """
+    Return the states of all instances with the given actions taken.
+    The cost is normalized by max_budget, by default that of ds.
+    """
     state = tc.TimelyState(ds.action_dims)
-    cost = ds.action_costs[action_inds].sum() / ds.max_budget
+    if max_budget is None:
+        max_budget = ds.max_budget
+    cost = ds.action_costs[action_inds].sum() / max_budget
     assert(cost <= 1)
     N = instances.shape[0]
-    states = np.zeros((N, state.S))
-    for i in xrange(N):
-        states[i] = state.get_state(instances[i], action_inds, cost)
+    mask = np.ones((N, state.F), dtype=bool)
+    mask[:, action_inds] = False
+    states = state.get_states_from_mask(instances, mask, np.repeat(cost, N))
 
     # Impute unobserved values.
     if mi is not None:
@@ -66,6 +112,242 @@ def eval_classifier(clf, states, labels):
     return score, entropy
 
 
+def _fit_mask(bits):
+    """
+    Fit the classifier of the states with the actions in bits taken, in a
+    worker of the pool of SubsetLattice.evaluate().
+    """
+    d = _lattice_data
+    ds = d['ds']
+    action_inds = np.flatnonzero(unpack_mask(bits, len(ds.actions)))
+    states = get_states(ds, d['instances'], action_inds, d['mi'],
+                        ds.action_costs.sum())
+    clf, score, entropy = get_classifier(
+        ds, states, d['labels'], d['num_clf'], d['num_workers'])
+    if not d['keep_clf']:
+        clf = None
+    return bits, clf, score, entropy
+
+
+class SubsetLattice(object):
+    """
+    Classifiers of subsets of actions, each fit and evaluated once.
+
+    Results are memoized by packed action mask. They do not depend on the
+    budget: states are built with the cost normalized by the total cost of
+    all actions, which the classifiers do not use anyway.
+
+    Parameters
+    ----------
+    ds: tc.DataSource
+    instances: (N, D) ndarray
+    labels: (N,) ndarray
+    num_clf: int, optional [1]
+    mi: imputer, optional
+        Applied to the states.
+    cache: tc.cache.Cache, optional
+        Stores the results under keys that do not depend on max_budget.
+    settings: dict, optional
+        Anything else the results depend on, such as the instances used, as
+        part of the cache keys.
+    num_workers: int, optional [1]
+        Size of the process pool in which new subsets are fit. With one
+        worker, subsets are fit in turn, each with num_workers.
+
+    Properties
+    ----------
+    results: dict of int to (float, float)
+        Score and entropy of each subset fit so far.
+    num_fit: int
+        Number of subsets actually fit, not found in the cache.
+    """
+    def __init__(self, ds, instances, labels, num_clf=1, mi=None,
+                 cache=None, settings=None, num_workers=1):
+        self.ds = ds
+        self.instances = instances
+        self.labels = labels
+        self.num_clf = num_clf
+        self.mi = mi
+        self.cache = cache
+        self.settings = settings or {}
+        self.num_workers = num_workers
+        self.results = {}
+        self.num_fit = 0
+
+    def cost(self, bits):
+        return self.ds.action_costs[unpack_mask(bits, len(self.ds.actions))].sum()
+
+    def key(self, stage, bits):
+        settings = dict(self.settings, mask=bits, num_clf=self.num_clf)
+        return self.cache.key(stage, self.ds, settings, with_budget=False)
+
+    def evaluate(self, masks):
+        """
+        Fit and evaluate the classifiers of the subsets that have not been,
+        in parallel across the process pool.
+
+        Returns
+        -------
+        results: dict of int to (float, float)
+            Score and entropy of each of the given subsets.
+        """
+        todo = []
+        for bits in set(masks):
+            if bits in self.results:
+                continue
+            if self.cache is not None:
+                value = self.cache.get(self.key('static_subset', bits))
+                if value is not None:
+                    self.results[bits] = value
+                    continue
+            todo.append(bits)
+
+        if len(todo) > 0:
+            parallel = self.num_workers > 1 and len(todo) > 1
+            _lattice_data.update({
+                'ds': self.ds, 'instances': self.instances,
+                'labels': self.labels, 'mi': self.mi,
+                'num_clf': self.num_clf, 'keep_clf': False,
+                'num_workers': 1 if parallel else self.num_workers})
+            try:
+                if parallel:
+                    pool = multiprocessing.Pool(self.num_workers)
+                    try:
+                        out = pool.map(_fit_mask, todo, chunksize=1)
+                    finally:
+                        pool.close()
+                        pool.join()
+                else:
+                    out = map(_fit_mask, todo)
+            finally:
+                _lattice_data.clear()
+            for bits, _, score, entropy in out:
+                self.results[bits] = (score, entropy)
+                if self.cache is not None:
+                    self.cache.put(self.key('static_subset', bits),
+                                   (score, entropy))
+            self.num_fit += len(out)
+        return dict((bits, self.results[bits]) for bits in masks)
+
+    def classifier(self, bits):
+        """
+        Return the classifier of the subset, which is not kept by
+        evaluate(), as there may be one for every subset.
+        """
+        def fit():
+            _lattice_data.update({
+                'ds': self.ds, 'instances': self.instances,
+                'labels': self.labels, 'mi': self.mi,
+                'num_clf': self.num_clf, 'keep_clf': True,
+                'num_workers': self.num_workers})
+            try:
+                return _fit_mask(bits)[1]
+            finally:
+                _lattice_data.clear()
+        if self.cache is None:
+            return fit()
+        return self.cache.cached(self.key('static_subset_clf', bits), fit)[0]
+
+
+def num_subsets_bound(action_costs, max_budget):
+    """
+    Return an upper bound on the number of subsets of actions whose cost is
+    within max_budget: the number of subsets of at most as many actions as
+    the cheapest ones that fit.
+    """
+    A = len(action_costs)
+    max_size = np.sum(np.cumsum(np.sort(action_costs)) <= max_budget)
+    num, num_k = 1, 1
+    for k in xrange(1, max_size + 1):
+        num_k = num_k * (A - k + 1) // k
+        num += num_k
+    return num
+
+
+def lattice_search(lattice, max_budget, beam_width=default_beam_width,
+                   objective='entropy'):
+    """
+    Find the static order of actions that maximizes the area under the
+    curve of classifier value vs. cost, up to max_budget.
+
+    The value of a subset of actions is the accuracy of its classifier, or
+    one minus its normalized entropy. Until the next action of an order is
+    taken, the value is that of the subset taken so far, so the best order
+    to a subset extends the best order to one of the subsets it covers, and
+    the search proceeds by DP over the lattice, one level of subsets of the
+    same size at a time. Only the beam_width subsets of a level that give
+    the largest areas when stopping there are expanded. If beam_width is
+    None, the search is exact, which is refused for lattices that may have
+    more than max_exact_subsets subsets under the budget.
+
+    Parameters
+    ----------
+    lattice: SubsetLattice
+    max_budget: float
+    beam_width: int or None, optional [default_beam_width]
+    objective: string in ['entropy', 'score'], optional ['entropy']
+
+    Returns
+    -------
+    action_inds: list of int
+    area: float
+    """
+    assert(objective in ['entropy', 'score'])
+    A = len(lattice.ds.actions)
+    action_costs = lattice.ds.action_costs
+    if beam_width is None:
+        num_subsets = num_subsets_bound(action_costs, max_budget)
+        if num_subsets > max_exact_subsets:
+            raise ValueError(
+                'Exact search of up to {} subsets; give a beam_width'.format(
+                    num_subsets))
+
+    def value(bits):
+        score, entropy = lattice.results[bits]
+        return score if objective == 'score' else 1 - entropy
+
+    lattice.evaluate([0])
+    areas = {0: 0.}
+    parents = {0: None}
+    costs = {0: 0.}
+    frontier = [0]
+    best_area, best_bits = value(0) * max_budget, 0
+    for level in xrange(A):
+        children = {}
+        for bits in frontier:
+            v = value(bits)
+            for a in xrange(A):
+                cost = costs[bits] + action_costs[a]
+                if (bits >> a) & 1 or cost > max_budget:
+                    continue
+                child = bits | (1 << a)
+                area = areas[bits] + v * action_costs[a]
+                if child not in children or area > children[child][0]:
+                    children[child] = (area, bits, cost)
+        if len(children) == 0:
+            break
+
+        lattice.evaluate(children.keys())
+        totals = {}
+        for child, (area, parent, cost) in children.iteritems():
+            areas[child] = area
+            parents[child] = parent
+            costs[child] = cost
+            totals[child] = area + value(child) * (max_budget - cost)
+        frontier = sorted(children, key=totals.get, reverse=True)
+        if beam_width is not None:
+            frontier = frontier[:beam_width]
+        if totals[frontier[0]] > best_area:
+            best_area, best_bits = totals[frontier[0]], frontier[0]
+
+    action_inds = []
+    bits = best_bits
+    while parents[bits] is not None:
+        action_inds.append((bits ^ parents[bits]).bit_length() - 1)
+        bits = parents[bits]
+    return action_inds[::-1], best_area
+
+
 def plot_dp(m, actions, title=None, filename=None):
     fig = plt.figure()
     ax = fig.add_subplot(111)
@@ -97,8 +379,17 @@ class StaticClassifier(object):
     Parameters
     ----------
     clf_method: string in ['logreg', 'imagenet']
+    beam_width: int or None, optional [default_beam_width]
+        Width of the beam search of the lattice of subsets of actions, or
+        None for exact search, for few actions. See lattice_search().
+    lattice: SubsetLattice, optional
+        Shared by the classifiers of a sweep of budgets on the same data.
+    cache_dirname: string, optional
+        If given, results of subsets are cached there, across budgets.
     """
-    def __init__(self, ds, clf_method='logreg', log_dirname='data/timely_results'):
+    def __init__(self, ds, clf_method='logreg', log_dirname='data/timely_results',
+                 beam_width=default_beam_width, lattice=None,
+                 cache_dirname=None):
         self.name = 'static_classifier'
         assert(clf_method in ['logreg', 'imagenet'])
         self.clf_method = clf_method
@@ -109,10 +400,19 @@ class StaticClassifier(object):
         self.filename = self.logging_dirname + '/sc.pickle'
         self.has_been_fit = False
         self.num_clf = 1
+        self.beam_width = beam_width
+        self.lattice = lattice
+        self.cache_dirname = cache_dirname
 
     def __repr__(self):
         return 'StaticClassifier'
 
+    def __getstate__(self):
+        # The lattice holds the training data.
+        state = self.__dict__.copy()
+        state['lattice'] = None
+        return state
+
     def save(self):
         """
         Save self to canonical location.
@@ -174,6 +474,7 @@ class StaticClassifier(object):
             plt.savefig(filename)
 
     def predict(self):
+        ds = self.ds
         clfs = self.clfs
         action_inds = self.action_inds
         instances = ds.X_test
@@ -190,7 +491,8 @@ class StaticClassifier(object):
     def fit(self, num_workers=7, debug_plots=True, force=False):
         """
         Train A+1 classifiers (the first one is for no features observed.)
-        Find order of A features to run in.
+        Find order of A features to run in, by search of the lattice of
+        subsets of actions.
         """
         if not force and os.path.exists(self.filename):
             with open(self.filename) as f:
@@ -201,69 +503,50 @@ class StaticClassifier(object):
             return
 
         ds = self.ds
-        instances = ds.X
-        labels = ds.y
         A = len(ds.actions)
-
-        # Train classifier on initially empty states.
-        action_inds = []
-        states = get_states(ds, instances, action_inds)
-        clf, score, entropy = get_classifier(
-            ds, states, labels, 1, num_workers)
-
-        # We will collect values for visualization.
+        lattice = self.lattice
+        if lattice is None:
+            cache = None
+            if self.cache_dirname is not None:
+                cache = tc.cache.ResultCache(self.cache_dirname)
+            lattice = SubsetLattice(
+                ds, ds.X, ds.y, cache=cache, num_workers=num_workers)
+        num_fit = lattice.num_fit
+        action_inds, area = lattice_search(
+            lattice, ds.max_budget, self.beam_width)
+        print('Fit {} subsets, {} evaluated in all'.format(
+            lattice.num_fit - num_fit, len(lattice.results)))
+
+        # Collect the values of the subsets one action away from each
+        # prefix of the order, for visualization.
         scores = np.empty((A, A))
         scores.fill(np.nan)
         entropies = np.empty((A, A))
         entropies.fill(np.nan)
         infogains = np.empty((A, A))
         infogains.fill(np.nan)
-
-        # While there are feasible actions, consider them.
-        costs = ds.action_costs.copy()
-        remaining_mask = np.ones(len(ds.actions), dtype=bool)
-        selected_clfs = [clf]
-        for iteration in xrange(A):
-            print('-'*80)
-            print('Iteration {}'.format(iteration))
-
-            feas_inds = np.flatnonzero(remaining_mask & (costs <= ds.max_budget))
-            if len(feas_inds) == 0:
-                break
-
-            new_clfs = np.empty(A, dtype=object)
-            for action_ind in feas_inds:
-                print(ds.actions[action_ind]),
-                new_action_inds = action_inds + [action_ind]
-                states = get_states(ds, instances, new_action_inds)
-
-                new_clf, new_score, new_entropy = get_classifier(
-                    ds, states, labels, 1, num_workers)
-                new_clfs[action_ind] = new_clf
-
-                infogains[action_ind, iteration] = entropy - new_entropy
-                scores[action_ind, iteration] = new_score
-                entropies[action_ind, iteration] = new_entropy
-
-            rewards = infogains[:, iteration] / ds.action_costs
-            ind = bn.nanargmax(rewards)
-            selected_clfs.append(new_clfs[ind])
-            action_inds.append(ind)
-            print('Selected {} with infogain {:.2f} and cost {:.2f}'.format(ds.actions[ind], infogains[ind, iteration], ds.action_costs[ind]))
-
-            remaining_mask[ind] = False
-            costs += ds.action_costs[ind]
-            entropy = entropies[ind, iteration]
+        bits = 0
+        for iteration, ind in enumerate(action_inds):
+            entropy = lattice.results[bits][1]
+            for action_ind in xrange(A):
+                new_bits = bits | (1 << action_ind)
+                if new_bits != bits and new_bits in lattice.results:
+                    new_score, new_entropy = lattice.results[new_bits]
+                    infogains[action_ind, iteration] = entropy - new_entropy
+                    scores[action_ind, iteration] = new_score
+                    entropies[action_ind, iteration] = new_entropy
+            bits |= 1 << ind
 
         actions = np.take(ds.actions, action_inds)
         print('Selected actions in order: {}'.format(actions))
 
         self.action_inds = action_inds
-        self.clfs = selected_clfs
+        self.clfs = [lattice.classifier(pack_mask(action_inds[:i]))
+                     for i in xrange(len(action_inds) + 1)]
         assert(len(self.clfs) == len(self.action_inds) + 1)
         self.has_been_fit = True
         if debug_plots:
-            self.plot_stuff(scores, entropies, infogains, rewards)
+            self.plot_stuff(scores, entropies, infogains, None)
         self.save()
 
     def plot_stuff(self, scores, entropies, infogains, rewards):
@@ -467,6 +750,14 @@ if __name__ == '__main__':
     parser.add_option('--num_clf', default=1)
     parser.add_option('--clf_method', default='logreg')
     parser.add_option('--impute_method', default='mean')
+    parser.add_option('--beam_width', type='int', default=default_beam_width)
+    parser.add_option(
+        '--exhaustive', action='store_true', default=False,
+        help='exact search of the subsets of actions, instead of beam search')
+    parser.add_option(
+        '--max_budgets', default=None,
+        help='comma-separated budgets to sweep; by default, that of the data source')
+    parser.add_option('--cache_dirname', default=None)
     opts, args = parser.parse_args()
 
     # Load the DataSource
@@ -478,15 +769,32 @@ if __name__ == '__main__':
 
     num_workers = opts.num_workers
     force = opts.force
+    max_budgets = [ds.max_budget]
+    if opts.max_budgets is not None:
+        max_budgets = [json.loads(b) for b in opts.max_budgets.split(',')]
+
+    # The subsets of the exact method are shared by all budgets.
+    lattice = None
     if opts.method == 'exact':
-        sc = StaticClassifier(ds, opts.clf_method)
-    elif opts.method.split('_')[0] == 'clustered':
-        sc = StaticClassifierClustered(
-            ds, clf_method=opts.clf_method, num_clf=opts.num_clf,
-            impute_method=opts.impute_method)
-    else:
-        raise Exception('do not understand method')
-
-    print sc
-    sc.fit(num_workers=1)
-    sc.evaluate(save_plot=True)
+        cache = None
+        if opts.cache_dirname is not None:
+            cache = tc.cache.ResultCache(opts.cache_dirname)
+        lattice = SubsetLattice(
+            ds, ds.X, ds.y, cache=cache, num_workers=num_workers)
+
+    for max_budget in max_budgets:
+        ds.max_budget = max_budget
+        if opts.method == 'exact':
+            sc = StaticClassifier(
+                ds, opts.clf_method, lattice=lattice,
+                beam_width=None if opts.exhaustive else opts.beam_width)
+        elif opts.method.split('_')[0] == 'clustered':
+            sc = StaticClassifierClustered(
+                ds, clf_method=opts.clf_method, num_clf=opts.num_clf,
+                impute_method=opts.impute_method)
+        else:
+            raise Exception('do not understand method')
+
+        print sc
+        sc.fit(num_workers=num_workers, force=force)
+        sc.evaluate(save_plot=True, force=force)
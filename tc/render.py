@@ -0,0 +1,190 @@
+"""
+Rendering of plots and reports in a background process.
+
+Training submits render tasks, each a module-level function and the data it
+needs, and goes on without waiting for matplotlib. A single renderer
+process, started on first use, runs them in order:
+
+    tc.render.submit(
+        filename, tc.util.plot_weights, weights, filename=filename)
+
+Tasks are identified by their output, usually a filename. A task is skipped
+if its inputs are the same as those of the last task rendered for the same
+output, and, of several tasks for the same output waiting in the queue,
+only the latest is rendered.
+
+flush() waits until all submitted tasks are rendered; at exit, close() does.
+Setting `background = False` renders synchronously on submit instead.
+"""
+import sys
+import time
+import atexit
+import hashlib
+import traceback
+import multiprocessing
+from Queue import Empty
+import cPickle as pickle
+from collections import namedtuple, OrderedDict
+
+# If False, submit() renders in the calling process.
+background = True
+
+# The action names of a data source, which is all that plots of
+# trajectories need of it.
+ActionsRecord = namedtuple('ActionsRecord', ['actions'])
+
+_STOP = 'stop'
+
+
+def actions_record(ds):
+    return ActionsRecord([str(a) for a in ds.actions])
+
+
+class Renderer(object):
+    """
+    Runs render tasks, skipping those whose inputs did not change.
+
+    Properties
+    ----------
+    digests: dict of string to string
+        Digest of the inputs of the last task rendered for each key.
+    num_rendered, num_skipped: int
+    """
+    def __init__(self):
+        self.digests = {}
+        self.num_rendered = 0
+        self.num_skipped = 0
+
+    def run(self, key, task):
+        """
+        Parameters
+        ----------
+        key: string
+        task: string
+            Pickled (func, args, kwargs).
+        """
+        digest = hashlib.sha1(task).hexdigest()
+        if self.digests.get(key) == digest:
+            self.num_skipped += 1
+            return
+        try:
+            func, args, kwargs = pickle.loads(task)
+            func(*args, **kwargs)
+        except Exception:
+            print('Rendering {} failed:'.format(key))
+            traceback.print_exc()
+        finally:
+            if 'matplotlib.pyplot' in sys.modules:
+                sys.modules['matplotlib.pyplot'].close('all')
+        self.digests[key] = digest
+        self.num_rendered += 1
+
+
+def _serve(queue, num_done):
+    """
+    Renderer process: run tasks from the queue until told to stop, counting
+    the tasks taken off the queue in num_done.
+    """
+    if 'matplotlib.pyplot' not in sys.modules:
+        try:
+            import matplotlib
+            matplotlib.use('Agg')
+        except ImportError:
+            pass
+    renderer = Renderer()
+    stop = False
+    while not stop:
+        # Take all waiting tasks, keeping only the latest for each key.
+        tasks = OrderedDict()
+        items = [queue.get()]
+        while True:
+            try:
+                items.append(queue.get_nowait())
+            except Empty:
+                break
+        for item in items:
+            if item == _STOP:
+                stop = True
+                continue
+            key = item[0]
+            tasks.pop(key, None)
+            tasks[key] = item
+        for key, task in tasks.values():
+            renderer.run(key, task)
+        with num_done.get_lock():
+            num_done.value += len(items)
+
+
+_queue = None
+_process = None
+_num_submitted = 0
+_num_done = None
+_local_renderer = Renderer()
+atexit.register(lambda: close())
+
+
+def _start():
+    global _queue, _process, _num_submitted, _num_done
+    _queue = multiprocessing.Queue()
+    _num_submitted = 0
+    _num_done = multiprocessing.Value('l', 0)
+    _process = multiprocessing.Process(
+        target=_serve, args=(_queue, _num_done))
+    _process.daemon = True
+    _process.start()
+
+
+def submit(key, func, *args, **kwargs):
+    """
+    Render func(*args, **kwargs) in the background.
+
+    Parameters
+    ----------
+    key: string
+        Identifies the output, usually its filename.
+    func: module-level function
+    args, kwargs: picklable
+        Pickled right away, so they can be modified after submit() returns.
+    """
+    task = pickle.dumps((func, args, kwargs), protocol=2)
+    if not background:
+        _local_renderer.run(key, task)
+        return
+    global _num_submitted
+    if _process is None or not _process.is_alive():
+        _start()
+    _num_submitted += 1
+    _queue.put((key, task))
+
+
+def plotter(func):
+    """
+    Return function that submits func, called with a filename keyword
+    argument, and returns the filename; for passing as the plot argument of
+    the plot_weights() methods of policies and classifiers.
+    """
+    def plot(*args, **kwargs):
+        submit(kwargs['filename'], func, *args, **kwargs)
+        return kwargs['filename']
+    return plot
+
+
+def flush(poll_interval=.05):
+    """
+    Wait until all submitted tasks are rendered, or the renderer process
+    has died.
+    """
+    while (_process is not None and _process.is_alive() and
+           _num_done.value < _num_submitted):
+        time.sleep(poll_interval)
+
+
+def close():
+    """
+    Render all submitted tasks and stop the renderer process.
+    """
+    global _process
+    if _process is not None and _process.is_alive():
+        _queue.put(_STOP)
+        _process.join()
+    _process = None
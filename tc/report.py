@@ -1,8 +1,6 @@
 import os
 import json
-import jinja2
-import pandas
-import matplotlib.pyplot as plt
+import tc
 
 
 class Report(object):
@@ -15,6 +13,11 @@ class Report(object):
         Must be an existing, valid directory.
 
     html_filename: string
+
+    Properties
+    ----------
+    profile: dict of string to dict
+        Span trees of tc.profiling.Profiler, by stage.
     """
     def __init__(self, dirname, html_filename):
         self.dirname = dirname
@@ -24,11 +27,29 @@ class Report(object):
         self.eval = {}
         self.training_plots = None
         self.iterations = []
+        self.profile = {}
+
+    def __setstate__(self, state):
+        # Reports pickled before profiling was added have no profile.
+        self.__dict__.update(state)
+        self.__dict__.setdefault('profile', {})
+
+    def write_async(self):
+        """
+        As write(), but in the background; see tc.render.
+        Only the latest of several pending writes is done.
+        """
+        tc.render.submit(self.json_filename, _write, self)
 
     def write(self):
         """
         Plot performance and timing over iterations.
         """
+        import jinja2
+        import pandas
+        import matplotlib.pyplot as plt
+        from tc.profiling import format_tree
+
         # TEMP FIX, SAFE TO DELETE SOON
         if self.dirname.startswith('/n/banquet/df/sergeyk/work/timely_classification'):
             self.dirname = os.path.relpath(self.dirname, '/n/banquet/df/sergeyk/work/timely_classification')
@@ -66,18 +87,47 @@ class Report(object):
         plt.savefig(timing_plot)
         self.timing_plot = rel(timing_plot)
 
+        # Plot memory: peak RSS and largest buffer sizes.
+        def memory_row(memory):
+            row = dict(memory['buffers'])
+            row['peak_rss_mb'] = memory['peak_rss_mb']
+            row['children_peak_rss_mb'] = memory['children_peak_rss_mb']
+            return row
+
+        memory_table = pandas.DataFrame(dict([
+            (i, memory_row(d['memory']))
+            for i, d in enumerate(self.iterations) if 'memory' in d])).T
+        if 'memory' in self.eval:
+            memory_table = memory_table.append(pandas.DataFrame(
+                memory_row(self.eval['memory']), index=['Final']))
+        self.memory_plot = None
+        if memory_table.shape[0] > 0:
+            ax = memory_table.plot(title='Memory', marker='s')
+            ax.set_ylabel('Size (MB)')
+            memory_plot = os.path.join(self.dirname, 'memory_vs_time.png')
+            plt.savefig(memory_plot)
+            self.memory_plot = rel(memory_plot)
+
         with open(self.json_filename, 'w') as f:
             json.dump(self.__dict__, f)
 
         with open(self.html_filename, 'w') as f:
-            f.write(jt.render(
+            f.write(jinja2.Template(html_template).render(
                 len=len, info_json=json.dumps(self.info, indent=4),
                 name=os.path.basename(self.html_filename),
                 perf_table=perf_table.to_html(), times_table=times_table.to_html(),
+                memory_table=memory_table.to_html(),
+                profile_trees=[
+                    (name, format_tree(tree))
+                    for name, tree in sorted(self.profile.items())],
                 **self.__dict__))
 
 
-jt = jinja2.Template("""
+def _write(report):
+    report.write()
+
+
+html_template = """
 <html>
 <head>
     <title></title>
@@ -111,6 +161,7 @@ jt = jinja2.Template("""
     <div>
         <img src={{ perf_plot }} height="300px" />
         <img src={{ timing_plot }} height="300px" />
+        <img src={{ memory_plot }} height="300px" onerror="this.style.display='none';" />
 
         <p>
         {{ perf_table }}
@@ -119,8 +170,19 @@ jt = jinja2.Template("""
         <p>
         {{ times_table }}
         </p>
+
+        <p>
+        {{ memory_table }}
+        </p>
     </div>
 
+    {% for name, tree in profile_trees %}
+    <div>
+        <h3>Profile: {{ name }}</h3>
+        <pre>{{ tree }}</pre>
+    </div>
+    {% endfor %}
+
     {% for i in range(len(iterations), 0, -1) %}
     <div>
         <h3>Iteration {{ i }}</h3>
@@ -140,4 +202,4 @@ jt = jinja2.Template("""
     {% endfor %}
 </div>
 </body>
-</html>""")
+</html>"""
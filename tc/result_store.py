@@ -0,0 +1,141 @@
+"""
+Columnar storage of per-episode results.
+
+Ragged per-episode arrays (confidences, actions, rewards, costs) are stored
+flattened in an HDF5 file, alongside an offsets array per field, such that
+episode i of a field is data[offsets[i]:offsets[i + 1]].
+Readers can load any subset of episodes without reading the rest of the file,
+and the data source is referenced by name instead of being embedded.
+"""
+import json
+import numpy as np
+import h5py
+
+
+def ragged_to_flat(arrays):
+    """
+    Parameters
+    ----------
+    arrays: list of (?,) or (?, K) ndarrays
+
+    Returns
+    -------
+    data: (sum(?),) or (sum(?), K) ndarray
+    offsets: (len(arrays) + 1,) ndarray of int
+    """
+    lengths = [a.shape[0] for a in arrays]
+    offsets = np.hstack((0, np.cumsum(lengths))).astype('int64')
+    data = np.concatenate([np.asarray(a) for a in arrays])
+    return data, offsets
+
+
+def flat_to_ragged(data, offsets):
+    """
+    Inverse of ragged_to_flat.
+    """
+    return np.split(data, offsets[1:-1])
+
+
+def write_episodes(filename, ragged, fixed=None, ds=None, attrs=None):
+    """
+    Write per-episode results to an HDF5 file.
+
+    Parameters
+    ----------
+    filename: string
+
+    ragged: dict of string to list of ndarrays
+        Each list has one array per episode.
+
+    fixed: dict of string to ndarray, optional
+        Arrays with one row per episode, such as labels.
+
+    ds: tc.DataSource, optional
+        If given, its name and action names are stored as attributes.
+
+    attrs: dict, optional
+        Additional JSON-serializable attributes.
+    """
+    with h5py.File(filename, 'w') as f:
+        if ds is not None:
+            f.attrs['data_source'] = ds.name
+            f.attrs['actions'] = json.dumps([str(a) for a in ds.actions])
+        if attrs is not None:
+            for k, v in attrs.iteritems():
+                f.attrs[k] = json.dumps(v)
+
+        for name, arrays in ragged.iteritems():
+            data, offsets = ragged_to_flat(arrays)
+            g = f.create_group('ragged/' + name)
+            g.create_dataset('data', data=data, chunks=True)
+            g.create_dataset('offsets', data=offsets)
+
+        if fixed is not None:
+            for name, arr in fixed.iteritems():
+                f.create_dataset('fixed/' + name, data=np.asarray(arr))
+
+
+class EpisodeStore(object):
+    """
+    Lazy reader of files written by write_episodes().
+
+    Only the offsets are read on construction; episode data is read from disk
+    when requested.
+
+    Parameters
+    ----------
+    filename: string
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with h5py.File(filename, 'r') as f:
+            self.data_source = f.attrs.get('data_source')
+            actions = f.attrs.get('actions')
+            self.actions = json.loads(actions) if actions is not None else None
+            self.attrs = dict(
+                (k, json.loads(v)) for k, v in f.attrs.items()
+                if k not in ['data_source', 'actions'])
+            self.ragged_fields = sorted(f['ragged'].keys()) \
+                if 'ragged' in f else []
+            self.fixed_fields = sorted(f['fixed'].keys()) \
+                if 'fixed' in f else []
+            self.offsets = dict(
+                (name, f['ragged/{}/offsets'.format(name)][:])
+                for name in self.ragged_fields)
+
+    def __len__(self):
+        if len(self.ragged_fields) == 0:
+            return 0
+        return len(self.offsets[self.ragged_fields[0]]) - 1
+
+    def get(self, name, inds=None):
+        """
+        Return list of per-episode arrays of the given ragged field.
+
+        Parameters
+        ----------
+        name: string
+
+        inds: sequence of int, optional
+            Episodes to load. If None, all episodes are loaded.
+
+        Returns
+        -------
+        arrays: list of ndarrays
+        """
+        offsets = self.offsets[name]
+        with h5py.File(self.filename, 'r') as f:
+            dset = f['ragged/{}/data'.format(name)]
+            if inds is None:
+                return flat_to_ragged(dset[:], offsets)
+            return [dset[offsets[i]:offsets[i + 1]] for i in inds]
+
+    def get_fixed(self, name, inds=None):
+        """
+        Return array of the given per-episode field, for all or some episodes.
+        """
+        with h5py.File(self.filename, 'r') as f:
+            dset = f['fixed/' + name]
+            if inds is None:
+                return dset[:]
+            return np.array([dset[i] for i in inds])
@@ -0,0 +1,268 @@
+"""
+Incremental SQLite index of experiment results.
+
+The results directory holds one directory per experiment (data source), with
+one directory per TimelyClassifier setting, containing its report.json and,
+once evaluated, evaluation_final.npz:
+
+    <results_dirname>/<experiment>/<setting>/report.json
+
+The index stores the flattened configuration, evaluation metrics and final
+Error vs. Cost curve of each setting. update() only reads the files of
+settings that are new or were modified since they were last ingested, so
+aggregating results does not get slower as runs accumulate, and the best
+results and their curves are fetched by indexed queries.
+"""
+import os
+import json
+import sqlite3
+from glob import glob
+from collections import OrderedDict
+import numpy as np
+
+# Configuration values stored as columns, so that they can be queried.
+# The columns have no type affinity, so values keep their JSON types.
+config_columns = [
+    'max_iter', 'max_batches', 'batch_size',
+    'policy_feat', 'policy_method',
+    'rewards_mode', 'rewards_loss', 'gamma',
+    'clf_method', 'num_clf', 'random_start', 'impute_method',
+    'normalize_reward_locally', 'add_fully_observed']
+
+schema = """
+CREATE TABLE IF NOT EXISTS reports (
+    dirname TEXT PRIMARY KEY,
+    experiment TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    evaluated INTEGER NOT NULL,
+    max_budget REAL,
+    info TEXT,
+    {config}
+);
+CREATE INDEX IF NOT EXISTS reports_experiment
+    ON reports (experiment, evaluated);
+CREATE INDEX IF NOT EXISTS reports_policy
+    ON reports (experiment, policy_method, policy_feat, gamma);
+CREATE TABLE IF NOT EXISTS perf (
+    dirname TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (dirname, name)
+);
+CREATE INDEX IF NOT EXISTS perf_name ON perf (name, value);
+CREATE TABLE IF NOT EXISTS curves (
+    dirname TEXT PRIMARY KEY,
+    interp_points BLOB NOT NULL,
+    means BLOB NOT NULL,
+    stds BLOB
+);
+""".format(config=',\n    '.join(config_columns))
+
+
+def to_blob(arr):
+    return sqlite3.Binary(np.asarray(arr, dtype='float64').tostring())
+
+
+def from_blob(blob):
+    return None if blob is None else np.frombuffer(blob, dtype='float64')
+
+
+def mtime(dirname):
+    """
+    Return the latest modification time of the result files in dirname.
+    """
+    times = []
+    for name in ['report.json', 'evaluation_final.npz']:
+        try:
+            times.append(os.stat(os.path.join(dirname, name)).st_mtime)
+        except OSError:
+            pass
+    return max(times)
+
+
+class ResultsIndex(object):
+    """
+    Parameters
+    ----------
+    filename: string
+        SQLite database, created if it does not exist.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.conn.executescript(schema)
+
+    def close(self):
+        self.conn.close()
+
+    def update(self, results_dirname, experiments=None):
+        """
+        Ingest new and modified results, and drop those whose files are gone.
+
+        Parameters
+        ----------
+        results_dirname: string
+        experiments: list of string, optional
+            Names of experiments to update; by default, all.
+
+        Returns
+        -------
+        num_ingested: int
+        """
+        if experiments is None:
+            experiment_dirnames = [
+                d for d in glob(os.path.join(results_dirname, '*'))
+                if os.path.isdir(d)]
+        else:
+            experiment_dirnames = [
+                os.path.join(results_dirname, e) for e in experiments]
+
+        num_ingested = 0
+        with self.conn:
+            for experiment_dirname in experiment_dirnames:
+                experiment = os.path.basename(experiment_dirname)
+                known = dict(self.conn.execute(
+                    'SELECT dirname, mtime FROM reports WHERE experiment = ?',
+                    (experiment,)))
+                present = set()
+                for filename in glob(os.path.join(
+                        experiment_dirname, '*', 'report.json')):
+                    dirname = os.path.dirname(filename)
+                    present.add(dirname)
+                    t = mtime(dirname)
+                    if known.get(dirname) == t:
+                        continue
+                    try:
+                        self.ingest(experiment, dirname, t)
+                    except (ValueError, KeyError, IOError) as e:
+                        print('Could not ingest {}: {}'.format(dirname, e))
+                        continue
+                    num_ingested += 1
+                for dirname in set(known) - present:
+                    self.remove(dirname)
+        return num_ingested
+
+    def ingest(self, experiment, dirname, t):
+        """
+        Store the results in dirname, replacing any stored before.
+        """
+        with open(os.path.join(dirname, 'report.json')) as f:
+            data = json.load(f)
+        info = data['info']
+        perf = data.get('eval', {}).get('perf')
+
+        self.remove(dirname)
+        columns = ['dirname', 'experiment', 'mtime', 'evaluated',
+                   'max_budget', 'info'] + config_columns
+        values = [dirname, experiment, t, perf is not None,
+                  info['data_source']['max_budget'], json.dumps(info)]
+        values += [info.get(c) for c in config_columns]
+        self.conn.execute(
+            'INSERT INTO reports ({}) VALUES ({})'.format(
+                ', '.join(columns), ', '.join('?' * len(columns))),
+            values)
+        if perf is None:
+            return
+
+        self.conn.executemany(
+            'INSERT INTO perf (dirname, name, value) VALUES (?, ?, ?)',
+            [(dirname, k, v) for k, v in perf.iteritems()])
+        curve_filename = os.path.join(dirname, 'evaluation_final.npz')
+        if os.path.exists(curve_filename):
+            curve = np.load(curve_filename)
+            stds = curve['stds'] if 'stds' in curve.files else None
+            self.conn.execute(
+                'INSERT INTO curves (dirname, interp_points, means, stds) '
+                'VALUES (?, ?, ?, ?)',
+                (dirname, to_blob(curve['interp_points']),
+                 to_blob(curve['means']),
+                 None if stds is None else to_blob(stds)))
+
+    def remove(self, dirname):
+        for table in ['reports', 'perf', 'curves']:
+            self.conn.execute(
+                'DELETE FROM {} WHERE dirname = ?'.format(table), (dirname,))
+
+    def experiment_results(self, experiment):
+        """
+        Return the configuration and metrics of the evaluated settings of an
+        experiment.
+
+        Returns
+        -------
+        max_budgets: list of float
+            Of all settings, evaluated or not.
+        rows: list of OrderedDict
+            Configuration columns, dirname, and metrics of each evaluated
+            setting, ordered by dirname.
+        """
+        max_budgets = [r[0] for r in self.conn.execute(
+            'SELECT max_budget FROM reports WHERE experiment = ?',
+            (experiment,))]
+        rows = self.select('r.experiment = ? AND r.evaluated', (experiment,))
+        return max_budgets, rows
+
+    def best_result(self, experiment, conditions, select_lowest='loss_auc'):
+        """
+        Return the evaluated setting of the experiment that matches the
+        conditions and has the lowest value of the select_lowest metric, as
+        in experiment_results(), or None if no setting matches.
+
+        Parameters
+        ----------
+        experiment: string
+        conditions: dict of configuration column to value
+        select_lowest: string, optional ['loss_auc']
+        """
+        # NaN metrics, of diverged runs, are stored as NULL, which would
+        # sort first.
+        where = ['r.experiment = ?', 'r.evaluated', 'p.value IS NOT NULL']
+        args = [experiment]
+        for k, v in sorted(conditions.iteritems()):
+            if k not in config_columns:
+                raise Exception('Cannot query on {}'.format(k))
+            where.append('r.{} = ?'.format(k))
+            args.append(v)
+        dirnames = self.conn.execute(
+            'SELECT r.dirname FROM reports r JOIN perf p '
+            'ON p.dirname = r.dirname AND p.name = ? '
+            'WHERE {} ORDER BY p.value, r.dirname LIMIT 1'.format(
+                ' AND '.join(where)),
+            [select_lowest] + args).fetchall()
+        if len(dirnames) == 0:
+            return None
+        return self.select('r.dirname = ?', dirnames[0])[0]
+
+    def select(self, where, args):
+        """
+        Return rows of experiment_results() for the reports matching the
+        SQL where clause on table alias r.
+        """
+        columns = config_columns + ['dirname']
+        results = OrderedDict()
+        for row in self.conn.execute(
+                'SELECT {} FROM reports r WHERE {} ORDER BY r.dirname'.format(
+                    ', '.join('r.' + c for c in columns), where), args):
+            results[row[-1]] = OrderedDict(zip(columns, row))
+        if len(results) == 0:
+            return []
+        for dirname, name, value in self.conn.execute(
+                'SELECT p.dirname, p.name, p.value FROM perf p '
+                'JOIN reports r ON r.dirname = p.dirname '
+                'WHERE {}'.format(where), args):
+            results[dirname][name] = value
+        return results.values()
+
+    def curves(self, dirnames):
+        """
+        Return dict of dirname to (interp_points, means, stds) of those of
+        the given settings that have a stored curve. stds may be None.
+        """
+        curves = {}
+        for dirname in dirnames:
+            row = self.conn.execute(
+                'SELECT interp_points, means, stds FROM curves '
+                'WHERE dirname = ?', (dirname,)).fetchone()
+            if row is not None:
+                curves[dirname] = tuple(from_blob(b) for b in row)
+        return curves
@@ -1,12 +1,33 @@
 import matplotlib as mpl
 mpl.use('Agg')
 import os
+import json
+import optparse
+from glob import glob
 from StringIO import StringIO
 import pandas
 import tc
 
 home = os.path.expanduser('~')
 
+
+def suggest_mem(jobs_dirname, ticl_name, num_workers, default):
+    """
+    Return a memory reservation in MB for a job, suggested from the memory
+    telemetry of a previous run of the same configuration if there is one,
+    else of all previous runs on the same data source, else default.
+    See tc.memory.suggest_reservation.
+    """
+    filenames = glob(os.path.join(jobs_dirname, ticl_name, 'report.json'))
+    if len(filenames) == 0:
+        filenames = glob(os.path.join(jobs_dirname, '*', 'report.json'))
+    reports = []
+    for filename in filenames:
+        with open(filename) as f:
+            reports.append(json.load(f))
+    mem = tc.memory.suggest_reservation(reports, num_workers)
+    return default if mem is None else mem
+
 #linear_untaken,  dynamic,     1.0,   1,       gnb,        True,         False,               auc,          infogain,     False,                    exp,           16,      .25,       8
 #linear_untaken,  static,      1.0,   1,       gnb,        True,         False,               auc,          infogain,     False,                    exp,           16,      .25,       8
 #linear_untaken,  dynamic,     1.0,   1,       logreg,     True,         True,                auc,          infogain,     False,                    exp,           16,      .25,       8
@@ -113,68 +134,210 @@ experiments = {
     },
 }
 
+def get_settings(experiment_name):
+    """
+    Return DataFrame of TimelyClassifier settings to run for an experiment.
+    """
+    experiment = experiments[experiment_name]
+    df = pandas.read_csv(StringIO(experiment['csv_settings']), header=1, skipinitialspace=True)
+    df['add_fully_observed'] = False
+    df['normalize_reward_locally'] = False
+
+    if experiment_name[:6] == 'ilsvrc':
+        df['clf_method'] = 'imagenet'
+        df = df[df['num_clf'] == 1]
+        df['impute_method'] = df['impute_method'].replace('0', 'mean')
+    return df
+
+
+def get_jobs(experiment_name, log_dirname, data_sources_dirname,
+             num_workers, debug_plots):
+    """
+    Initialize and save the data source of an experiment, and return a job
+    for each of its settings.
+
+    Returns
+    -------
+    jobs_dirname: string
+    jobs: list of dict
+        With the job name, command-line options and data source pickle
+        filename of tc/timely_classifier.py, and memory in MB.
+    """
+    experiment = experiments[experiment_name]
+    df = get_settings(experiment_name)
+
+    # Initialize and save the data source.
+    ds = eval(experiment['ds'])
+    ds_pickle_filename = ds.save()
+
+    jobs_dirname = log_dirname + '/' + ds.name
+    tc.util.mkdir_p(jobs_dirname)
+    # Shared by all experiments, so that settings reuse each other's work.
+    cache_dirname = log_dirname + '/cache'
+
+    jobs = []
+    for i, row in df.iterrows():
+        opts = []
+        for k, v in row.to_dict().iteritems():
+            if isinstance(v, bool):
+                if v:
+                    opts.append('--{}'.format(k))
+            else:
+                opts.append('--{}={}'.format(k, v))
+        opts.append('--log_dirname={}'.format(log_dirname))
+        opts.append('--cache_dirname={}'.format(cache_dirname))
+        if debug_plots:
+            opts.append('--debug_plots')
+        opts.append('--num_workers={}'.format(num_workers))
+
+        ticl_name = tc.TimelyClassifier.get_canonical_name(row.to_dict())
+        mem = suggest_mem(
+            jobs_dirname, ticl_name, num_workers, experiment['mem'])
+        if mem != experiment['mem']:
+            print('{}: suggested mem {} MB (default {} MB)'.format(
+                ticl_name, mem, experiment['mem']))
+        jobs.append({
+            'name': ticl_name,
+            'opts': opts,
+            'ds_pickle_filename': ds_pickle_filename,
+            'mem': mem
+        })
+    return jobs_dirname, jobs
+
+
+def write_slurm_jobs(jobs_dirname, jobs, num_workers):
+    """
+    Write shell and slurm job files for the jobs of an experiment.
+    """
+    jobs_dirname_for_cmd = jobs_dirname.replace(home, '$HOME')
+    jobs_filename = jobs_dirname + '/jobs.sh'
+    slurm_jobs_filename = jobs_dirname + '/slurm_jobs.sh'
+
+    with open(jobs_filename, 'w') as f, open(slurm_jobs_filename, 'w') as f_slurm:
+        for job in jobs:
+            opts = ' '.join(job['opts']).replace(home, '$HOME')
+            args = job['ds_pickle_filename'].replace(home, '$HOME')
+
+            local_out_filename = jobs_dirname_for_cmd + '/{}.out'.format(job['name'])
+            f.write('nice python tc/timely_classifier.py {} {} &> {}\n'.format(
+                opts, args, local_out_filename))
+
+            job_out_filename = jobs_dirname_for_cmd + '/{}-%j.out'.format(job['name'])
+            srun = 'srun -p vision --mem={} --cpus-per-task={} --time=4:0:0 --output={}'.format(
+                job['mem'], num_workers, job_out_filename)
+            f_slurm.write('{} nice python tc/timely_classifier.py {} {} &\n'.format(
+                srun, opts, args))
+
+    print('Jobs written to:')
+    print(jobs_filename.replace(home, '$HOME'))
+    print(slurm_jobs_filename.replace(home, '$HOME'))
+
+
+def get_local_jobs(jobs_dirname, jobs, num_workers):
+    """
+    Return tc.scheduler.Job for each of the jobs of an experiment.
+    A job is done once its report has evaluation results.
+    """
+    local_jobs = []
+    for job in jobs:
+        report_filename = os.path.join(
+            jobs_dirname, job['name'], 'report.json')
+        local_jobs.append(tc.scheduler.Job(
+            os.path.basename(jobs_dirname) + '/' + job['name'],
+            tc.scheduler.python_cmd(
+                'tc/timely_classifier.py',
+                job['opts'] + [job['ds_pickle_filename']]),
+            job['mem'], num_workers,
+            output_filename=os.path.join(
+                jobs_dirname, '{}.out'.format(job['name'])),
+            done=lambda f=report_filename: tc.scheduler.has_evaluated_report(f),
+            cwd=tc.repo_dir))
+    return local_jobs
+
+
+def get_sweep_job(experiment_name, log_dirname, jobs_dirname, jobs,
+                  num_workers, debug_plots):
+    """
+    Return a single tc.scheduler.Job fitting all settings of an experiment
+    in one process with tc/sweep.py, which shares the work they have in
+    common. It reserves the memory of the largest of the jobs, and is done
+    once all of them are.
+    """
+    df = get_settings(experiment_name)
+    df['impute_method'] = df['impute_method'].astype(str)
+    settings_filename = os.path.join(jobs_dirname, 'sweep_settings.json')
+    with open(settings_filename, 'w') as f:
+        f.write(df.to_json(orient='records'))
+
+    opts = [
+        '--log_dirname={}'.format(log_dirname),
+        '--cache_dirname={}'.format(log_dirname + '/cache'),
+        '--num_workers={}'.format(num_workers)]
+    if debug_plots:
+        opts.append('--debug_plots')
+    report_filenames = [
+        os.path.join(jobs_dirname, job['name'], 'report.json')
+        for job in jobs]
+    return tc.scheduler.Job(
+        os.path.basename(jobs_dirname) + '/sweep',
+        tc.scheduler.python_cmd(
+            'tc/sweep.py',
+            opts + [settings_filename, jobs[0]['ds_pickle_filename']]),
+        max(job['mem'] for job in jobs), num_workers,
+        output_filename=os.path.join(jobs_dirname, 'sweep.out'),
+        done=lambda: all(
+            tc.scheduler.has_evaluated_report(f) for f in report_filenames),
+        cwd=tc.repo_dir)
+
+
 if __name__ == '__main__':
-    num_workers = 4
-    debug_plots = '--debug_plots'  # ''
+    parser = optparse.OptionParser()
+    parser.add_option('--experiments',
+                      help='Comma-separated experiment names [all].')
+    parser.add_option('--num_workers', type='int', default=4)
+    parser.add_option('--no_debug_plots', action='store_true')
+    parser.add_option('--slurm', action='store_true',
+                      help='Write slurm job files instead of running locally.')
+    parser.add_option('--max_mem', type='int',
+                      help='MB of memory to use [90% of physical memory].')
+    parser.add_option('--max_cores', type='int',
+                      help='Number of cores to use [all].')
+    parser.add_option('--max_attempts', type='int', default=2)
+    parser.add_option('--sweep', action='store_true',
+                      help='Run all settings of an experiment in one job, '
+                      'sharing their common work. Local runs only.')
+    opts, args = parser.parse_args()
+
+    num_workers = opts.num_workers
+    debug_plots = not opts.no_debug_plots
     experiments_to_run = experiments.keys()
+    if opts.experiments is not None:
+        experiments_to_run = opts.experiments.split(',')
 
     log_dirname = tc.repo_dir + '/data/timely_results'
     data_sources_dirname = tc.repo_dir + '/data/data_sources'
     tc.util.mkdir_p(log_dirname)
     tc.util.mkdir_p(data_sources_dirname)
 
+    local_jobs = []
     for experiment_to_run in experiments_to_run:
-        experiment = experiments[experiment_to_run]
-
-        df = pandas.read_csv(StringIO(experiment['csv_settings']), header=1, skipinitialspace=True)
-        df['add_fully_observed'] = False
-        df['normalize_reward_locally'] = False
-
-        if experiment_to_run[:6] == 'ilsvrc':
-            df['clf_method'] = 'imagenet'
-            df = df[df['num_clf'] == 1]
-            df['impute_method'] = df['impute_method'].replace('0', 'mean')
-
-        # Initialize and save the data source.
-        ds = eval(experiment['ds'])
-        ds_pickle_filename = ds.save()
-
-        # Write the jobs.
-        ds_pickle_filename = ds_pickle_filename.replace(home, '$HOME')
-        log_dirname_for_cmd = log_dirname.replace(home, '$HOME')
-
-        jobs_dirname = log_dirname + '/' + ds.name
-        tc.util.mkdir_p(jobs_dirname)
-        jobs_dirname_for_cmd = jobs_dirname.replace(home, '$HOME')
-
-        jobs_filename = jobs_dirname + '/jobs.sh'
-        slurm_jobs_filename = jobs_dirname + '/slurm_jobs.sh'
-
-        with open(jobs_filename, 'w') as f, open(slurm_jobs_filename, 'w') as f_slurm:
-            for i, row in df.iterrows():
-                opts = []
-                for k, v in row.to_dict().iteritems():
-                    if isinstance(v, bool):
-                        if v:
-                            opts.append('--{}'.format(k))
-                    else:
-                        opts.append('--{}={}'.format(k, v))
-                opts = ' '.join(opts)
-
-                opts += ' --log_dirname={} {} --num_workers={}'.format(log_dirname_for_cmd, debug_plots, num_workers)
-                args = ds_pickle_filename
-
-                ticl_name = tc.TimelyClassifier.get_canonical_name(row.to_dict())
-                local_out_filename = jobs_dirname_for_cmd + '/{}.out'.format(ticl_name)
-                f.write('nice python tc/timely_classifier.py {} {} &> {}\n'.format(
-                    opts, args, local_out_filename))
-
-                job_out_filename = jobs_dirname_for_cmd + '/{}-%j.out'.format(ticl_name)
-                srun = 'srun -p vision --mem={} --cpus-per-task={} --time=4:0:0 --output={}'.format(
-                    experiment['mem'], num_workers, job_out_filename)
-                f_slurm.write('{} nice python tc/timely_classifier.py {} {} &\n'.format(
-                    srun, opts, args))
-
-        print('Jobs written to:')
-        print(jobs_filename.replace(home, '$HOME'))
-        print(slurm_jobs_filename.replace(home, '$HOME'))
+        jobs_dirname, jobs = get_jobs(
+            experiment_to_run, log_dirname, data_sources_dirname,
+            num_workers, debug_plots)
+        if opts.slurm:
+            write_slurm_jobs(jobs_dirname, jobs, num_workers)
+        elif opts.sweep:
+            local_jobs.append(get_sweep_job(
+                experiment_to_run, log_dirname, jobs_dirname, jobs,
+                num_workers, debug_plots))
+        else:
+            local_jobs += get_local_jobs(jobs_dirname, jobs, num_workers)
+
+    if not opts.slurm:
+        status_filename = log_dirname + '/scheduler_status.json'
+        print('Running {} jobs; status in {}'.format(
+            len(local_jobs), status_filename))
+        scheduler = tc.scheduler.LocalScheduler(
+            opts.max_mem, opts.max_cores, opts.max_attempts, status_filename)
+        scheduler.run(local_jobs)
+        print(scheduler.status()['counts'])
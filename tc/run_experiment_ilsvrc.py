@@ -1,7 +1,9 @@
 """
-Output a jobs file to run ILSVRC65 experiments.
+Run ILSVRC65 experiments locally with tc.scheduler, or output a slurm jobs
+file to run them.
 """
 import os
+import optparse
 import tc
 
 data_sources_dirname = 'data/data_sources'
@@ -15,36 +17,71 @@ data_sources = [
 ]
 
 if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option('--slurm', action='store_true',
+                      help='Write slurm job file instead of running locally.')
+    parser.add_option('--max_mem', type='int')
+    parser.add_option('--max_cores', type='int')
+    opts, args = parser.parse_args()
+
     home = os.path.expanduser('~')
     slurm_jobs_filename = 'data/timely_results/_ilsvrc65_slurm_jobs.sh'
 
-    with open(slurm_jobs_filename, 'w') as f_slurm:
-        for ds_string in data_sources:
-            ds = eval(ds_string)
-            ds_pickle_filename = ds.save()
-            ds_pickle_filename = ds_pickle_filename.replace(home, '$HOME')
-
-            log_dirname = tc.repo_dir + '/data/timely_results'
-            local_out_dirname = log_dirname + '/' + ds.name
-            tc.util.mkdir_p(local_out_dirname)
-            log_dirname_for_cmd = log_dirname.replace(home, '$HOME')
-
-            num_workers = 1
-            force = False
-            force_str = '--force' if force else ''
-
-            # DP policies
-            num_clf = 1
-            method = 'clustered'
-            clf_method = 'imagenet'
-            for impute_method in ['mean', 'gaussian']:
-                slurm_out_filename = log_dirname_for_cmd + '/' + ds.name + '/static_{}_{}_{}_{}-%j.out'.format(
-                    method, num_clf, clf_method, impute_method)
-                cmd = 'nice python tc/proper_static_baseline.py --method={} --num_clf={} --clf_method={} --impute_method={} --num_workers={} {} {}'.format(
-                    method, num_clf, clf_method, impute_method, num_workers, force_str, ds_pickle_filename)
-
-                mem = 2000
+    jobs = []
+    for ds_string in data_sources:
+        ds = eval(ds_string)
+        ds_pickle_filename = ds.save()
+
+        log_dirname = tc.repo_dir + '/data/timely_results'
+        local_out_dirname = log_dirname + '/' + ds.name
+        tc.util.mkdir_p(local_out_dirname)
+
+        num_workers = 1
+        force = False
+
+        # DP policies
+        num_clf = 1
+        method = 'clustered'
+        clf_method = 'imagenet'
+        for impute_method in ['mean', 'gaussian']:
+            name = 'static_{}_{}_{}_{}'.format(
+                method, num_clf, clf_method, impute_method)
+            cmd_args = [
+                '--method={}'.format(method),
+                '--num_clf={}'.format(num_clf),
+                '--clf_method={}'.format(clf_method),
+                '--impute_method={}'.format(impute_method),
+                '--num_workers={}'.format(num_workers)]
+            if force:
+                cmd_args.append('--force')
+            cmd_args.append(ds_pickle_filename)
+            # Where StaticClassifierClustered.evaluate() writes its report.
+            report_filename = os.path.join(
+                local_out_dirname, 'static_classifier_clustered_{}_{}_{}'.format(
+                    num_clf, clf_method, impute_method), 'report.json')
+            done = None
+            if not force:
+                done = lambda f=report_filename: \
+                    tc.scheduler.has_evaluated_report(f)
+            jobs.append(tc.scheduler.Job(
+                ds.name + '/' + name,
+                tc.scheduler.python_cmd(
+                    'tc/proper_static_baseline.py', cmd_args),
+                mem=2000, cores=num_workers,
+                output_filename='{}/{}.out'.format(local_out_dirname, name),
+                done=done, cwd=tc.repo_dir))
+
+    if opts.slurm:
+        with open(slurm_jobs_filename, 'w') as f_slurm:
+            for job in jobs:
+                slurm_out_filename = job.output_filename[:-len('.out')] + '-%j.out'
                 srun = 'srun -p vision --mem={} --cpus-per-task={} --time=4:0:0 --output={}'.format(
-                    mem, num_workers, slurm_out_filename)
-                f_slurm.write('{} {} &\n'.format(
-                    srun, cmd))
+                    job.mem, job.cores, slurm_out_filename.replace(home, '$HOME'))
+                cmd = 'nice python ' + ' '.join(job.cmd[1:]).replace(home, '$HOME')
+                f_slurm.write('{} {} &\n'.format(srun, cmd))
+    else:
+        scheduler = tc.scheduler.LocalScheduler(
+            opts.max_mem, opts.max_cores,
+            status_filename='data/timely_results/_ilsvrc65_status.json')
+        scheduler.run(jobs)
+        print(scheduler.status()['counts'])
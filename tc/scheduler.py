@@ -0,0 +1,246 @@
+"""
+Local experiment scheduler for running a sweep on a single large machine.
+
+Jobs are shell-free subprocesses, each declaring the memory and cores it
+needs. The scheduler starts pending jobs, largest memory first, whenever
+they fit into the remaining memory and cores of the machine, skips jobs whose
+results already exist, retries failed jobs, and keeps a JSON status file of
+all jobs up to date.
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+import multiprocessing
+
+
+def total_mem_mb():
+    """
+    Return total physical memory in MB.
+    """
+    return (os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+            / 2. ** 20)
+
+
+def has_evaluated_report(filename):
+    """
+    Return True if filename is a report.json of an evaluated
+    TimelyClassifier.
+    """
+    if not os.path.exists(filename):
+        return False
+    try:
+        with open(filename) as f:
+            return 'perf' in json.load(f)['eval']
+    except (ValueError, KeyError):
+        return False
+
+
+class Job(object):
+    """
+    Parameters
+    ----------
+    name: string
+        Unique name.
+    cmd: list of string
+        Command to run, without a shell.
+    mem: int
+        Memory in MB to reserve.
+    cores: int, optional [1]
+    output_filename: string, optional
+        If given, stdout and stderr are appended here.
+    done: callable, optional
+        Returns True if the results of the job exist, in which case it is
+        skipped.
+    cwd: string, optional
+    """
+    def __init__(self, name, cmd, mem, cores=1, output_filename=None,
+                 done=None, cwd=None):
+        self.name = name
+        self.cmd = cmd
+        self.mem = mem
+        self.cores = cores
+        self.output_filename = output_filename
+        self.done = done
+        self.cwd = cwd
+
+        self.state = 'pending'
+        self.attempts = 0
+        self.returncode = None
+        self.start_time = None
+        self.end_time = None
+        self.process = None
+        self._output = None
+
+    def start(self):
+        self.attempts += 1
+        self.state = 'running'
+        self.start_time = time.time()
+        self.end_time = None
+        if self.output_filename is not None:
+            self._output = open(self.output_filename, 'a')
+        self.process = subprocess.Popen(
+            self.cmd, cwd=self.cwd, stdout=self._output,
+            stderr=subprocess.STDOUT)
+
+    def poll(self):
+        """
+        Return the return code if the job has finished, else None.
+        """
+        returncode = self.process.poll()
+        if returncode is not None:
+            self.returncode = returncode
+            self.end_time = time.time()
+            self.process = None
+            if self._output is not None:
+                self._output.close()
+                self._output = None
+        return returncode
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.poll()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'state': self.state,
+            'attempts': self.attempts,
+            'returncode': self.returncode,
+            'mem': self.mem,
+            'cores': self.cores,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'output_filename': self.output_filename,
+            'cmd': ' '.join(self.cmd)
+        }
+
+
+class LocalScheduler(object):
+    """
+    Parameters
+    ----------
+    max_mem: int, optional
+        MB of memory to use for jobs; defaults to 90% of physical memory.
+    max_cores: int, optional
+        Defaults to the number of cores.
+    max_attempts: int, optional [2]
+        Number of times a job is run before it is marked failed.
+    status_filename: string, optional
+        If given, JSON status of all jobs is written here on every change.
+    poll_interval: float, optional [1]
+        Seconds between checks of running jobs.
+    """
+    def __init__(self, max_mem=None, max_cores=None, max_attempts=2,
+                 status_filename=None, poll_interval=1.):
+        if max_mem is None:
+            max_mem = int(.9 * total_mem_mb())
+        if max_cores is None:
+            max_cores = multiprocessing.cpu_count()
+        self.max_mem = max_mem
+        self.max_cores = max_cores
+        self.max_attempts = max_attempts
+        self.status_filename = status_filename
+        self.poll_interval = poll_interval
+        self.jobs = []
+        self.start_time = None
+
+    def fits(self, job, running):
+        """
+        Return True if job fits next to the running jobs. A job that does not
+        fit into the machine at all is run alone.
+        """
+        if len(running) == 0:
+            return True
+        mem = sum(j.mem for j in running) + job.mem
+        cores = sum(j.cores for j in running) + job.cores
+        return mem <= self.max_mem and cores <= self.max_cores
+
+    def run(self, jobs):
+        """
+        Run jobs to completion.
+
+        Returns
+        -------
+        jobs: list of Job
+            With their final state: 'skipped', 'done' or 'failed'.
+        """
+        self.jobs = jobs
+        self.start_time = time.time()
+        pending = []
+        for job in jobs:
+            if job.done is not None and job.done():
+                job.state = 'skipped'
+            else:
+                pending.append(job)
+        # Largest first, to pack memory well.
+        pending.sort(key=lambda j: (-j.mem, -j.cores))
+        running = []
+        self.write_status()
+
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                changed = False
+                for job in list(running):
+                    returncode = job.poll()
+                    if returncode is None:
+                        continue
+                    running.remove(job)
+                    changed = True
+                    if returncode == 0:
+                        job.state = 'done'
+                    elif job.attempts < self.max_attempts:
+                        job.state = 'pending'
+                        pending.append(job)
+                    else:
+                        job.state = 'failed'
+                    print('{} {} (attempt {}, return code {})'.format(
+                        job.name, job.state, job.attempts, returncode))
+
+                for job in list(pending):
+                    if self.fits(job, running):
+                        pending.remove(job)
+                        job.start()
+                        running.append(job)
+                        changed = True
+                        print('{} started'.format(job.name))
+
+                if changed:
+                    self.write_status()
+                time.sleep(self.poll_interval)
+        finally:
+            for job in running:
+                job.kill()
+                job.state = 'failed'
+            self.write_status()
+        return jobs
+
+    def status(self):
+        counts = {}
+        for job in self.jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        return {
+            'start_time': self.start_time,
+            'update_time': time.time(),
+            'max_mem': self.max_mem,
+            'max_cores': self.max_cores,
+            'counts': counts,
+            'jobs': [job.to_dict() for job in self.jobs]
+        }
+
+    def write_status(self):
+        if self.status_filename is None:
+            return
+        tmp_filename = self.status_filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.status(), f, indent=1)
+        os.rename(tmp_filename, self.status_filename)
+
+
+def python_cmd(script, args):
+    """
+    Return command running a repository script with this interpreter.
+    """
+    return [sys.executable, script] + list(args)
@@ -1,6 +1,10 @@
 import numpy as np
 import pandas
 import sklearn
+import sklearn.linear_model
+import sklearn.cross_validation
+import sklearn.grid_search
+import sklearn.metrics
 import scipy.stats.distributions
 import joblib
 import json
@@ -25,7 +29,7 @@ class StateClassifierImagenet(object):
         self.ds = ds
         self.state = tc.TimelyState(ds.action_dims)
 
-    def plot_weights(self, filename=None):
+    def plot_weights(self, filename=None, plot=None):
         return None
 
     def fit(self, states, labels, num_workers=1, verbose=False):
@@ -53,10 +57,12 @@ class StateClassifier(object):
         self.max_masks = max_masks
         self.has_been_fit = False
 
-    def plot_weights(self, filename=None):
+    def plot_weights(self, filename=None, plot=None):
+        if plot is None:
+            plot = tc.util.plot_weights
         if self.has_been_fit:
             if self.num_clf == 1:
-                fig = tc.util.plot_weights(
+                fig = plot(
                     self.clf.coef_, xlabel='weights on features',
                     ylabel='Classes', filename=filename)
                 return [filename]
@@ -66,7 +72,7 @@ class StateClassifier(object):
                 for i, clf in enumerate(self.clfs):
                     new_filename = '{}_{}{}'.format(filename[:-4], i, filename[-4:])
                     filenames.append(new_filename)
-                    fig = tc.util.plot_weights(
+                    fig = plot(
                         clf.coef_, xlabel='Weights on features',
                         ylabel='Classes', filename=new_filename)
                 return filenames
@@ -125,6 +131,7 @@ class StateClassifier(object):
             self.state.slice_array(states, 'bias')
         ))
         y = labels
+        self.X_nbytes = X.nbytes
         self.clf, best_score, best_entropy = self._fit(
             X, y, num_workers, verbose)
         self.has_been_fit = True
@@ -139,6 +146,7 @@ class StateClassifier(object):
             self.state.slice_array(states, 'bias')
         ))
         y = labels
+        self.X_nbytes = X.nbytes
 
         mask = self.state.get_mask(states).astype(bool)
 
@@ -0,0 +1,101 @@
+"""
+Fit several TimelyClassifier configurations on one data source in one
+process, sharing the work they have in common.
+
+All configurations share the train/val split. Through a shared
+tc.cache.MemoryCache, configurations that agree on the settings of a stage
+share its result and go on from a copy of it (see
+TimelyClassifier.cache_key()): those with the same impute_method share the
+imputer fit, and those that also agree on policy_method, random_start,
+batch_size and the first epsilon share the rollouts of the first iteration,
+in which the policy is still random. Those that further agree on the
+classifier settings share its first fit, and diverge from the first policy
+fit on.
+
+Run as a script on a data source pickle and a JSON list of settings, as
+written by tc/run_experiment.py --sweep:
+
+    python tc/sweep.py --log_dirname=<dir> settings.json ds.pickle
+"""
+import json
+import optparse
+import cPickle as pickle
+import numpy as np
+import tc
+
+
+def run_sweep(ds, log_dirname, settings, num_workers, debug_plots=False,
+              force=False, evaluate=True, cache_dirname=None, seed=None):
+    """
+    Parameters
+    ----------
+    ds: tc.DataSource
+    log_dirname: string
+    settings: list of dict
+        Constructor arguments of each TimelyClassifier.
+    num_workers: int
+    debug_plots: bool, optional [False]
+    force: bool, optional [False]
+        As in TimelyClassifier.fit(); results are still shared within the
+        sweep.
+    evaluate: bool, optional [True]
+        If True, also evaluate each TimelyClassifier after fitting it.
+    cache_dirname: string, optional
+        If given, shared results are also stored in a tc.cache.ResultCache
+        here, and, unless force, looked up in it.
+    seed: int, optional
+        If given, the global RNG is seeded with it before each fit, so
+        that results do not depend on the order of settings.
+
+    Returns
+    -------
+    ticls: list of tc.TimelyClassifier
+    """
+    backing = None
+    if cache_dirname is not None:
+        backing = tc.cache.ResultCache(cache_dirname)
+    cache = tc.cache.MemoryCache(backing, read_backing=not force)
+
+    split = None
+    ticls = []
+    for i, config in enumerate(settings):
+        print('\nSweep: fitting {} of {}'.format(i + 1, len(settings)))
+        ticl = tc.TimelyClassifier(ds, log_dirname, **config)
+        ticl.cache = cache
+        if split is None:
+            split = ticl.train_val_split()
+        if seed is not None:
+            np.random.seed(seed)
+        ticl.fit(num_workers, debug_plots, force, split=split)
+        if evaluate:
+            ticl.evaluate(num_workers, force)
+        ticls.append(ticl)
+    print('Sweep cache: {} hits, {} misses'.format(cache.hits, cache.misses))
+    return ticls
+
+
+if __name__ == '__main__':
+    import matplotlib as mpl
+    mpl.use('Agg')
+
+    usage = "usage: %prog [options] <settings_json> <data_source_pickle>"
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('--log_dirname')
+    parser.add_option('--cache_dirname')
+    parser.add_option('--seed', type='int')
+    parser.add_option('--force', action="store_true")
+    parser.add_option('--debug_plots', action="store_true")
+    parser.add_option('--num_workers', type='int', default=1)
+    opts, args = parser.parse_args()
+
+    if len(args) != 2:
+        parser.error("incorrect number of arguments")
+    with open(args[0]) as f:
+        settings = json.load(f)
+    with open(args[1]) as f:
+        ds = pickle.load(f)
+
+    run_sweep(
+        ds, opts.log_dirname, settings, opts.num_workers,
+        bool(opts.debug_plots), bool(opts.force),
+        cache_dirname=opts.cache_dirname, seed=opts.seed)
@@ -0,0 +1,367 @@
+"""
+Class taxonomies as arrays: a DAG of nodes stored as CSR child lists, with
+the set of leaves under each node as a packed bitset.
+
+Leaves are numbered in the order in which they appear in the list of nodes,
+and bit j of a leaf set (in np.unpackbits order) stands for leaf j. All leaf
+sets are computed in one pass over the nodes in reverse topological order,
+so building the taxonomy of the 7404-leaf ImageNet takes seconds, and set
+operations on them are bytewise operations on rows of a uint8 array.
+
+A Taxonomy is compiled once from its source (a networkx graph or metadata
+file) and saved as an uncompressed npz of plain arrays, which load() memory
+maps without unpickling anything or importing networkx:
+
+    taxonomy = tc.taxonomy.compiled(
+        'imagenet_1000_tax.npz', 'imagenet_1000_tax.pickle', compile_func)
+    graph = taxonomy.graph()
+"""
+import os
+import struct
+import zipfile
+import tempfile
+import numpy as np
+import scipy.sparse
+
+# Array properties stored by Taxonomy.save(), besides the node names, words
+# and the CSR arrays of leaf_membership.
+compiled_arrays = [
+    'child_indptr', 'child_indices', 'parent_indptr', 'parent_indices',
+    'order', 'leaves', 'leaf_bits', 'num_leaves', 'heights', 'rewards',
+    'ancestor_bits']
+
+# Number of set bits of each byte value.
+_popcount_table = np.array([bin(i).count('1') for i in range(256)], 'uint8')
+
+
+def popcount(bits):
+    """
+    Return the number of set bits along the last axis of a packed bitset
+    array.
+    """
+    return _popcount_table[bits].sum(-1).astype('int')
+
+
+def pack_rows(indptr, indices, num_cols):
+    """
+    Return the packed bitset rows of a CSR boolean matrix.
+
+    Returns
+    -------
+    bits : (len(indptr) - 1, ceil(num_cols / 8)) ndarray of uint8
+    """
+    num_rows = indptr.shape[0] - 1
+    rows = np.repeat(np.arange(num_rows), np.diff(indptr))
+    bits = np.zeros((num_rows, (num_cols + 7) // 8), dtype='uint8')
+    np.bitwise_or.at(
+        bits, (rows, indices >> 3), (128 >> (indices & 7)).astype('uint8'))
+    return bits
+
+
+def load_npz(filename, mmap_mode='r'):
+    """
+    Return dict of the arrays in an npz file, memory mapping those stored
+    uncompressed, as np.savez() does, and reading the rest.
+    """
+    arrays = {}
+    npz = np.load(filename)
+    with zipfile.ZipFile(filename) as zf:
+        infos = zf.infolist()
+    with open(filename, 'rb') as f:
+        for info in infos:
+            name = info.filename[:-len('.npy')]
+            if mmap_mode is None or info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = npz[name]
+                continue
+            # Skip the local file header to the .npy data.
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran_order, dtype = header
+            if dtype.hasobject or np.prod(shape) == 0:
+                arrays[name] = npz[name]
+                continue
+            arrays[name] = np.memmap(
+                filename, dtype=dtype, mode=mmap_mode, offset=f.tell(),
+                shape=shape, order='F' if fortran_order else 'C')
+    npz.close()
+    return arrays
+
+
+def compiled(filename, source_filename, compile_func):
+    """
+    Load the compiled Taxonomy, first compiling it with compile_func() and
+    saving it to filename if it does not exist or is older than its source.
+    Without the source, as when only compiled files are shipped, the
+    compiled file is used as is.
+    """
+    if (not os.path.exists(filename) or (
+            os.path.exists(source_filename) and
+            os.path.getmtime(source_filename) > os.path.getmtime(filename))):
+        compile_func().save(filename)
+    return Taxonomy.load(filename)
+
+
+def topological_order(indptr, indices):
+    """
+    Return the node indices ordered so that every node comes before its
+    children.
+
+    Parameters
+    ----------
+    indptr, indices : ndarray of int
+        CSR child lists: the children of node i are
+        indices[indptr[i]:indptr[i + 1]].
+
+    Returns
+    -------
+    order : ndarray of int
+    """
+    N = indptr.shape[0] - 1
+    in_degree = np.bincount(indices, minlength=N)
+    stack = list(np.flatnonzero(in_degree == 0)[::-1])
+    order = []
+    while len(stack) > 0:
+        node = stack.pop()
+        order.append(node)
+        children = indices[indptr[node]:indptr[node + 1]]
+        in_degree[children] -= 1
+        stack += list(children[in_degree[children] == 0][::-1])
+    if len(order) != N:
+        raise ValueError('The graph has cycles.')
+    return np.array(order, dtype='int')
+
+
+class Taxonomy(object):
+    """
+    Parameters
+    ----------
+    nodes : list
+        Node names.
+    edges : list of (parent, child) tuples of node names
+    heights : list of int, optional
+        By default, the length of the longest path down to a leaf.
+    words : list of string, optional
+        Descriptions of the nodes.
+
+    Properties
+    ----------
+    index : dict of node name to int
+    child_indptr, child_indices : ndarray of int
+        CSR child lists, see topological_order().
+    parent_indptr, parent_indices : ndarray of int
+        CSR parent lists.
+    order : ndarray of int
+        Node indices in topological order.
+    leaves : (L,) ndarray of int
+        Indices of the nodes without children, in node order.
+    leaf_bits : (N, ceil(L / 8)) ndarray of uint8
+        Packed set of the leaves under each node.
+    num_leaves : (N,) ndarray of int
+    heights : (N,) ndarray of int
+    rewards : (N,) ndarray of float
+        Information gain of predicting each node: log2(L / num_leaves).
+    leaf_membership : (L, N) scipy.sparse.csr_matrix of float
+        1 where the node is the leaf or one of its ancestors.
+    ancestor_bits : (L, ceil(N / 8)) ndarray of uint8
+        Packed rows of leaf_membership.
+    """
+    def __init__(self, nodes, edges, heights=None, words=None):
+        self.nodes = list(nodes)
+        self.words = None if words is None else list(words)
+        self.index = dict((node, i) for i, node in enumerate(self.nodes))
+        N = len(self.nodes)
+
+        parents = np.array([self.index[p] for p, c in edges], dtype='int')
+        children = np.array([self.index[c] for p, c in edges], dtype='int')
+        self.child_indptr = np.zeros(N + 1, dtype='int')
+        self.child_indptr[1:] = np.cumsum(np.bincount(parents, minlength=N))
+        self.child_indices = children[np.argsort(parents, kind='mergesort')]
+        self.parent_indptr = np.zeros(N + 1, dtype='int')
+        self.parent_indptr[1:] = np.cumsum(np.bincount(children, minlength=N))
+        self.parent_indices = parents[np.argsort(children, kind='mergesort')]
+
+        self.order = topological_order(self.child_indptr, self.child_indices)
+        self.leaves = np.flatnonzero(np.diff(self.child_indptr) == 0)
+        self.leaf_bits = self._compute_leaf_bits()
+        self.num_leaves = popcount(self.leaf_bits)
+
+        if heights is None:
+            self.heights = self._compute_heights()
+        else:
+            self.heights = np.array(heights, dtype='int').flatten()
+        self.rewards = np.log2(float(self.leaves.shape[0]) / self.num_leaves)
+        self.leaf_membership = self._compute_leaf_membership()
+        self.ancestor_bits = pack_rows(
+            self.leaf_membership.indptr, self.leaf_membership.indices, N)
+
+    @classmethod
+    def from_networkx(cls, g, nodes=None):
+        """
+        Parameters
+        ----------
+        g : networkx.DiGraph
+            With edges from parents to children, and optionally 'height' and
+            'word' node attributes.
+        nodes : list, optional
+            All nodes of g, in the order to use; by default, g.nodes().
+        """
+        if nodes is None:
+            nodes = g.nodes()
+        assert(len(nodes) == len(g.nodes()))
+        attributes = {}
+        for key in ['height', 'word']:
+            if all(key in g.node[node] for node in nodes):
+                attributes[key + 's'] = [g.node[node][key] for node in nodes]
+        return cls(nodes, g.edges(), **attributes)
+
+    def to_networkx(self):
+        import networkx as nx
+        g = nx.DiGraph()
+        for i, node in enumerate(self.nodes):
+            g.add_node(node, height=int(self.heights[i]))
+            if self.words is not None:
+                g.node[node]['word'] = self.words[i]
+        for i, node in enumerate(self.nodes):
+            for c in self.child_indices[
+                    self.child_indptr[i]:self.child_indptr[i + 1]]:
+                g.add_edge(node, self.nodes[c])
+        return g
+
+    def save(self, filename):
+        """
+        Write the taxonomy to filename as an uncompressed npz.
+        """
+        arrays = dict((name, getattr(self, name)) for name in compiled_arrays)
+        arrays['leaf_membership_indptr'] = self.leaf_membership.indptr
+        arrays['leaf_membership_indices'] = self.leaf_membership.indices
+        arrays['nodes'] = np.array(_encode(self.nodes))
+        if self.words is not None:
+            arrays['words'] = np.array(_encode(self.words))
+        dirname = os.path.dirname(os.path.abspath(filename))
+        fd, temp_filename = tempfile.mkstemp(dir=dirname, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(temp_filename, filename)
+
+    @classmethod
+    def load(cls, filename, mmap_mode='r'):
+        """
+        Load a taxonomy written by save(), memory mapping its arrays.
+        """
+        arrays = load_npz(filename, mmap_mode)
+        taxonomy = cls.__new__(cls)
+        taxonomy.nodes = arrays['nodes'].tolist()
+        taxonomy.words = None
+        if 'words' in arrays:
+            taxonomy.words = [w.decode('utf-8') for w in arrays['words']]
+        taxonomy.index = dict(
+            (node, i) for i, node in enumerate(taxonomy.nodes))
+        for name in compiled_arrays:
+            setattr(taxonomy, name, arrays[name])
+        indices = arrays['leaf_membership_indices']
+        taxonomy.leaf_membership = scipy.sparse.csr_matrix(
+            (np.ones(indices.shape[0]), indices,
+             arrays['leaf_membership_indptr']),
+            shape=(taxonomy.leaves.shape[0], len(taxonomy.nodes)))
+        return taxonomy
+
+    def graph(self):
+        """
+        Return the graph dict used by tc.hedging and the ImageNet data
+        sources.
+        """
+        return {
+            'nodes': self.nodes, 'words': self.words,
+            'heights': np.asarray(self.heights),
+            'rewards': np.asarray(self.rewards),
+            'leaf_membership': self.leaf_membership, 'taxonomy': self}
+
+    def _compute_leaf_bits(self):
+        L = self.leaves.shape[0]
+        bits = np.zeros((len(self.nodes), (L + 7) // 8), dtype='uint8')
+        leaf_inds = np.arange(L)
+        bits[self.leaves, leaf_inds >> 3] = 128 >> (leaf_inds & 7)
+        indptr, indices = self.child_indptr, self.child_indices
+        for node in self.order[::-1]:
+            if indptr[node + 1] > indptr[node]:
+                bits[node] = np.bitwise_or.reduce(
+                    bits[indices[indptr[node]:indptr[node + 1]]], axis=0)
+        return bits
+
+    def _compute_heights(self):
+        heights = np.zeros(len(self.nodes), dtype='int')
+        indptr, indices = self.child_indptr, self.child_indices
+        for node in self.order[::-1]:
+            if indptr[node + 1] > indptr[node]:
+                heights[node] = heights[
+                    indices[indptr[node]:indptr[node + 1]]].max() + 1
+        return heights
+
+    def _compute_leaf_membership(self, chunk_size=1024):
+        L = self.leaves.shape[0]
+        N = len(self.nodes)
+        leaf_inds = []
+        node_inds = []
+        for start in xrange(0, N, chunk_size):
+            bits = np.unpackbits(
+                self.leaf_bits[start:start + chunk_size], axis=1)[:, :L]
+            nodes, leaves = np.nonzero(bits)
+            node_inds.append(nodes + start)
+            leaf_inds.append(leaves)
+        leaf_inds = np.concatenate(leaf_inds)
+        node_inds = np.concatenate(node_inds)
+        return scipy.sparse.csr_matrix(
+            (np.ones(leaf_inds.shape[0]), (leaf_inds, node_inds)),
+            shape=(L, N))
+
+    def leaf_inds(self, bits):
+        """
+        Return the indices into leaves of the members of a packed leaf set.
+        """
+        return np.flatnonzero(np.unpackbits(bits)[:self.leaves.shape[0]])
+
+    def leaf_names(self, bits):
+        return [self.nodes[i] for i in self.leaves[self.leaf_inds(bits)]]
+
+    def select_groups_by_size(self, max_leaves):
+        """
+        Partition the leaves into groups under single nodes: repeatedly
+        select the node with the most remaining leaves, but no more than
+        max_leaves, and remove its leaves from all nodes.
+
+        Remaining leaf counts are updated incrementally, by the number of
+        removed leaves under each node.
+
+        Parameters
+        ----------
+        max_leaves : int
+
+        Returns
+        -------
+        selected_groups : list of (node name, set of leaf node names) tuples
+        """
+        if max_leaves < 1:
+            raise ValueError('max_leaves must be positive.')
+        remaining = np.bitwise_or.reduce(self.leaf_bits, axis=0)
+        counts = self.num_leaves.copy()
+        selected_groups = []
+        while np.any(remaining):
+            candidates = np.flatnonzero((counts > 0) & (counts <= max_leaves))
+            node = candidates[np.argmax(counts[candidates])]
+            selected = self.leaf_bits[node] & remaining
+            remaining &= ~selected
+            counts -= popcount(self.leaf_bits & selected)
+            selected_groups.append(
+                (self.nodes[node], set(self.leaf_names(selected))))
+        return selected_groups
+
+
+def _encode(strings):
+    return [s.encode('utf-8') if isinstance(s, unicode) else s
+            for s in strings]
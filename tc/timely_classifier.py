@@ -4,6 +4,7 @@ import json
 from collections import OrderedDict
 import os
 import operator
+import time
 from sklearn.cross_validation import train_test_split
 import tempfile
 import cPickle as pickle
@@ -11,6 +12,8 @@ from joblib import Parallel, delayed
 import types
 import tc
 
+CHECKPOINT_VERSION = 1
+
 
 class TimelyClassifier(object):
     """
@@ -82,6 +85,11 @@ class TimelyClassifier(object):
         ground truth labels.
 
     impute_method: string in ['0', 'mean', 'gaussian']
+
+    cache_dirname: string, optional
+        If given, fit() results and intermediate artifacts are stored in a
+        tc.cache.ResultCache here, and reused by experiments that share
+        them. See cache_key().
     """
     def __init__(self, data_source, log_dirname=None,
                  max_iter=5, min_iter=2, batch_size=.25,
@@ -90,7 +98,8 @@ class TimelyClassifier(object):
                  rewards_mode='auc', rewards_loss='infogain', gamma=1,
                  epsilons_mode='exp', normalize_reward_locally=False,
                  num_clf=1, clf_method='logreg', add_fully_observed=False,
-                 loss='zero_one', impute_method='0', **args):
+                 loss='zero_one', impute_method='0', cache_dirname=None,
+                 **args):
         def check_null(x):
             return x is None or isinstance(x, types.FloatType) and np.isnan(x)
         FINAL_ITER_EPSILON = 0.01
@@ -226,6 +235,10 @@ class TimelyClassifier(object):
         self.report.info = self.__config__()
         self.has_been_fit = False
 
+        self.cache = None
+        if cache_dirname is not None:
+            self.cache = tc.cache.ResultCache(cache_dirname)
+
     def save(self):
         """
         Save self to canonical location.
@@ -235,6 +248,146 @@ class TimelyClassifier(object):
             pickle.dump(self, f, protocol=2)
         return pickle_filename
 
+    @property
+    def checkpoint_filename(self):
+        return os.path.join(self.logging_dirname, 'fit_checkpoint.npz')
+
+    def write_checkpoint(self, iteration, buffers):
+        """
+        Atomically write everything fit() needs to resume after the given
+        iteration: the experience buffers, the policy, classifier and imputer,
+        the report so far, and the state of the global RNG.
+
+        The buffers are stored as uncompressed arrays and everything else is
+        pickled into the same file, which replaces the previous checkpoint
+        only once fully written.
+
+        Parameters
+        ----------
+        iteration: int
+        buffers: dict of string to ndarray or None
+        """
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'iteration': iteration,
+            'policy': self.policy,
+            'classifier': self.classifier,
+            'imputer': self.imputer,
+            'report_iterations': self.report.iterations,
+            'rng_state': np.random.get_state()
+        }
+        arrays = dict((k, v) for k, v in buffers.iteritems() if v is not None)
+        arrays['_state'] = np.frombuffer(
+            pickle.dumps(state, protocol=2), dtype='uint8')
+        tmp_filename = self.checkpoint_filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_filename, self.checkpoint_filename)
+
+    def load_checkpoint(self):
+        """
+        Restore the state written by write_checkpoint().
+
+        Returns
+        -------
+        iteration: int
+            The last completed iteration.
+        buffers: dict of string to ndarray
+        """
+        data = np.load(self.checkpoint_filename)
+        try:
+            state = pickle.loads(data['_state'].tostring())
+            buffers = dict((k, data[k]) for k in data.files if k != '_state')
+        finally:
+            data.close()
+        if state['version'] != CHECKPOINT_VERSION:
+            raise Exception('Unsupported checkpoint version {}'.format(
+                state['version']))
+        self.policy = state['policy']
+        self.classifier = state['classifier']
+        self.imputer = state['imputer']
+        self.report.iterations = state['report_iterations']
+        np.random.set_state(state['rng_state'])
+        return state['iteration'], buffers
+
+    def cache_key(self, stage):
+        """
+        Return the key in self.cache of an artifact of fit(), or None if it
+        is not cached. Each key covers only the settings its stage depends on.
+
+        Parameters
+        ----------
+        stage: string in ['fit', 'imputer', 'rollouts_0', 'classifier_0']
+            'fit': everything fit() learns, keyed by the full configuration.
+            'imputer': the imputer, fit on the training instances.
+            'rollouts_0': the instance subsets and rollouts of the first
+            iteration, which only depend on the policy settings while the
+            policy is random.
+            'classifier_0': the classifier learned on those rollouts.
+        """
+        if getattr(self, 'cache', None) is None:
+            return None
+        if stage == 'fit':
+            settings = self.__config__()
+            del settings['logging_dirname'], settings['policy']
+        elif stage == 'imputer':
+            if self.imputer is None:
+                return None
+            settings = {'impute_method': self.impute_method}
+        elif stage in ['rollouts_0', 'classifier_0']:
+            random_policy = (
+                isinstance(self.policy, tc.policy.RandomPolicy) or
+                isinstance(self.policy, tc.policy.LinearPolicy) and
+                not self.policy.has_been_fit)
+            if not random_policy or self.epsilons is None:
+                return None
+            settings = {
+                'policy_method': self.policy_method,
+                'random_start': self.random_start,
+                'epsilon': self.epsilons[0],
+                'batch_size': self.batch_size
+            }
+            if stage == 'classifier_0':
+                settings.update({
+                    'clf_method': self.clf_method,
+                    'num_clf': self.num_clf,
+                    'add_fully_observed': self.add_fully_observed,
+                    'impute_method': self.impute_method
+                })
+        else:
+            raise Exception('Unknown cache stage {}'.format(stage))
+        return self.cache.key(stage, self.ds, settings)
+
+    def cached(self, key, compute):
+        """
+        Return compute(), or its result stored under key in self.cache.
+        If key is None, always compute.
+
+        Returns
+        -------
+        value: object
+        hit: bool
+        """
+        if key is None:
+            return compute(), False
+        value, hit = self.cache.cached(key, compute)
+        if hit:
+            print('Loaded from cache: {}'.format(key))
+        return value, hit
+
+    @property
+    def frozen_filename(self):
+        return os.path.join(self.logging_dirname, 'ticl.frozen')
+
+    def export(self):
+        """
+        Export only what is needed for inference to canonical location.
+        Load with tc.frozen.load().
+        """
+        return tc.frozen.export(self, self.frozen_filename)
+
     @staticmethod
     def get_canonical_name(dictionary):
         relevant_settings = [
@@ -278,40 +431,83 @@ class TimelyClassifier(object):
             ('add_fully_observed', self.add_fully_observed),
         ])
 
+    def __getstate__(self):
+        # The cache is not pickled: a shared in-memory cache holds the
+        # results of other experiments.
+        state = self.__dict__.copy()
+        state['cache'] = None
+        return state
+
     def __repr__(self):
         return json.dumps(self.__config__(), indent=4)
 
     def plot_weights(self, report_dict, name):
         """
-        Plot policy and classifier weights, output figures to logging_dirname,
-        and insert images into report_dict.
+        Plot policy and classifier weights in the background, output figures
+        to logging_dirname, and insert images into report_dict.
         """
+        plot = tc.render.plotter(tc.util.plot_weights)
         policy_filename = os.path.join(
             self.logging_dirname, 'policy_weights_{}.png'.format(name))
-        policy_fig = self.policy.plot_weights(policy_filename)
+        policy_fig = self.policy.plot_weights(policy_filename, plot)
         if policy_fig is not None:
             report_dict['policy_fig'] = self.rel(policy_filename)
 
         clf_filename = os.path.join(
             self.logging_dirname, 'classifier_weights_{}.png'.format(name))
-        clf_filenames = self.classifier.plot_weights(clf_filename)
+        clf_filenames = self.classifier.plot_weights(clf_filename, plot)
         if clf_filenames is not None:
             report_dict['clf_figs'] = [self.rel(n) for n in clf_filenames]
 
+    def plot_trajectories(self, actions, rewards, filename, N=250):
+        """
+        Plot N of the trajectories in the background; see
+        tc.evaluation.plot_trajectories. Only the plotted trajectories are
+        sent to the renderer, sampled without touching the global RNG.
+        """
+        inds = np.random.RandomState(0).permutation(len(actions))[:N]
+        tc.render.submit(
+            filename, tc.evaluation.plot_trajectories,
+            [actions[i] for i in inds], [rewards[i] for i in inds],
+            tc.render.actions_record(self.ds), N=N, filename=filename)
+
+    def plot_performance(self, confidences, labels, loss, cumulative_costs,
+                         ylabel, filename):
+        """
+        Plot the evaluation of confidences in the background; see
+        tc.evaluation.evaluate_performance.
+        """
+        tc.render.submit(
+            filename, tc.evaluation.evaluate_performance,
+            confidences, labels, loss, cumulative_costs, self.ds.max_budget,
+            ylabel, plot_figure=True, plot_filename=filename)
+
     def rel(self, path):
         return os.path.relpath(
             path, os.path.dirname(self.report.html_filename))
 
+    def write_profile(self, profiler, name):
+        """
+        Write the span tree of profiler to logging_dirname/profile_<name>.json
+        and its events to logging_dirname/trace_<name>.json, which can be
+        opened in chrome://tracing, and insert the tree into the report.
+        """
+        profiler.write_json(os.path.join(
+            self.logging_dirname, 'profile_{}.json'.format(name)))
+        profiler.write_chrome_trace(os.path.join(
+            self.logging_dirname, 'trace_{}.json'.format(name)))
+        self.report.profile[name] = profiler.to_dict()
+
     def process_train_to_output_confs(self, num_workers):
         print("Beginning evaluation")
-        t = tc.util.Timer()
+        t = tc.profiling.Profiler()
 
         instances = self.ds.X
         labels = self.ds.y
 
         t.tic('process_instances')
         cumulative_costs, states, actions = \
-            self.process_instances(instances, 0, num_workers)
+            self.process_instances(instances, 0, num_workers, profiler=t)
         confidences = self.classifier.predict_proba(states)
         del states
         section_inds = np.cumsum([len(x) for x in cumulative_costs])
@@ -320,15 +516,13 @@ class TimelyClassifier(object):
 
         # Save confidences and labels
         conf_data_filename = os.path.join(
-            self.logging_dirname, 'train_conf_final_data.pickle')
-        data_to_store = {
-            'confidences': confidences,
-            'labels': labels
-        }
-        with open(conf_data_filename, 'wb') as f:
-            pickle.dump(data_to_store, f, protocol=-1)
+            self.logging_dirname, 'train_conf_final_data.h5')
+        tc.result_store.write_episodes(
+            conf_data_filename,
+            {'confidences': confidences, 'cumulative_costs': cumulative_costs},
+            {'labels': labels}, self.ds)
 
-    def evaluate(self, num_workers, force=False):
+    def evaluate(self, num_workers, force=False, profile=False):
         """
         Evaluate sequential classification on the test instances of self.ds.
 
@@ -344,6 +538,9 @@ class TimelyClassifier(object):
             1-loss value at max_budget.
         force: boolean, optional [False]
             If True, do not check if files exist.
+        profile: boolean, optional [False]
+            If True, also profile policy and state computations in the
+            rollout workers. See write_profile().
         """
         if not force and os.path.exists(self.report.json_filename):
             with open(self.report.json_filename) as f:
@@ -356,15 +553,19 @@ class TimelyClassifier(object):
 
         report = self.report.eval
         print("Beginning evaluation")
-        t = tc.util.Timer()
+        t = tc.profiling.Profiler(detailed=profile)
+        t.tic('evaluation')
+        memory = tc.memory.MemoryLog()
 
         instances = self.ds.X_test
         labels = self.ds.y_test
 
         t.tic('process_instances')
-        cumulative_costs, states, actions = \
-            self.process_instances(instances, 0, num_workers)
+        cumulative_costs, states, actions = self.process_instances(
+            instances, 0, num_workers, profiler=t, memory=memory)
         confidences = self.classifier.predict_proba(states)
+        memory.record(
+            'process_instances', states=states, confidences=confidences)
         del states
         section_inds = np.cumsum([len(x) for x in cumulative_costs])
         confidences = np.split(confidences, section_inds[:-1])
@@ -387,28 +588,22 @@ class TimelyClassifier(object):
 
         # Store data for later re-plotting if needed.
         traj_data_filename = os.path.join(
-            self.logging_dirname, 'trajectories_final_data.pickle')
-        data_to_store = {
-            'actions': subset_actions,
-            'rewards': subset_rewards,
-            'ds': self.ds,
-            'filename': traj_filename
-        }
-        with open(traj_data_filename, 'wb') as f:
-            pickle.dump(data_to_store, f, protocol=-1)
+            self.logging_dirname, 'trajectories_final_data.h5')
+        tc.result_store.write_episodes(
+            traj_data_filename,
+            {'actions': subset_actions, 'rewards': subset_rewards},
+            {'episode_inds': subset_ind}, self.ds,
+            {'filename': traj_filename})
 
         # Save confidences and labels
         conf_data_filename = os.path.join(
-            self.logging_dirname, 'conf_final_data.pickle')
-        data_to_store = {
-            'confidences': confidences,
-            'labels': labels
-        }
-        with open(conf_data_filename, 'wb') as f:
-            pickle.dump(data_to_store, f, protocol=-1)
+            self.logging_dirname, 'conf_final_data.h5')
+        tc.result_store.write_episodes(
+            conf_data_filename,
+            {'confidences': confidences, 'cumulative_costs': cumulative_costs},
+            {'labels': labels}, self.ds)
 
-        tc.evaluation.plot_trajectories(
-            subset_actions, subset_rewards, self.ds, filename=traj_filename)
+        self.plot_trajectories(subset_actions, subset_rewards, traj_filename)
         t.toc('plot_trajectories')
 
         t.tic('plot_weights')
@@ -422,19 +617,26 @@ class TimelyClassifier(object):
             self.logging_dirname, 'evaluation_final.png')
         loss_auc, loss_final, fig = tc.evaluation.evaluate_performance(
             confidences, labels, self.loss, cumulative_costs,
-            self.ds.max_budget, 'Loss', filename=loss_eval_filename,
-            plot_figure=True, plot_filename=loss_eval_plot_filename
-        )
+            self.ds.max_budget, 'Loss', filename=loss_eval_filename)
+        self.plot_performance(
+            confidences, labels, self.loss, cumulative_costs, 'Loss',
+            loss_eval_plot_filename)
 
         entropy_eval_filename = os.path.join(
             self.logging_dirname, 'entropy_evaluation_final.png')
         entropy_auc, entropy_final, fig = tc.evaluation.evaluate_performance(
             confidences, labels, self.info_loss, cumulative_costs,
-            self.ds.max_budget, 'Entropy',
-            plot_figure=True, plot_filename=entropy_eval_filename)
+            self.ds.max_budget, 'Entropy')
+        self.plot_performance(
+            confidences, labels, self.info_loss, cumulative_costs, 'Entropy',
+            entropy_eval_filename)
         t.toc('evaluate')
 
-        report['times'] = t.report()
+        report['times'] = t.last_times()
+        memory.record('evaluate')
+        report['memory'] = memory.to_dict()
+        t.toc('evaluation')
+        self.write_profile(t, 'evaluation')
 
         report['perf'] = {
             'eval_N': instances.shape[0],
@@ -447,12 +649,53 @@ class TimelyClassifier(object):
         report['loss_eval_fig'] = self.rel(loss_eval_plot_filename)
         report['entropy_eval_fig'] = self.rel(entropy_eval_filename)
         report['traj_fig'] = self.rel(traj_filename)
-        self.report.write()
+        self.report.write_async()
         self.save()
+        # Have all results on disk on return.
+        tc.render.flush()
         return loss_auc, loss_final
 
+    def predict_proba(self, states):
+        """
+        Return multi-class confidences for the given states, imputing
+        unobserved values first if an imputer was fit in training.
+
+        Parameters
+        ----------
+        states: (N, S) ndarray
+
+        Returns
+        -------
+        confidences: (N, K) ndarray
+        """
+        if self.imputer is not None and self.imputer.has_been_fit:
+            states = self.imputer.impute(states)
+        return self.classifier.predict_proba(states)
+
+    def predict_anytime(self, instance_or_feature_provider, budget=None,
+                        deadline=None):
+        """
+        Return generator of (action_ind, cumulative_cost, confidences) for
+        a single instance, yielded after every action taken by the greedy
+        policy. See tc.anytime.anytime_classify_instance.
+
+        Parameters
+        ----------
+        instance_or_feature_provider: (D,) ndarray or callable
+            Fully-observed feature vector, or callable mapping an action
+            index to the observations of that action.
+        budget: float, optional
+            Defaults to self.ds.max_budget.
+        deadline: float, optional
+            Wall-clock seconds after which no new actions are started.
+        """
+        return tc.anytime.anytime_classify_instance(
+            instance_or_feature_provider, self.ds, self.policy,
+            self.predict_proba, self.state, budget, deadline)
+
     def process_instances(
-            self, instances, epsilon, num_workers, random_start=False):
+            self, instances, epsilon, num_workers, random_start=False,
+            profiler=None, memory=None):
         """
         Execute current policy and classifier on the instances.
 
@@ -466,6 +709,13 @@ class TimelyClassifier(object):
         epsilon: float
         num_workers: int
         random_start: bool, optional [False]
+        profiler: tc.profiling.Profiler, optional
+            If given, rollouts and state gathering are timed. If it is
+            detailed, so is the work in each worker, and the time spent
+            outside of workers is recorded as ipc_and_scheduling.
+        memory: tc.memory.MemoryLog, optional
+            If given, the sizes of the results of all workers and of the
+            largest worker are recorded.
 
         Returns
         -------
@@ -473,31 +723,53 @@ class TimelyClassifier(object):
         states: (N,F) ndarray
         actions: (N,) list of (?,) ndarray
         """
+        if profiler is None:
+            profiler = tc.profiling.NULL_PROFILER
         common_args = [self.ds, self.policy, epsilon, self.state, random_start]
         chunks = np.array_split(instances, num_workers)
         all_args = [[chunk] + common_args for chunk in chunks]
 
-        results = Parallel(n_jobs=num_workers, pre_dispatch=num_workers * 2)(
-            delayed(mp_classify_instances)(args)
-            for args in all_args
-        )
+        with profiler.span('rollouts'):
+            t = time.time()
+            outputs = Parallel(
+                n_jobs=num_workers, pre_dispatch=num_workers * 2)(
+                delayed(mp_classify_instances)(args, profiler.detailed)
+                for args in all_args
+            )
+            elapsed = time.time() - t
+            if profiler.detailed:
+                for w, (_, worker_profile) in enumerate(outputs):
+                    profiler.merge('worker_{}'.format(w), *worker_profile)
+                # Whatever the slowest worker did not spend on instances went
+                # to starting workers and pickling arguments and results.
+                busy = max(o[1][0]['total'] for o in outputs)
+                profiler.add('ipc_and_scheduling', max(0, elapsed - busy))
+        if memory is not None:
+            worker_results = [o[0] for o in outputs]
+            memory.record(
+                'rollouts', worker_results=worker_results,
+                max_worker_results=max(
+                    tc.memory.nbytes(r) for r in worker_results))
+
         # the above is a list of lists, len == n_jobs
-        results = reduce(operator.add, results)
+        results = reduce(operator.add, [o[0] for o in outputs])
         # now it's a list of tuples, len == number of episodes
 
-        # Efficiently build up the states matrix
-        cumulative_costs = []
-        states = []
-        actions = []
-        for result in results:
-            c, s, a = result
-            cumulative_costs.append(c)
-            actions.append(a)
-        section_inds = np.cumsum([len(x) for x in cumulative_costs])
-        section_inds_aug = np.hstack((0, section_inds))
-        states = np.zeros((section_inds[-1], s.shape[1]))
-        for i in range(len(section_inds_aug) - 1):
-            states[section_inds_aug[i]:section_inds_aug[i + 1]] = results[i][1]
+        with profiler.span('gather_states'):
+            # Efficiently build up the states matrix
+            cumulative_costs = []
+            states = []
+            actions = []
+            for result in results:
+                c, s, a = result
+                cumulative_costs.append(c)
+                actions.append(a)
+            section_inds = np.cumsum([len(x) for x in cumulative_costs])
+            section_inds_aug = np.hstack((0, section_inds))
+            states = np.zeros((section_inds[-1], s.shape[1]))
+            for i in range(len(section_inds_aug) - 1):
+                states[section_inds_aug[i]:section_inds_aug[i + 1]] = \
+                    results[i][1]
 
         return cumulative_costs, states, actions
 
@@ -525,7 +797,16 @@ class TimelyClassifier(object):
             self.gamma, self.rewards_mode,
             self.normalize_reward_locally)
 
-    def fit(self, num_workers, debug_plots=False, force=False):
+    def train_val_split(self):
+        """
+        Return the split of the training instances of self.ds that fit()
+        uses: train_instances, val_instances, train_labels, val_labels.
+        """
+        return train_test_split(
+            self.ds.X, self.ds.y, test_size=0.2, random_state=42)
+
+    def fit(self, num_workers, debug_plots=False, force=False,
+            profile=False, split=None):
         """
         Run episodes using training instances of self.ds to learn the policy
         and classifier estimators.
@@ -552,7 +833,22 @@ class TimelyClassifier(object):
         debug_plots: bool, optional [False]
             Output plots useful for debugging.
         force: boolean, optional [False]
-            If True, do not check if files exist.
+            If True, do not check if files exist, do not resume from a
+            checkpoint, and do not load results from self.cache if it is
+            persistent.
+        profile: boolean, optional [False]
+            If True, also profile policy and state computations in the
+            rollout workers. See write_profile().
+        split: tuple, optional
+            Output of train_val_split(), if already computed, as when fitting
+            several TimelyClassifiers on the same data source.
+
+        A checkpoint is written after every iteration, and fit resumes from
+        it after the last complete iteration if interrupted.
+
+        If self.cache is set, the learned policy, classifier and imputer are
+        stored in it, as are the imputer and the first iteration's rollouts
+        and classifier; see cache_key().
         """
         def append(aggregate_arr, arr, i):
             """
@@ -576,9 +872,18 @@ class TimelyClassifier(object):
         print('\nLogging to {}'.format(self.logging_dirname))
         filename = os.path.join(self.logging_dirname, 'ticl.pickle')
         if not force and os.path.exists(filename):
-            with open(filename) as f:
-                ticl = pickle.load(f)
-            if ticl.has_been_fit is True:
+            # The frozen model is only exported once fitting is done, so its
+            # header tells us whether the full pickle is worth loading.
+            if os.path.exists(self.frozen_filename):
+                meta, _ = tc.frozen.read(self.frozen_filename)
+                ticl = None
+                if meta['has_been_fit']:
+                    with open(filename) as f:
+                        ticl = pickle.load(f)
+            else:
+                with open(filename) as f:
+                    ticl = pickle.load(f)
+            if ticl is not None and ticl.has_been_fit is True:
                 print("\nLoading existing TimelyClassifier.")
                 self.policy = ticl.policy
                 self.classifier = ticl.classifier
@@ -586,50 +891,113 @@ class TimelyClassifier(object):
                 self.report = ticl.report
                 return
 
+        # A cache that lives only in this process holds nothing computed
+        # before a forced refit.
+        read_cache = not force or not getattr(self.cache, 'persistent', True)
+        fit_key = self.cache_key('fit')
+        if read_cache and fit_key is not None:
+            fit_result = self.cache.get(fit_key)
+            if fit_result is not None:
+                print('\nLoading fit from cache: {}'.format(fit_key))
+                self.policy = fit_result['policy']
+                self.classifier = fit_result['classifier']
+                self.imputer = fit_result['imputer']
+                self.report.iterations = fit_result['report_iterations']
+                self.report.profile = fit_result['profile']
+                self.report.write_async()
+                self.finish_fit()
+                return
+
         print(str(self))
         print('Using {} workers.'.format(num_workers))
-        train_instances, val_instances, train_labels, val_labels = \
-            train_test_split(
-                self.ds.X, self.ds.y, test_size=0.2, random_state=42)
+        if split is None:
+            split = self.train_val_split()
+        train_instances, val_instances, train_labels, val_labels = split
 
-        t = tc.util.Timer()
+        t = tc.profiling.Profiler(detailed=profile)
+        t.tic('fit')
         N = train_instances.shape[0]
         N_val = val_instances.shape[0]
         batch_size = min(int(self.batch_size * N), N)
         val_batch_size = min(int(self.batch_size * N_val), N_val)
         all_states = all_expanded_labels = all_actions = all_rewards = None
-        for i in range(self.max_iter):
+        start_iter = 0
+        if not force and os.path.exists(self.checkpoint_filename):
+            iteration, buffers = self.load_checkpoint()
+            all_states = buffers.get('all_states')
+            all_expanded_labels = buffers.get('all_expanded_labels')
+            all_actions = buffers.get('all_actions')
+            all_rewards = buffers.get('all_rewards')
+            start_iter = iteration + 1
+            print('Resuming from checkpoint after iteration {}.'.format(
+                iteration))
+
+        cache_keys = {}
+        if read_cache:
+            for stage in ['imputer', 'rollouts_0', 'classifier_0']:
+                cache_keys[stage] = self.cache_key(stage)
+
+        for i in range(start_iter, self.max_iter):
             print('--iteration {}---'.format(i))
 
             report_iter = {}
             self.report.iterations.append(report_iter)
+            t.tic('iteration')
+            memory = tc.memory.MemoryLog()
+            cached_stages = []
 
             t.tic('process_instances')
-            subset_ind = np.random.choice(
-                np.arange(N), batch_size, replace=False)
-            subset_instances = train_instances[subset_ind]
-            subset_labels = train_labels[subset_ind]
 
-            val_subset_ind = np.random.choice(
-                np.arange(N_val), val_batch_size, replace=False)
+            def rollouts():
+                subset_ind = np.random.choice(
+                    np.arange(N), batch_size, replace=False)
+                val_subset_ind = np.random.choice(
+                    np.arange(N_val), val_batch_size, replace=False)
+                outputs = self.process_instances(
+                    train_instances[subset_ind], self.epsilons[i],
+                    num_workers, self.random_start, t, memory)
+                val_outputs = self.process_instances(
+                    val_instances[val_subset_ind], 0, num_workers, False, t,
+                    memory)
+                return {
+                    'subset_ind': subset_ind,
+                    'val_subset_ind': val_subset_ind,
+                    'outputs': outputs,
+                    'val_outputs': val_outputs,
+                    'rng_state': np.random.get_state()
+                }
+            result, hit = self.cached(
+                cache_keys.get('rollouts_0') if i == 0 else None, rollouts)
+            if hit:
+                cached_stages.append('rollouts')
+                # Continue with the random draws of the run that stored them.
+                np.random.set_state(result['rng_state'])
+            subset_ind = result['subset_ind']
+            subset_labels = train_labels[subset_ind]
+            val_subset_ind = result['val_subset_ind']
             val_subset_instances = val_instances[val_subset_ind]
             val_subset_labels = val_labels[val_subset_ind]
-
-            cumulative_costs, states, actions = self.process_instances(
-                subset_instances, self.epsilons[i], num_workers,
-                self.random_start)
-
+            cumulative_costs, states, actions = result['outputs']
             val_cumulative_costs, val_states, val_actions = \
-                self.process_instances(
-                    val_subset_instances, 0, num_workers, False)
+                result['val_outputs']
+            del result
+            memory.record(
+                'process_instances', states=states, val_states=val_states)
             t.toc('process_instances')
 
             t.tic('impute_states')
             if self.imputer is not None:
                 if not self.imputer.has_been_fit:
-                    self.imputer.fit(train_instances)
+                    def fit_imputer():
+                        self.imputer.fit(train_instances)
+                        return self.imputer
+                    self.imputer, hit = self.cached(
+                        cache_keys.get('imputer'), fit_imputer)
+                    if hit:
+                        cached_stages.append('imputer')
                 states = self.imputer.impute(states)
                 val_states = self.imputer.impute(val_states)
+            memory.record('impute_states')
             t.toc('impute_states')
 
             t.tic('learn_classifier')
@@ -644,22 +1012,41 @@ class TimelyClassifier(object):
             val_expanded_labels = np.repeat(
                 val_subset_labels, val_num_states_per_instance)
 
-            if self.clf_method == 'logreg':
-                acc, entropy = self.classifier.fit(
-                    all_states, all_expanded_labels, num_workers)
-            elif self.clf_method == 'imagenet':
-                acc = self.classifier.score(val_states, val_expanded_labels)
-            else:
-                acc = self.classifier.fit(
-                    all_states, all_expanded_labels,
-                    train_instances, train_labels,
-                    val_states, val_expanded_labels,
-                    self.add_fully_observed, num_workers / 2)
+            def learn_classifier():
+                if self.clf_method == 'logreg':
+                    acc, entropy = self.classifier.fit(
+                        all_states, all_expanded_labels, num_workers)
+                elif self.clf_method == 'imagenet':
+                    acc = self.classifier.score(
+                        val_states, val_expanded_labels)
+                else:
+                    acc = self.classifier.fit(
+                        all_states, all_expanded_labels,
+                        train_instances, train_labels,
+                        val_states, val_expanded_labels,
+                        self.add_fully_observed, num_workers / 2)
+                return {
+                    'classifier': self.classifier,
+                    'acc': acc,
+                    'rng_state': np.random.get_state()
+                }
+            result, hit = self.cached(
+                cache_keys.get('classifier_0') if i == 0 else None,
+                learn_classifier)
+            if hit:
+                cached_stages.append('classifier')
+                self.classifier = result['classifier']
+                np.random.set_state(result['rng_state'])
+            acc = result['acc']
+            del result
 
             report_iter['perf'] = {
                 'num_states': all_states.shape[0],
                 'classifier_error': np.round(1 - acc, 3)
             }
+            memory.record(
+                'learn_classifier', all_states=all_states,
+                X=getattr(self.classifier, 'X_nbytes', None))
             t.toc('learn_classifier')
 
             t.tic('compute_confidences')
@@ -673,6 +1060,9 @@ class TimelyClassifier(object):
             val_section_inds = np.cumsum(
                 [len(x) for x in val_cumulative_costs])
             val_confidences = np.split(val_confidences, val_section_inds[:-1])
+            memory.record(
+                'compute_confidences', confidences=confidences,
+                val_confidences=val_confidences)
             t.qtoc('compute_confidences')
 
             t.tic('compute_rewards')
@@ -694,15 +1084,13 @@ class TimelyClassifier(object):
                 traj_filename = os.path.join(
                     self.logging_dirname,
                     'trajectories_iter_{:d}.png'.format(i))
-                tc.evaluation.plot_trajectories(
-                    actions, rewards, self.ds, filename=traj_filename)
+                self.plot_trajectories(actions, rewards, traj_filename)
                 report_iter['traj_fig'] = self.rel(traj_filename)
 
                 traj_filename = os.path.join(
                     self.logging_dirname,
                     'trajectories_val_iter_{:d}.png'.format(i))
-                tc.evaluation.plot_trajectories(
-                    val_actions, val_rewards, self.ds, filename=traj_filename)
+                self.plot_trajectories(val_actions, val_rewards, traj_filename)
                 report_iter['traj_val_fig'] = self.rel(traj_filename)
             t.qtoc('plot_trajectories')
 
@@ -714,23 +1102,24 @@ class TimelyClassifier(object):
             t.tic('evaluate')
             loss_eval_filename = os.path.join(
                 self.logging_dirname, 'evaluation_iter_{:d}.png'.format(i))
-            loss_auc, loss_final, loss_eval_fig = \
-                tc.evaluation.evaluate_performance(
-                    confidences, subset_labels, self.loss, cumulative_costs,
-                    self.ds.max_budget, 'Loss',
-                    plot_figure=debug_plots, plot_filename=loss_eval_filename)
-            if loss_eval_fig is not None:
-                report_iter['loss_eval_fig'] = self.rel(loss_eval_filename)
+            loss_auc, loss_final, _ = tc.evaluation.evaluate_performance(
+                confidences, subset_labels, self.loss, cumulative_costs,
+                self.ds.max_budget, 'Loss')
 
             entropy_eval_filename = os.path.join(
                 self.logging_dirname, 'entropy_iter_{:d}.png'.format(i))
-            entropy_auc, entropy_final, entropy_eval_fig = \
+            entropy_auc, entropy_final, _ = \
                 tc.evaluation.evaluate_performance(
                     confidences, subset_labels, self.info_loss,
-                    cumulative_costs, self.ds.max_budget, 'Entropy',
-                    plot_figure=debug_plots,
-                    plot_filename=entropy_eval_filename)
-            if entropy_eval_fig is not None:
+                    cumulative_costs, self.ds.max_budget, 'Entropy')
+            if debug_plots:
+                self.plot_performance(
+                    confidences, subset_labels, self.loss, cumulative_costs,
+                    'Loss', loss_eval_filename)
+                report_iter['loss_eval_fig'] = self.rel(loss_eval_filename)
+                self.plot_performance(
+                    confidences, subset_labels, self.info_loss,
+                    cumulative_costs, 'Entropy', entropy_eval_filename)
                 report_iter['entropy_eval_fig'] = self.rel(
                     entropy_eval_filename)
             report_iter['perf'].update({
@@ -747,12 +1136,16 @@ class TimelyClassifier(object):
             mse = self.policy.fit(
                 all_states, all_actions, all_rewards, num_workers)
             report_iter['perf']['policy_mse'] = np.round(mse, 3)
+            memory.record(
+                'learn_policy', all_actions=all_actions,
+                all_rewards=all_rewards)
             t.toc('learn_policy')
 
             # Check if the actions we take changed with the retrained policy
             t.tic('val_policy')
             new_val_cumulative_costs, new_val_states, new_val_actions = \
-                self.process_instances(val_subset_instances, 0, num_workers)
+                self.process_instances(
+                    val_subset_instances, 0, num_workers, profiler=t)
             assert(len(val_actions) == len(new_val_actions))
             fraction_same = np.sum([
                 np.all(a == b) for a, b in zip(val_actions, new_val_actions)])
@@ -762,25 +1155,80 @@ class TimelyClassifier(object):
             report_iter['perf']['fraction_same'] = fraction_same
             t.toc('val_policy')
 
-            report_iter['times'] = t.report()
-            self.report.write()
+            report_iter['times'] = t.last_times()
+            report_iter['memory'] = memory.to_dict()
+            if len(cached_stages) > 0:
+                report_iter['cached'] = cached_stages
+            t.toc('iteration')
+            self.report.profile['fit'] = t.to_dict()
+            self.report.write_async()
 
             if i >= self.min_iter and fraction_same > 0.95:
                 break
 
-            self.save()
-
-        del all_states, all_expanded_labels, all_actions, all_rewards
+            t.tic('write_checkpoint')
+            self.write_checkpoint(i, {
+                'all_states': all_states,
+                'all_expanded_labels': all_expanded_labels,
+                'all_actions': all_actions,
+                'all_rewards': all_rewards})
+            t.toc('write_checkpoint')
+
+        t.toc('fit')
+        self.write_profile(t, 'fit')
+        # Release the buffers (nested functions refer to them, so no del).
+        all_states = all_expanded_labels = all_actions = all_rewards = None
+        if fit_key is not None:
+            self.cache.put(fit_key, {
+                'policy': self.policy,
+                'classifier': self.classifier,
+                'imputer': self.imputer,
+                'report_iterations': self.report.iterations,
+                'profile': self.report.profile
+            })
+        self.finish_fit()
+
+    def finish_fit(self):
+        """
+        Mark self as fit, save it, remove the fit checkpoint and export the
+        frozen model.
+        """
         self.has_been_fit = True
         self.save()
+        if os.path.exists(self.checkpoint_filename):
+            os.remove(self.checkpoint_filename)
+        try:
+            self.export()
+        except Exception as e:
+            print('Could not export frozen model: {}'.format(e))
+
 
+def mp_classify_instances(args, profile=False):
+    """
+    Run classify_instance on a chunk of instances in a worker.
 
-def mp_classify_instances(args):
-    return [classify_instance(instance, *args[1:]) for instance in args[0]]
+    Returns
+    -------
+    results: list of tuples
+        Outputs of classify_instance.
+    profile: (dict, list) or None
+        If profile, the span tree and events of the worker.
+    """
+    if not profile:
+        results = [
+            classify_instance(instance, *args[1:]) for instance in args[0]]
+        return results, None
+    profiler = tc.profiling.Profiler()
+    with profiler.span('classify_instances'):
+        results = [
+            classify_instance(instance, *args[1:], profiler=profiler)
+            for instance in args[0]]
+    return results, (profiler.to_dict(), profiler.events)
 
 
 def classify_instance(
-        instance, ds, policy, epsilon, state, random_start=False):
+        instance, ds, policy, epsilon, state, random_start=False,
+        profiler=None):
     """
     Run sequential classification on a single instance and return record of
     states, actions, and costs.
@@ -794,6 +1242,8 @@ def classify_instance(
         Value for policy.select_action.
     random_start: bool, optional [False]
         If True, initializes state with a random mask.
+    profiler: tc.profiling.Profiler, optional
+        If given, state construction and action selection are timed.
 
     Returns
     -------
@@ -812,8 +1262,11 @@ def classify_instance(
             instance, np.flatnonzero(~mask), norm_cost)
     else:
         state_vector = state.get_initial_state()
+    if profiler is None:
+        profiler = tc.profiling.NULL_PROFILER
 
-    action_ind = policy.select_action(state_vector, epsilon)
+    with profiler.span('select_action'):
+        action_ind = policy.select_action(state_vector, epsilon)
     cumulative_costs = [0]
     states = [state_vector]
     action_inds = [action_ind]
@@ -826,10 +1279,12 @@ def classify_instance(
 
         cumulative_costs.append(new_cumulative_cost)
         norm_cost = float(new_cumulative_cost) / ds.max_budget
-        state_vector = state.get_state(instance, action_inds, norm_cost)
+        with profiler.span('get_state'):
+            state_vector = state.get_state(instance, action_inds, norm_cost)
         states.append(state_vector)
 
-        action_ind = policy.select_action(state_vector, epsilon)
+        with profiler.span('select_action'):
+            action_ind = policy.select_action(state_vector, epsilon)
         action_inds.append(action_ind)
 
     return (np.array(cumulative_costs), np.array(states),
@@ -860,10 +1315,12 @@ if __name__ == '__main__':
     parser.add_option('--normalize_reward_locally', action="store_true")
     parser.add_option('--add_fully_observed', action="store_true")
     parser.add_option('--random_start', action="store_true")
+    parser.add_option('--cache_dirname')
 
     # for running fit() and evaluate()
     parser.add_option('--force', action="store_true")
     parser.add_option('--debug_plots', action="store_true")
+    parser.add_option('--profile', action="store_true")
     parser.add_option('--num_workers', type='int', default=1)
     opts, args = parser.parse_args()
 
@@ -878,8 +1335,10 @@ if __name__ == '__main__':
     force = opts.force
     num_workers = opts.num_workers
     debug_plots = opts.debug_plots
+    profile = bool(opts.profile)
     opts = opts.__dict__
     del opts['force'], opts['num_workers'], opts['debug_plots']
+    del opts['profile']
 
     # Leave only actually specified options, so that the constructor can use
     # its default values.
@@ -887,5 +1346,5 @@ if __name__ == '__main__':
     ticl = TimelyClassifier(ds, **opts)
 
     # Run fit and evaluate
-    ticl.fit(num_workers, debug_plots, force)
-    ticl.evaluate(num_workers, force)
+    ticl.fit(num_workers, debug_plots, force, profile)
+    ticl.evaluate(num_workers, force, profile)
@@ -118,19 +118,9 @@ class TimelyState(object):
             True for unobserved features.
         """
         assert(mask.dtype == bool)
-        if mask.ndim == 1:
-            assert(mask.shape[0] == self.F)
-            feature_mask = np.ones(self.D).astype(bool)
-            for ind in np.flatnonzero(~mask):
-                feature_mask[slice(*self.feature_bounds[ind])] = False
-        else:
-            assert(mask.shape[1] == self.F)
-            N = mask.shape[0]
-            feature_mask = np.ones((N, self.D)).astype(bool)
-            for i in xrange(N):
-                for ind in np.flatnonzero(~mask[i]):
-                    feature_mask[i, slice(*self.feature_bounds[ind])] = False
-        return feature_mask
+        assert(mask.shape[-1] == self.F)
+        dims = [end - start for start, end in self.feature_bounds]
+        return np.repeat(mask, dims, axis=mask.ndim - 1)
 
     def get_states_from_mask(self, instances, mask, costs=None):
         """
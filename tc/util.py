@@ -1,4 +1,3 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 import errno
@@ -87,6 +86,7 @@ def plot_weights(weights, xlabel=None, xticks=None, ylabel=None, yticks=None, fi
     -------
     fig: matplotlib figure
     """
+    import matplotlib.pyplot as plt
     fig = plt.figure()
     abs_max_weight = np.max(np.abs(weights))
     plt.matshow(
@@ -0,0 +1,52 @@
+from context import *
+
+
+class TestAnytime(unittest.TestCase):
+    def setUp(self):
+        # Untaken policy that prefers actions in order 2, 0, 1, by weighting
+        # the bias feature. Confidences are the observations themselves.
+        self.ds, self.state, self.policy, self.predict_proba = \
+            frozen_linear_fixture()
+
+    def run_episode(self, instance, **kwargs):
+        return list(tc.anytime.anytime_classify_instance(
+            instance, self.ds, self.policy, self.predict_proba, self.state,
+            **kwargs))
+
+    def test_instance(self):
+        steps = self.run_episode(np.array([.1, .2, .3]))
+        assert([s[0] for s in steps] == [None, 2, 0, 1])
+        assert([s[1] for s in steps] == [0, 3, 4, 6])
+        assert_array_almost_equal(steps[0][2], [0, 0, 0])
+        assert_array_almost_equal(steps[-1][2], [.1, .2, .3])
+
+    def test_budget_and_provider(self):
+        called = []
+
+        def provider(action_ind):
+            called.append(action_ind)
+            return [action_ind + 1]
+
+        steps = self.run_episode(provider, budget=4)
+        assert([s[0] for s in steps] == [None, 2, 0])
+        assert(called == [2, 0])
+        assert_array_almost_equal(steps[-1][2], [1, 0, 3])
+
+    def test_deadline(self):
+        steps = self.run_episode(np.array([.1, .2, .3]), deadline=0)
+        assert(len(steps) == 1)
+
+        # Abandoning the generator keeps the best answer so far.
+        gen = tc.anytime.anytime_classify_instance(
+            np.array([.1, .2, .3]), self.ds, self.policy, self.predict_proba,
+            self.state)
+        best = None
+        for action_ind, cost, confidences in gen:
+            best = confidences
+            if cost >= 3:
+                break
+        assert_array_almost_equal(best, [0, 0, .3])
+
+
+if __name__ == '__main__':
+    unittest.main()
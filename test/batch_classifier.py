@@ -1,7 +1,8 @@
 from context import *
 from sklearn.metrics import accuracy_score
 from sklearn.datasets import make_classification
-import sklearn
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 
 
 class TestBatchClassifier(unittest.TestCase):
@@ -29,16 +30,16 @@ class TestBatchClassifier(unittest.TestCase):
         cls.K = K
         cls.classes = np.arange(K)
 
-    def batch(self, clf_string):
+    def batch(self, estimator):
         """
         Test taking 1, 2, 3, 4 batches.
         Accuracy should stay low.
         """
-        clf = eval(clf_string)
+        clf = clone(estimator)
         clf.fit(self.X, self.y)
         max_acc = accuracy_score(self.y, clf.predict(self.X))
         
-        clf = eval(clf_string)
+        clf = clone(estimator)
         times = []
         accs = []
         for i in range(len(self.splits) - 1):
@@ -58,16 +59,16 @@ class TestBatchClassifier(unittest.TestCase):
         print('Accs:\t{}'.format(np.array(accs)))
         print('Times:\t{}'.format(np.array(times)))
 
-    def sumBatch(self, clf_string):
+    def sumBatch(self, estimator):
         """
         Test taking 1, (1,2), (1,2,3), (1,2,3,4) batches.
         Should lead to high accuracy.
         """
-        clf = eval(clf_string)
+        clf = clone(estimator)
         clf.fit(self.X, self.y)
         max_acc = accuracy_score(self.y, clf.predict(self.X))
 
-        clf = eval(clf_string)
+        clf = clone(estimator)
         times = []
         accs = []
         for i in range(len(self.splits) - 1):
@@ -88,16 +89,16 @@ class TestBatchClassifier(unittest.TestCase):
         print('Times:\t{}'.format(np.array(times)))
 
     def testLogisticBatch(self):
-        self.batch('sklearn.linear_model.LogisticRegression(fit_intercept=False)')
+        self.batch(LogisticRegression(fit_intercept=False))
 
     def testLogisticSumBatch(self):
-        self.sumBatch('sklearn.linear_model.LogisticRegression(fit_intercept=False)')
+        self.sumBatch(LogisticRegression(fit_intercept=False))
 
     def testSGDWarmBatch(self):
-        self.batch('sklearn.linear_model.SGDClassifier(n_jobs=1, alpha=.1, loss="hinge", n_iter=20, fit_intercept=False, shuffle=True, warm_start=True)')
+        self.batch(SGDClassifier(n_jobs=1, alpha=.1, loss="hinge", n_iter=20, fit_intercept=False, shuffle=True, warm_start=True))
 
     def testSGDWarmSumBatch(self):
-        self.sumBatch('sklearn.linear_model.SGDClassifier(n_jobs=1, alpha=.1, loss="hinge", n_iter=20, fit_intercept=False, shuffle=True, warm_start=True)')
+        self.sumBatch(SGDClassifier(n_jobs=1, alpha=.1, loss="hinge", n_iter=20, fit_intercept=False, shuffle=True, warm_start=True))
 
 if __name__ == '__main__':
     unittest.main()
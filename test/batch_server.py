@@ -0,0 +1,47 @@
+from context import *
+
+
+class TestBatchScheduler(unittest.TestCase):
+    def setUp(self):
+        # Policy whose preference depends on the first observation.
+        self.ds, self.state, self.policy, self.predict_proba = \
+            frozen_linear_fixture(first_observation_weights=[0, 10, 0])
+
+    def test_matches_anytime(self):
+        scheduler = tc.batch_server.BatchScheduler(
+            self.ds, self.policy, self.predict_proba, self.state,
+            max_batch_size=4)
+        instances = np.random.rand(10, 3)
+        requests = [scheduler.submit(x) for x in instances]
+        while len(scheduler.active) > 0 or not scheduler.pending.empty():
+            scheduler._admit(block=False)
+            scheduler.tick()
+
+        assert(max(scheduler.batch_sizes) == 4)
+        for instance, request in zip(instances, requests):
+            assert(request.done.is_set())
+            steps = list(tc.anytime.anytime_classify_instance(
+                instance, self.ds, self.policy, self.predict_proba,
+                self.state))
+            assert(request.action_inds == [s[0] for s in steps[1:]])
+            assert(request.cumulative_cost == steps[-1][1])
+            assert_array_almost_equal(request.confidences, steps[-1][2])
+
+    def test_select_actions(self):
+        states = np.array([
+            self.state.get_initial_state(),
+            self.state.get_state([.5, 0, 0], [0, 1, 2], 1.)])
+        assert_array_equal(self.policy.select_actions(states), [2, -1])
+
+    def test_serve(self):
+        scheduler = tc.batch_server.BatchScheduler(
+            self.ds, self.policy, self.predict_proba, self.state).start()
+        stats = tc.batch_server.benchmark(
+            scheduler, np.random.rand(10, 3), 1000, 50)
+        scheduler.stop()
+        assert(stats['num_requests'] == 50)
+        assert(stats['latency_p50'] <= stats['latency_p99'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+from context import *
+import tempfile
+import shutil
+import tc.benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_random_source(self):
+        dirname = tempfile.mkdtemp()
+        ds = tc.benchmark.make_data_source('random', dirname, 40, 8, 4)
+        shutil.rmtree(dirname)
+        assert(ds.action_dims == [2, 2, 2, 2])
+        assert(ds.X.shape == (40, 8) and ds.X_test.shape == (10, 8))
+        assert_almost_equal(ds.max_budget, ds.action_costs.sum() / 2)
+        assert(ds.name.startswith('random_A4_D8_K4_N40_Nt10'))
+
+    def test_compare(self):
+        def case(name, fit_total, states_per_sec):
+            return {
+                'name': name, 'fit': {'total': fit_total},
+                'evaluate': {'process_instances': 1.},
+                'states_per_sec': states_per_sec}
+        baseline = {'cases': [case('a', 10., 1000.), case('b', 10., 1000.)]}
+        results = {'cases': [case('a', 11., 1000.), case('b', 10., 500.),
+                             case('c', 1., 1.)]}
+        rows, regressions = tc.benchmark.compare(results, baseline, 0.2)
+        assert(len(rows) == 6)
+        assert([(r[0], r[1]) for r in regressions] ==
+               [('b', 'states_per_sec')])
+
+
+if __name__ == '__main__':
+    unittest.main()
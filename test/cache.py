@@ -0,0 +1,102 @@
+from context import *
+import tempfile
+import shutil
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        A = 3
+        self.ds = tc.data_sources.Random(
+            range(A), [1] * A, range(2), 40, dirname=self.dirname)
+        self.cache_dirname = os.path.join(self.dirname, 'cache')
+        self.cache = tc.cache.ResultCache(self.cache_dirname)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_get_put(self):
+        key = self.cache.key('test', self.ds, {'a': 1})
+        assert(self.cache.get(key) is None)
+        self.cache.put(key, {'x': np.arange(3)})
+        assert_array_equal(self.cache.get(key)['x'], np.arange(3))
+        assert(self.cache.hits == 1 and self.cache.misses == 1)
+
+        calls = []
+        value, hit = self.cache.cached(key, lambda: calls.append(1))
+        assert(hit and len(calls) == 0)
+
+    def test_memory_cache(self):
+        cache = tc.cache.MemoryCache(self.cache)
+        key = cache.key('test', self.ds, {'a': 1})
+        value = {'x': np.arange(3)}
+        cache.put(key, value)
+        value['x'][0] = 10
+        copy = cache.get(key)
+        assert_array_equal(copy['x'], np.arange(3))
+        copy['x'][1] = 10
+        assert_array_equal(cache.get(key)['x'], np.arange(3))
+        # Also stored in the backing cache.
+        other = tc.cache.MemoryCache(self.cache)
+        assert_array_equal(other.get(key)['x'], np.arange(3))
+        assert(tc.cache.MemoryCache(self.cache, False).get(key) is None)
+
+    def test_key(self):
+        key = self.cache.key('test', self.ds, {'a': 1, 'b': 2})
+        assert(key == self.cache.key('test', self.ds, {'b': 2, 'a': 1}))
+        assert(key != self.cache.key('test', self.ds, {'a': 2, 'b': 2}))
+        assert(key != self.cache.key('other', self.ds, {'a': 1, 'b': 2}))
+        ds = tc.data_sources.Random(
+            range(3), [1] * 3, range(2), 40, dirname=self.dirname)
+        assert(key != self.cache.key('test', ds, {'a': 1, 'b': 2}))
+
+    def test_key_without_budget(self):
+        key = self.cache.key('test', self.ds, {'a': 1}, with_budget=False)
+        budget_key = self.cache.key('test', self.ds, {'a': 1})
+        self.ds.max_budget /= 2.
+        assert(key == self.cache.key('test', self.ds, {'a': 1}, False))
+        assert(budget_key != self.cache.key('test', self.ds, {'a': 1}))
+
+    def test_ticl_keys(self):
+        def keys(**args):
+            ticl = tc.TimelyClassifier(
+                self.ds, self.dirname, cache_dirname=self.cache_dirname,
+                policy_method='linear_untaken', impute_method='mean', **args)
+            return dict((stage, ticl.cache_key(stage)) for stage in [
+                'fit', 'imputer', 'rollouts_0', 'classifier_0'])
+        a = keys(gamma=1., policy_feat='dynamic')
+        b = keys(gamma=0., policy_feat='static')
+        assert(a['fit'] != b['fit'])
+        for stage in ['imputer', 'rollouts_0', 'classifier_0']:
+            assert(a[stage] == b[stage])
+        c = keys(gamma=1., policy_feat='dynamic', clf_method='gnb')
+        assert(a['rollouts_0'] == c['rollouts_0'])
+        assert(a['classifier_0'] != c['classifier_0'])
+
+    def test_fit_reuses_cache(self):
+        args = {'max_iter': 2, 'min_iter': 2, 'batch_size': .5,
+                'impute_method': 'mean', 'cache_dirname': self.cache_dirname}
+        np.random.seed(0)
+        ticl = tc.TimelyClassifier(self.ds, self.dirname, gamma=1., **args)
+        ticl.fit(1)
+        assert('cached' not in ticl.report.iterations[0])
+
+        np.random.seed(0)
+        other = tc.TimelyClassifier(self.ds, self.dirname, gamma=0., **args)
+        other.fit(1)
+        assert(other.report.iterations[0]['cached'] ==
+               ['rollouts', 'imputer', 'classifier'])
+        assert('cached' not in other.report.iterations[1])
+        assert(other.report.iterations[0]['perf']['classifier_error'] ==
+               ticl.report.iterations[0]['perf']['classifier_error'])
+
+        # Same configuration in another log directory: the fit is reused.
+        log_dirname = os.path.join(self.dirname, 'other')
+        again = tc.TimelyClassifier(self.ds, log_dirname, gamma=1., **args)
+        again.fit(1)
+        assert(again.has_been_fit)
+        assert(again.report.iterations == ticl.report.iterations)
+
+
+if __name__ == '__main__':
+    unittest.main()
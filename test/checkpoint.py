@@ -0,0 +1,44 @@
+from context import *
+import tempfile
+import shutil
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        A = 3
+        ds = tc.data_sources.Random(
+            range(A), [1] * A, range(2), 20, dirname=self.dirname)
+        self.ticl = tc.TimelyClassifier(ds, self.dirname)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_round_trip(self):
+        buffers = {
+            'all_states': np.random.rand(10, self.ticl.state.S),
+            'all_actions': np.random.randint(3, size=10),
+            'all_rewards': None}
+        self.ticl.report.iterations.append({'perf': {'loss_auc': .5}})
+        self.ticl.policy.weights = np.ones(3)
+        self.ticl.write_checkpoint(2, buffers)
+        assert(not os.path.exists(self.ticl.checkpoint_filename + '.tmp'))
+        expected_draw = np.random.rand()
+
+        # Clobber the state fit() would restore.
+        self.ticl.report.iterations = []
+        self.ticl.policy = None
+        np.random.rand(5)
+
+        iteration, loaded = self.ticl.load_checkpoint()
+        assert(iteration == 2)
+        assert(sorted(loaded.keys()) == ['all_actions', 'all_states'])
+        assert_array_equal(loaded['all_states'], buffers['all_states'])
+        assert_array_equal(loaded['all_actions'], buffers['all_actions'])
+        assert_array_equal(self.ticl.policy.weights, np.ones(3))
+        assert(self.ticl.report.iterations[0]['perf']['loss_auc'] == .5)
+        assert(np.random.rand() == expected_draw)
+
+
+if __name__ == '__main__':
+    unittest.main()
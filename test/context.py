@@ -12,3 +12,34 @@ import unittest
 import time
 
 import tc
+
+
+def frozen_linear_fixture(action_costs=[1., 2., 3.], max_budget=6,
+                          bias_weights=[2, 1, 3],
+                          first_observation_weights=None):
+    """
+    Random data source with one-dimensional actions, and frozen models whose
+    behavior is easy to follow.
+
+    The untaken policy prefers actions in decreasing order of
+    bias_weights, plus first_observation_weights times the first
+    observation; the confidences are the observations themselves.
+
+    Returns
+    -------
+    ds, state, policy, predict_proba
+    """
+    A = len(action_costs)
+    ds = tc.data_sources.Random(
+        range(A), np.ones(A, dtype='int'), np.arange(A), 10)
+    ds.action_costs = np.array(action_costs, dtype=float)
+    ds.max_budget = max_budget
+    state = tc.TimelyState(ds.action_dims)
+    weights = np.zeros((A, state.S))
+    weights[:, -1] = bias_weights
+    if first_observation_weights is not None:
+        weights[:, state.bounds['observations'][0]] = first_observation_weights
+    policy = tc.frozen.FrozenLinearPolicy(
+        state, weights, np.ones(A, dtype=bool), False, True)
+    predict_proba = tc.frozen.FrozenImagenetClassifier(state).predict_proba
+    return ds, state, policy, predict_proba
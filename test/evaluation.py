@@ -176,4 +176,28 @@ def test_rewards_gain_loss():
         [0, 1, 0], None, identity, cum_costs, 3, 0, 'auc', False)
     assert_array_almost_equal([-5. / 6., .5, 0], actual)
 
+
+def test_trajectory_points():
+    actions = [np.array([2, 0, 1]), np.array([1]), np.array([0, 2])]
+    rewards = [np.array([.1, .2, .3]), np.array([.5]), np.array([-1, 0])]
+    num_actions, x, y, c = tc.evaluation.trajectory_points(actions, rewards)
+    assert_array_equal(num_actions, [2, 0, 1])
+    assert_array_equal(x, [0, 1, 0])
+    assert_array_equal(y, [2, 0, 0])
+    assert_array_almost_equal(c, [.1, .2, -1])
+
+    num_actions, x, y, c = tc.evaluation.trajectory_points(
+        [np.array([1])], [np.array([0.])])
+    assert(x.shape[0] == 0 and c.shape[0] == 0)
+
+
+def test_density_bins():
+    costs = np.array([0, 0, 0, 1, 1])
+    scores = np.array([1, 1, 0, .5, 1])
+    x, y, counts = tc.evaluation.density_bins(costs, scores, num_bins=2)
+    assert_array_equal(x, [0, 0, 1])
+    assert_array_almost_equal(y, [.25, .75, .75])
+    assert_array_equal(counts, [1, 2, 2])
+
+
 # TODO: write tests for local normalization
@@ -0,0 +1,125 @@
+from context import *
+import threading
+
+
+def extractor(action_ind):
+    time.sleep(0.02)
+    return [action_ind + 1]
+
+
+def gated_extractor(started, release, fail=False):
+    """
+    Action 0 finishes only once action 1 has started, and action 1 only once
+    release is set, or fails if fail.
+    """
+    def gated(action_ind):
+        started[action_ind].set()
+        if action_ind == 0:
+            started[1].wait(5)
+        elif action_ind == 1:
+            if fail:
+                raise ValueError('Action 1 failed')
+            release.wait(5)
+        return [action_ind + 1]
+    return gated
+
+
+def failing_extractor(action_ind):
+    if action_ind == 0:
+        raise ValueError('Action 0 failed')
+    return [action_ind + 1]
+
+
+class TestFeatureExecutor(unittest.TestCase):
+    def setUp(self):
+        self.ds, self.state, self.policy, self.predict_proba = \
+            frozen_linear_fixture()
+
+    def test_matches_anytime(self):
+        gt = list(tc.anytime.anytime_classify_instance(
+            extractor, self.ds, self.policy, self.predict_proba, self.state))
+
+        for speculate in [False, True]:
+            executor = tc.feature_executor.FeatureExecutor(3, False, speculate)
+            steps = list(executor.run(
+                extractor, self.ds, self.policy, self.predict_proba,
+                self.state))
+            executor.close()
+
+            assert([s[0] for s in steps] == [s[0] for s in gt])
+            assert([s[1] for s in steps] == [s[1] for s in gt])
+            for s, g in zip(steps, gt):
+                assert_array_almost_equal(s[3], g[2])
+            if speculate:
+                assert(executor.num_speculative == 2)
+                assert(executor.num_hits == 2)
+                assert(executor.num_wasted == 0)
+            else:
+                assert(executor.num_speculative == 0)
+
+    def test_budget_abandons_speculation(self):
+        executor = tc.feature_executor.FeatureExecutor(3)
+        steps = list(executor.run(
+            extractor, self.ds, self.policy, self.predict_proba,
+            self.state, budget=4))
+        executor.close()
+        assert([s[0] for s in steps] == [None, 2, 0])
+        # Action 1 does not fit into the remaining budget after action 2.
+        assert(executor.num_speculative == 1)
+        assert(executor.num_wasted == 0)
+
+    def changed_ranking_fixture(self):
+        # Prefers 0, 1, 2, 3 at first, and 3, 2, 1 once 0 is observed.
+        return frozen_linear_fixture(
+            np.ones(4), 3, [4, 3, 2, 1],
+            first_observation_weights=[0, 0, 8, 10])
+
+    def test_changed_ranking_abandons_speculation(self):
+        ds, state, policy, predict_proba = self.changed_ranking_fixture()
+        started = dict((a, threading.Event()) for a in range(len(ds.actions)))
+        release = threading.Event()
+        gated = gated_extractor(started, release)
+
+        executor = tc.feature_executor.FeatureExecutor(2)
+        for episode in range(2):
+            for event in started.values() + [release]:
+                event.clear()
+            steps = list(executor.run(gated, ds, policy, predict_proba, state))
+            assert([s[0] for s in steps] == [None, 0, 3, 2])
+            # Action 1 was started while 0 ran, and abandoned once 0 was
+            # seen. Action 2 may have been started while 3 ran, and used.
+            assert(started[1].is_set())
+            assert(executor.num_wasted == 1)
+            assert(executor.num_speculative - executor.num_hits == 1)
+
+            # The abandoned task holds its worker until it finishes.
+            assert(executor.num_running == 1)
+            release.set()
+            assert(executor.wait(5))
+            assert(executor.num_running == 0)
+        executor.close()
+
+    def test_speculative_error_ignored(self):
+        ds, state, policy, predict_proba = self.changed_ranking_fixture()
+        started = dict((a, threading.Event()) for a in range(len(ds.actions)))
+        gated = gated_extractor(started, threading.Event(), fail=True)
+
+        # Action 1 fails, but is never selected.
+        executor = tc.feature_executor.FeatureExecutor(2)
+        steps = list(executor.run(gated, ds, policy, predict_proba, state))
+        executor.close()
+        assert([s[0] for s in steps] == [None, 0, 3, 2])
+        assert(executor.num_wasted == 1)
+
+    def test_selected_error_raised(self):
+        for speculate in [False, True]:
+            executor = tc.feature_executor.FeatureExecutor(3, False, speculate)
+            steps = executor.run(
+                failing_extractor, self.ds, self.policy, self.predict_proba,
+                self.state)
+            self.assertRaises(Exception, list, steps)
+            executor.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+from context import *
+import tempfile
+import shutil
+import sklearn.linear_model
+
+
+class TestFrozen(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_write_read(self):
+        filename = os.path.join(self.dirname, 'model.frozen')
+        arrays = {
+            'a': np.random.rand(3, 4),
+            'b': np.array([True, False, True]),
+            'c': np.arange(5, dtype='int32'),
+            'empty': np.zeros((0, 2))
+        }
+        meta = {'version_note': 'test', 'max_budget': 3.5}
+        tc.frozen.write(filename, meta, arrays)
+
+        meta_, arrays_ = tc.frozen.read(filename)
+        assert(meta_ == meta)
+        for name in arrays:
+            assert(arrays_[name].dtype == arrays[name].dtype)
+            assert_array_equal(arrays_[name], arrays[name])
+
+    def test_logistic_proba_matches_sklearn(self):
+        action_dims = [1, 2, 1]
+        state = tc.TimelyState(action_dims)
+        N = 200
+        for K in [2, 3]:
+            X = np.random.randn(N, 4)
+            y = np.random.randint(K, size=N)
+            mask = np.zeros((N, 3), dtype=bool)
+            states = state.get_states_from_mask(X, mask)
+            features = np.hstack((
+                state.slice_array(states, 'observations'),
+                state.slice_array(states, 'bias')))
+
+            clf = sklearn.linear_model.LogisticRegression(fit_intercept=False)
+            clf.fit(features, y)
+            frozen_clf = tc.frozen.FrozenLogisticClassifier(
+                state, np.array([clf.coef_]),
+                np.zeros((1, clf.coef_.shape[0])))
+            assert_array_almost_equal(
+                frozen_clf.predict_proba(states), clf.predict_proba(features))
+
+    def test_export_load(self):
+        np.random.seed(0)
+        A = 3
+        ds = tc.data_sources.Random(
+            range(A), [1, 2, 1], range(3), 200, dirname=self.dirname)
+        for policy_method, impute_method in [
+                ('linear_untaken', 'mean'), ('linear', '0')]:
+            ticl = tc.TimelyClassifier(
+                ds, os.path.join(self.dirname, policy_method),
+                max_iter=2, min_iter=2, batch_size=.5,
+                policy_method=policy_method, impute_method=impute_method)
+            ticl.fit(1)
+            filename = tc.frozen.export(
+                ticl, os.path.join(self.dirname, policy_method + '.frozen'))
+            frozen = tc.frozen.load(filename)
+            assert(frozen.has_been_fit)
+            assert(frozen.policy.trained.all())
+
+            # Same confidences in partially observed states.
+            mask = np.random.rand(ds.N_test, A) > .5
+            states = ticl.state.get_states_from_mask(ds.X_test, mask)
+            assert_array_almost_equal(
+                frozen.predict_proba(states), ticl.predict_proba(states))
+
+            # Same actions and confidences along anytime trajectories.
+            for x in ds.X_test[:20]:
+                gt = list(ticl.predict_anytime(x))
+                steps = list(frozen.predict_anytime(x))
+                assert([s[:2] for s in steps] == [g[:2] for g in gt])
+                for s, g in zip(steps, gt):
+                    assert_array_almost_equal(s[-1], g[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
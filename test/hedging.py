@@ -15,7 +15,7 @@ class TestHedging(unittest.TestCase):
             [0.003982, 0.001293, 0.001878, 0.003126, 0.000606, 0.000259, 0.000085, 0.000440, 0.001380, 0.001320, 0.000651, 0.006732, 0.000828, 0.000418, 0.010146, 0.000684, 0.004185, 0.001456, 0.000557, 0.002198, 0.002131, 0.000888, 0.003521, 0.004918, 0.005596, 0.025010, 0.005912, 0.001099, 0.001050, 0.006573, 0.001492, 0.001988, 0.000972, 0.011614, 0.002366, 0.011134, 0.222112, 0.000037, 0.001495, 0.056318, 0.004791, 0.002999, 0.002554, 0.159464, 0.008689, 0.000178, 0.000806, 0.187213, 0.000057, 0.002878, 0.000515, 0.214784, 0.000606, 0.001797, 0.002663, 0.000077, 0.001480, 0.015180, 0.113307, 0.284753, 0.364839, 0.221921, 0.649592, 0.350408, 1.000000,],
             [0.006460, 0.002284, 0.001658, 0.000919, 0.001594, 0.003430, 0.002197, 0.001072, 0.002713, 0.001665, 0.003437, 0.002797, 0.003142, 0.000610, 0.002879, 0.000496, 0.006912, 0.000265, 0.001394, 0.004491, 0.007517, 0.001261, 0.005147, 0.002835, 0.005029, 0.007925, 0.003153, 0.002883, 0.021321, 0.001412, 0.006254, 0.002037, 0.000144, 0.009683, 0.008250, 0.059777, 0.002407, 0.000058, 0.006543, 0.006768, 0.013169, 0.089692, 0.102081, 0.012511, 0.234730, 0.001636, 0.290511, 0.009905, 0.000764, 0.019627, 0.000032, 0.000299, 0.005394, 0.000120, 0.001340, 0.005643, 0.001729, 0.007676, 0.187366, 0.028945, 0.761456, 0.014558, 0.790401, 0.209599, 1.000000,]
         ])
-        all_probs = np.dot(leaf_probs, self.graph['leaf_membership'])
+        all_probs = tc.hedging.node_posteriors(leaf_probs, self.graph)
         np.testing.assert_array_almost_equal(all_probs, gt_all_probs, decimal=4)
 
     def test_info_rewards(self):
@@ -31,6 +31,15 @@ class TestHedging(unittest.TestCase):
         gt_lambdas = np.array([0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.167376, 0.501449, 1.018948, 1.393551, 1.944213, 2.962010, 5.545548,])
         np.testing.assert_array_almost_equal(lambdas, gt_lambdas, decimal=4)
 
+        # Chunks given by a callable give the same lambdas.
+        leaf_probs = data['leaf_probs']
+        chunks = lambda: [(start, leaf_probs[start:start + 100])
+                          for start in range(0, leaf_probs.shape[0], 100)]
+        chunked_lambdas = tc.hedging.darts_bisection(
+            chunks, data['accuracy_guarantees'].flatten(),
+            data['labels']-1, self.graph, data['num_bs_iters'], data['confidence'])
+        np.testing.assert_array_equal(chunked_lambdas, lambdas)
+
     def test_darts_eval(self):
         data = loadmat(os.path.join(support_dir, 'temp_test.mat'))
         rewards, accuracies, height_portions, height_accs = tc.hedging.darts_eval(
@@ -45,5 +54,81 @@ class TestHedging(unittest.TestCase):
         np.testing.assert_array_almost_equal(height_accs.T.flatten(), gt_height_accs, decimal=4)
         np.testing.assert_array_almost_equal(height_portions.T.flatten(), gt_height_portions, decimal=4)
 
+
+class TestDarts(unittest.TestCase):
+    def test_binofit(self):
+        x = np.array([0, 1, 5, 9, 10])
+        p, lb, ub = tc.hedging.binofit(x, 10, .05)
+        for i in range(len(x)):
+            p_i, (lb_i, ub_i) = tc.hedging.binofit_scalar(x[i], 10, .05)
+            assert_almost_equal(p[i], p_i)
+            assert_almost_equal(lb[i], lb_i)
+            assert_almost_equal(ub[i], ub_i)
+
+    def test_darts_predict(self):
+        leaf_membership = np.array([
+            [1, 0, 0, 1],
+            [0, 1, 0, 1],
+            [0, 0, 1, 1]])
+        rewards = np.array([1., 1, 1, 0])
+        np.random.seed(0)
+        leaf_probs = np.random.dirichlet(np.ones(3), 20)
+        node_probs = np.dot(leaf_probs, leaf_membership)
+        lambdas = np.array([0, .5, 2, 100])
+        preds = tc.hedging.darts_predict(node_probs, rewards, lambdas)
+        for i, lam in enumerate(lambdas):
+            assert_array_equal(
+                preds[i], (node_probs * (rewards + lam)).argmax(1))
+        # A large enough lambda always predicts the root.
+        assert(np.all(preds[-1] == 3))
+
+    def test_corrupt_chunks(self):
+        probs = np.random.rand(2500, 3)
+
+        def corrupt(budget, method='0', fill=None, seed=0):
+            chunks = list(tc.hedging.corrupt_chunks(
+                probs, budget, method, fill, seed))
+            assert([start for start, _ in chunks] == range(0, 2500, 1024))
+            return np.vstack([chunk for _, chunk in chunks])
+
+        assert_array_equal(corrupt(1), probs)
+        assert_array_equal(corrupt(0), np.zeros_like(probs))
+        fill = np.array([.1, .2, .3])
+        assert_array_equal(corrupt(0, 'mean', fill), np.tile(fill, (2500, 1)))
+
+        half = corrupt(.5)
+        assert_array_equal(half, corrupt(.5))
+        assert(np.any(half != corrupt(.5, seed=1)))
+        assert(np.all((half == 0) | (half == probs)))
+        assert(abs((half == 0).mean() - .5) < .05)
+
+    def test_eval_rewards(self):
+        graph = {
+            'leaf_membership': np.array([
+                [1, 0, 0, 1, 1],
+                [0, 1, 0, 1, 1],
+                [0, 0, 1, 0, 1]]),
+            'heights': np.array([0, 0, 0, 1, 2]),
+        }
+        labels = np.array([0, 1, 2, 0])
+        preds = np.array([[0, 0, 2, 3], [4, 3, 3, 1]])
+        correct = tc.hedging.is_correct(preds, labels, graph)
+        assert_array_equal(correct, [[1, 0, 1, 1], [1, 1, 0, 0]])
+
+        rewards = np.array([1., 1, 1, .5, 0])
+        reward, acc, height_portion, height_acc = tc.hedging.eval_reward(
+            preds[0], labels, rewards, graph)
+        assert_almost_equal(reward, 2.5 / 4)
+        assert_almost_equal(acc, .75)
+        assert_array_almost_equal(height_portion, [.75, .25, 0])
+        assert_array_almost_equal(height_acc[:2], [2. / 3, 1])
+        assert(np.isnan(height_acc[2]))
+
+        rewards_, accs, height_portions, _ = tc.hedging.eval_rewards(
+            preds, labels, rewards, graph)
+        assert_array_almost_equal(rewards_, [2.5 / 4, .5 / 4])
+        assert_array_almost_equal(accs, [.75, .5])
+        assert_array_almost_equal(height_portions[:, 1], [.25, .5, .25])
+
 if __name__ == '__main__':
     unittest.main()
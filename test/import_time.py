@@ -0,0 +1,74 @@
+from context import *
+import json
+import subprocess
+
+# Modules that only plotting, reporting, training, or specific data sources
+# should pull in.
+heavy_modules = [
+    'matplotlib', 'pandas', 'jinja2', 'networkx', 'sklearn', 'h5py',
+    'scipy.io', 'fastcluster', 'bottleneck', 'mpltools']
+
+
+def import_in_subprocess(statements):
+    """
+    Run statements in a fresh interpreter and return the time they took and
+    the names of all imported modules.
+    """
+    code = '\n'.join([
+        'import sys, time, json',
+        'sys.path.insert(0, {!r})'.format(repo_dir),
+        'import numpy',
+        't = time.time()',
+        statements,
+        'print(json.dumps({"time": time.time() - t,'
+        ' "modules": sorted(sys.modules.keys())}))'])
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+    def test_inference_path(self):
+        result = import_in_subprocess(
+            'import tc\n'
+            'tc.TimelyState, tc.frozen.load, tc.anytime, tc.batch_server')
+        print('import time of the inference path: {:.3f} s'.format(
+            result['time']))
+        for name in heavy_modules:
+            assert(name not in result['modules'])
+        assert('tc.report' not in result['modules'])
+        assert('tc.data_sources.imagenet' not in result['modules'])
+
+    def test_lazy_attributes(self):
+        result = import_in_subprocess(
+            'import tc\n'
+            'assert "TimelyClassifier" in dir(tc)\n'
+            'assert tc.data_sources.SyntheticOrthants is '
+            'tc.data_sources.synthetic_orthants.SyntheticOrthants\n'
+            'assert tc.MeanImputer is tc.imputer.MeanImputer')
+        assert('tc.timely_classifier' not in result['modules'])
+        assert('matplotlib' not in result['modules'])
+        assert('networkx' not in result['modules'])
+
+    def test_fit_in_fresh_process(self):
+        # Modules that use sklearn submodules must import them, not rely on
+        # others having done so.
+        import_in_subprocess(
+            'import tc\n'
+            'numpy.random.seed(0)\n'
+            'state = tc.TimelyState([2, 3])\n'
+            'X = numpy.random.rand(60, 5)\n'
+            'y = numpy.arange(60) % 2\n'
+            'mask = numpy.random.rand(60, 2) < .5\n'
+            'states = state.get_states_from_mask(X, mask)\n'
+            'clf = tc.StateClassifier([2, 3], 2)\n'
+            'clf.fit(states, y)\n'
+            'clf.score(states, y)')
+
+    def test_missing_attribute(self):
+        self.assertRaises(AttributeError, getattr, tc, 'no_such_module')
+        self.assertRaises(
+            AttributeError, getattr, tc.data_sources, 'NoSuchSource')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+from context import *
+
+
+class TestMemory(unittest.TestCase):
+    def test_nbytes(self):
+        a = np.zeros((10, 10))
+        assert(tc.memory.nbytes(a) == 800)
+        assert(tc.memory.nbytes([a, (a, [a])]) == 2400)
+        assert(tc.memory.nbytes([a, 'string', None]) == 800)
+
+    def test_rss(self):
+        assert(tc.memory.peak_rss_mb() > 0)
+        rss = tc.memory.rss_mb()
+        if rss is not None:
+            assert(rss <= tc.memory.peak_rss_mb() + 1)
+
+    def test_memory_log(self):
+        memory = tc.memory.MemoryLog()
+        memory.record('rollouts', worker_results=[np.zeros(2 ** 20)])
+        memory.record(
+            'learn_classifier', worker_results=np.zeros(2 ** 17),
+            X=2 ** 21, confidences=None)
+        d = memory.to_dict()
+        assert(d['stages'].keys() == ['rollouts', 'learn_classifier'])
+        # Buffers keep their largest recorded size.
+        assert(d['buffers'] == {'worker_results': 8., 'X': 2.})
+        assert(d['peak_rss_mb'] > 0)
+
+    def test_suggest_reservation(self):
+        memory = {'peak_rss_mb': 1500., 'children_peak_rss_mb': 500.}
+        reports = [
+            {'iterations': [{'memory': memory}, {}], 'eval': {}},
+            {'iterations': [], 'eval': {}}]
+        assert(tc.memory.suggest_reservation(reports, 4) == 5000)
+        assert(tc.memory.suggest_reservation(reports, 0) == 2000)
+        assert(tc.memory.suggest_reservation(reports[1:], 4) is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
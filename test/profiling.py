@@ -0,0 +1,92 @@
+from context import *
+import json
+import tempfile
+from tc.profiling import Profiler, NULL_SPAN
+
+
+class TestProfiler(unittest.TestCase):
+    def test_nested_spans(self):
+        p = Profiler()
+        with p.span('fit'):
+            for i in range(3):
+                p.tic('iteration')
+                with p.span('rollouts'):
+                    time.sleep(0.01)
+                with p.span('learn_policy'):
+                    pass
+                times = p.last_times()
+                p.toc('iteration', quiet=True)
+        assert(times.keys() == ['rollouts', 'learn_policy'])
+        assert(times['rollouts'] >= 0.01)
+
+        d = p.to_dict()
+        fit = d['children'][0]
+        assert(fit['name'] == 'fit' and fit['count'] == 1)
+        iteration = fit['children'][0]
+        assert(iteration['count'] == 3)
+        assert([c['count'] for c in iteration['children']] == [3, 3])
+        assert(iteration['total'] <= fit['total'])
+        assert(len(p.events) == 1 + 3 * 3)
+        assert('rollouts' in tc.profiling.format_tree(d))
+
+    def test_mismatched_toc(self):
+        p = Profiler()
+        p.tic('a')
+        p.tic('b')
+        self.assertRaises(Exception, p.toc, 'a')
+
+    def test_merge_and_trace(self):
+        # A worker that ran in the main process, as with joblib n_jobs=1.
+        worker = Profiler()
+        with worker.span('classify_instances'):
+            with worker.span('select_action'):
+                pass
+
+        p = Profiler(detailed=True)
+        with p.span('rollouts'):
+            for w in range(2):
+                p.merge('worker_{}'.format(w), worker.to_dict(), worker.events)
+            p.add('ipc_and_scheduling', 0.5)
+        # Merging under a name again reuses its process.
+        p.merge('worker_0', worker.to_dict(), worker.events)
+        rollouts = p.to_dict()['children'][0]
+        assert([c['name'] for c in rollouts['children']] ==
+               ['worker_0', 'worker_1', 'ipc_and_scheduling'])
+        assert(rollouts['children'][0]['children'][0]['children'][0]['name']
+               == 'select_action')
+
+        filename = tempfile.mktemp()
+        p.write_chrome_trace(filename)
+        with open(filename) as f:
+            trace = json.load(f)['traceEvents']
+        os.remove(filename)
+        assert(len([e for e in trace if e['ph'] == 'X']) == 7)
+        names = dict((e['pid'], e['args']['name'])
+                     for e in trace if e['ph'] == 'M')
+        assert(sorted(names.values()) == ['main', 'worker_0', 'worker_1'])
+        assert(names[p.pid] == 'main')
+        worker_0 = [pid for pid, name in names.items() if name == 'worker_0']
+        assert(len([e for e in trace if e['ph'] == 'X' and
+                    e['pid'] == worker_0[0]]) == 4)
+
+    def test_disabled(self):
+        p = Profiler(enabled=False, detailed=True)
+        assert(not p.detailed)
+        assert(p.span('a') is NULL_SPAN)
+        with p.span('a'):
+            p.tic('b')
+            p.toc('b')
+        assert(p.to_dict()['children'] == [])
+        assert(len(p.events) == 0)
+
+    def test_max_events(self):
+        p = Profiler(max_events=2)
+        for i in range(5):
+            with p.span('a'):
+                pass
+        assert(len(p.events) == 2 and p.num_dropped_events == 3)
+        assert(p.to_dict()['children'][0]['count'] == 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
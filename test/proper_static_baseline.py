@@ -0,0 +1,91 @@
+from context import *
+import itertools
+from tc import proper_static_baseline as psb
+
+
+class StubDataSource(object):
+    def __init__(self, action_costs):
+        self.action_costs = np.array(action_costs, dtype=float)
+        self.actions = range(len(action_costs))
+
+
+class StubLattice(psb.SubsetLattice):
+    """
+    Subsets with random entropies instead of fit classifiers.
+    """
+    def __init__(self, ds, seed=0):
+        super(StubLattice, self).__init__(ds, None, None)
+        A = len(ds.actions)
+        entropies = np.random.RandomState(seed).rand(2 ** A)
+        self.table = dict(
+            (bits, (1 - entropies[bits], entropies[bits]))
+            for bits in xrange(2 ** A))
+
+    def evaluate(self, masks):
+        for bits in masks:
+            if bits not in self.results:
+                self.results[bits] = self.table[bits]
+                self.num_fit += 1
+        return dict((bits, self.results[bits]) for bits in masks)
+
+
+def brute_force_area(ds, table, max_budget):
+    best = (1 - table[0][1]) * max_budget
+    for order in itertools.permutations(range(len(ds.actions))):
+        area, cost, bits = 0., 0., 0
+        for a in order:
+            if cost + ds.action_costs[a] > max_budget:
+                break
+            area += (1 - table[bits][1]) * ds.action_costs[a]
+            cost += ds.action_costs[a]
+            bits |= 1 << a
+            best = max(best, area + (1 - table[bits][1]) * (max_budget - cost))
+    return best
+
+
+class TestLatticeSearch(unittest.TestCase):
+    def test_masks(self):
+        bits = psb.pack_mask([0, 2])
+        assert(bits == 5)
+        assert_array_equal(psb.unpack_mask(bits, 4), [1, 0, 1, 0])
+
+    def test_exact(self):
+        ds = StubDataSource([1, 2, 1, 3])
+        lattice = StubLattice(ds)
+        for max_budget in [0, 2, 4, 7]:
+            action_inds, area = psb.lattice_search(lattice, max_budget, None)
+            assert_almost_equal(
+                area, brute_force_area(ds, lattice.table, max_budget))
+            assert(ds.action_costs[action_inds].sum() <= max_budget)
+            assert(len(set(action_inds)) == len(action_inds))
+        # Subsets are evaluated once across budgets.
+        assert(lattice.num_fit == 2 ** 4)
+
+    def test_beam(self):
+        ds = StubDataSource([1, 2, 1, 3, 1])
+        lattice = StubLattice(ds, 1)
+        exact_inds, exact_area = psb.lattice_search(lattice, 5, None)
+        beam_inds, beam_area = psb.lattice_search(
+            StubLattice(ds, 1), 5, beam_width=2)
+        assert(beam_area <= exact_area + 1e-9)
+        beam_inds, beam_area = psb.lattice_search(
+            StubLattice(ds, 1), 5, beam_width=2 ** 5)
+        assert_almost_equal(beam_area, exact_area)
+
+    def test_exact_refused(self):
+        ds = StubDataSource(np.ones(57))
+        assert(psb.num_subsets_bound(ds.action_costs, 2) == 1 + 57 + 57 * 28)
+        self.assertRaises(
+            ValueError, psb.lattice_search,
+            psb.SubsetLattice(ds, None, None), 13, None)
+
+        # The default beam search fits few subsets per action taken.
+        ds = StubDataSource(np.ones(12))
+        lattice = StubLattice(ds)
+        action_inds, area = psb.lattice_search(lattice, 3)
+        assert(len(action_inds) <= 3)
+        assert(lattice.num_fit <= 1 + 3 * psb.default_beam_width * 12)
+        assert(lattice.num_fit < psb.num_subsets_bound(ds.action_costs, 3))
+
+if __name__ == '__main__':
+    unittest.main()
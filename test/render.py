@@ -0,0 +1,50 @@
+from context import *
+import tempfile
+import shutil
+import cPickle as pickle
+
+
+def append_line(filename, line):
+    with open(filename, 'a') as f:
+        f.write(line + '\n')
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'out.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def lines(self):
+        with open(self.filename) as f:
+            return f.read().split()
+
+    def test_skips_unchanged(self):
+        renderer = tc.render.Renderer()
+        task = pickle.dumps((append_line, (self.filename, 'a'), {}), 2)
+        renderer.run(self.filename, task)
+        renderer.run(self.filename, task)
+        assert(self.lines() == ['a'])
+        assert(renderer.num_rendered == 1 and renderer.num_skipped == 1)
+
+        task = pickle.dumps((append_line, (self.filename, 'b'), {}), 2)
+        renderer.run(self.filename, task)
+        assert(self.lines() == ['a', 'b'])
+
+    def test_background(self):
+        lines = ['a', 'b', 'c']
+        for line in lines:
+            tc.render.submit(self.filename, append_line, self.filename, line)
+        # Arguments are copied on submit.
+        lines.append('d')
+        tc.render.flush()
+        rendered = self.lines()
+        # Pending tasks for the same output may be dropped for the latest.
+        assert(rendered[-1] == 'c' and len(rendered) <= 3)
+        tc.render.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
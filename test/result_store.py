@@ -0,0 +1,50 @@
+from context import *
+import tempfile
+import shutil
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_ragged_roundtrip(self):
+        arrays = [np.random.rand(n, 3) for n in [1, 4, 2]]
+        data, offsets = tc.result_store.ragged_to_flat(arrays)
+        assert(data.shape == (7, 3))
+        assert_array_equal(offsets, [0, 1, 5, 7])
+        for a, b in zip(arrays, tc.result_store.flat_to_ragged(data, offsets)):
+            assert_array_almost_equal(a, b)
+
+    def test_write_and_read_subset(self):
+        A = 3
+        ds = tc.data_sources.Random(
+            range(A), np.ones(A, dtype='int'), np.arange(2), 10)
+        confidences = [np.random.rand(n, 2) for n in [3, 1, 2, 4]]
+        actions = [np.random.randint(A, size=n) for n in [3, 1, 2, 4]]
+        labels = np.array([0, 1, 1, 0])
+
+        filename = os.path.join(self.dirname, 'episodes.h5')
+        tc.result_store.write_episodes(
+            filename, {'confidences': confidences, 'actions': actions},
+            {'labels': labels}, ds, {'note': 'test'})
+
+        store = tc.result_store.EpisodeStore(filename)
+        assert(len(store) == 4)
+        assert(store.data_source == ds.name)
+        assert(store.actions == ['0', '1', '2'])
+        assert(store.attrs['note'] == 'test')
+
+        subset = store.get('confidences', [3, 1])
+        assert_array_almost_equal(subset[0], confidences[3])
+        assert_array_almost_equal(subset[1], confidences[1])
+        for a, b in zip(store.get('actions'), actions):
+            assert_array_equal(a, b)
+        assert_array_equal(store.get_fixed('labels', [2, 0]), [1, 0])
+        assert_array_equal(store.get_fixed('labels'), labels)
+
+
+if __name__ == '__main__':
+    unittest.main()
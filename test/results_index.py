@@ -0,0 +1,93 @@
+from context import *
+import json
+import tempfile
+import shutil
+
+
+class TestResultsIndex(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.index = tc.results_index.ResultsIndex(
+            os.path.join(self.dirname, 'results_index.sqlite'))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.dirname)
+
+    def write_result(self, name, policy_feat, gamma, loss_auc, mtime=None):
+        dirname = os.path.join(self.dirname, 'exp', name)
+        tc.util.mkdir_p(dirname)
+        report = {
+            'info': {'data_source': {'max_budget': 4},
+                     'policy_feat': policy_feat, 'gamma': gamma,
+                     'policy_method': 'linear_untaken'},
+            'eval': {'perf': {'loss_auc': loss_auc, 'loss_final': .1}}
+        }
+        filename = os.path.join(dirname, 'report.json')
+        with open(filename, 'w') as f:
+            json.dump(report, f)
+        np.savez(os.path.join(dirname, 'evaluation_final.npz'),
+                 interp_points=np.arange(4.), means=np.ones(4) * loss_auc,
+                 stds=np.zeros(4))
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+            os.utime(os.path.join(dirname, 'evaluation_final.npz'),
+                     (mtime, mtime))
+        return dirname
+
+    def test_update(self):
+        self.write_result('a', 'static', 0, .5, 1000)
+        b = self.write_result('b', 'static', 0, .3, 1000)
+        self.write_result('c', 'dynamic', 1., .4, 1000)
+        assert(self.index.update(self.dirname) == 3)
+        assert(self.index.update(self.dirname) == 0)
+
+        max_budgets, rows = self.index.experiment_results('exp')
+        assert(max_budgets == [4, 4, 4])
+        assert([r['loss_auc'] for r in rows] == [.5, .3, .4])
+
+        best = self.index.best_result(
+            'exp', {'policy_feat': 'static', 'gamma': 0})
+        assert(best['dirname'] == b)
+        assert(self.index.best_result('exp', {'policy_feat': 'none'}) is None)
+        interp_points, means, stds = self.index.curves([b])[b]
+        assert_array_equal(interp_points, np.arange(4.))
+        assert_array_equal(means, np.ones(4) * .3)
+
+        # Only modified results are ingested again.
+        self.write_result('a', 'static', 0, .2, 2000)
+        assert(self.index.update(self.dirname) == 1)
+        best = self.index.best_result(
+            'exp', {'policy_feat': 'static', 'gamma': 0})
+        assert(best['loss_auc'] == .2)
+
+        shutil.rmtree(b)
+        self.index.update(self.dirname)
+        assert(len(self.index.experiment_results('exp')[1]) == 2)
+        assert(len(self.index.curves([b])) == 0)
+
+    def test_best_result_skips_nan(self):
+        self.write_result('a', 'static', 0, float('nan'))
+        b = self.write_result('b', 'static', 0, .4)
+        self.index.update(self.dirname)
+        best = self.index.best_result(
+            'exp', {'policy_feat': 'static', 'gamma': 0})
+        assert(best['dirname'] == b)
+
+        shutil.rmtree(b)
+        self.index.update(self.dirname)
+        assert(self.index.best_result(
+            'exp', {'policy_feat': 'static', 'gamma': 0}) is None)
+
+    def test_filter_best_results(self):
+        self.write_result('a', 'static', 0, .5)
+        self.write_result('b', 'dynamic', 1, .3)
+        max_budget, df = tc.aggregate_results.get_experiment_results(
+            os.path.join(self.dirname, 'exp'), self.index)
+        assert(max_budget == 4 and df.shape[0] == 2)
+        best_df = tc.aggregate_results.filter_best_results(self.index, 'exp')
+        assert(list(best_df.index) == ['Static, greedy', 'Dynamic, non-myopic'])
+
+
+if __name__ == '__main__':
+    unittest.main()
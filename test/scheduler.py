@@ -0,0 +1,63 @@
+from context import *
+import json
+import shutil
+import tempfile
+from tc.scheduler import Job, LocalScheduler
+
+
+class TestLocalScheduler(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def job(self, name, code, mem, done=None):
+        return Job(name, [sys.executable, '-c', code], mem,
+                   output_filename=os.path.join(self.dirname, name + '.out'),
+                   done=done, cwd=self.dirname)
+
+    def test_packing_retry_and_skip(self):
+        sleep = 'import time; time.sleep(0.3)'
+        # Fails on the first attempt only.
+        flaky = ('import os, sys\n'
+                 'if not os.path.exists("tried"):\n'
+                 '    open("tried", "w").close()\n'
+                 '    sys.exit(1)\n')
+        jobs = [
+            self.job('big_a', sleep, 600),
+            self.job('big_b', sleep, 600),
+            self.job('small', sleep, 100),
+            self.job('flaky', flaky, 100),
+            self.job('broken', 'import sys; sys.exit(2)', 100),
+            self.job('skipped', 'import sys; sys.exit(3)', 100,
+                     done=lambda: True),
+        ]
+        status_filename = os.path.join(self.dirname, 'status.json')
+        scheduler = LocalScheduler(
+            max_mem=1000, max_cores=4, max_attempts=2,
+            status_filename=status_filename, poll_interval=0.05)
+        scheduler.run(jobs)
+
+        states = dict((j.name, j.state) for j in jobs)
+        assert(states == {
+            'big_a': 'done', 'big_b': 'done', 'small': 'done',
+            'flaky': 'done', 'broken': 'failed', 'skipped': 'skipped'})
+        assert(jobs[3].attempts == 2 and jobs[4].attempts == 2)
+
+        # The two big jobs do not fit next to each other.
+        a, b = jobs[0], jobs[1]
+        assert(a.end_time <= b.start_time or b.end_time <= a.start_time)
+
+        with open(status_filename) as f:
+            status = json.load(f)
+        assert(status['counts'] == {'done': 4, 'failed': 1, 'skipped': 1})
+
+    def test_oversized_job_runs_alone(self):
+        job = self.job('huge', 'pass', 10 ** 6)
+        LocalScheduler(max_mem=1000, poll_interval=0.05).run([job])
+        assert(job.state == 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 from context import *
 import sklearn
+import sklearn.datasets
+import sklearn.metrics
+import sklearn.preprocessing
 
 class StateClassifierTest(unittest.TestCase):
     # def test(self):
@@ -0,0 +1,47 @@
+from context import *
+import tempfile
+import shutil
+import cPickle as pickle
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        A = 3
+        # run_sweep(seed=...) only seeds the fits. With too few instances,
+        # a cross-validation fold of the policy fit can miss an action.
+        np.random.seed(0)
+        self.ds = tc.data_sources.Random(
+            range(A), [1] * A, range(2), 300, dirname=self.dirname)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_run_sweep(self):
+        common = {'max_iter': 2, 'min_iter': 2, 'batch_size': .5,
+                  'policy_method': 'linear_untaken', 'impute_method': 'mean'}
+        settings = [
+            dict(common, gamma=1., policy_feat='dynamic'),
+            dict(common, gamma=0., policy_feat='dynamic'),
+            dict(common, gamma=1., policy_feat='static'),
+            dict(common, gamma=1., policy_feat='dynamic', clf_method='gnb')]
+        ticls = tc.sweep.run_sweep(
+            self.ds, self.dirname, settings, 1, evaluate=False, seed=0)
+
+        assert(all(t.has_been_fit for t in ticls))
+        assert(len(set(t.logging_dirname for t in ticls)) == 4)
+        assert('cached' not in ticls[0].report.iterations[0])
+        for t in ticls[1:3]:
+            assert(t.report.iterations[0]['cached'] ==
+                   ['rollouts', 'imputer', 'classifier'])
+            assert(t.report.iterations[0]['perf']['classifier_error'] ==
+                   ticls[0].report.iterations[0]['perf']['classifier_error'])
+        assert(ticls[3].report.iterations[0]['cached'] ==
+               ['rollouts', 'imputer'])
+
+        # The shared cache is not pickled with the TimelyClassifier.
+        assert(pickle.loads(pickle.dumps(ticls[0])).cache is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
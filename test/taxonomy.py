@@ -0,0 +1,95 @@
+from context import *
+import tempfile
+import shutil
+
+
+class TestTaxonomy(unittest.TestCase):
+    def setUp(self):
+        # root -> a -> {x, y}, root -> b -> {y, z, w}: y has two parents.
+        self.nodes = ['x', 'y', 'z', 'w', 'a', 'b', 'root']
+        edges = [('root', 'a'), ('root', 'b'), ('a', 'x'), ('a', 'y'),
+                 ('b', 'y'), ('b', 'z'), ('b', 'w')]
+        self.taxonomy = tc.taxonomy.Taxonomy(self.nodes, edges)
+
+    def test_leaf_sets(self):
+        t = self.taxonomy
+        assert_array_equal(t.leaves, [0, 1, 2, 3])
+        assert_array_equal(t.num_leaves, [1, 1, 1, 1, 2, 3, 4])
+        assert(t.leaf_names(t.leaf_bits[t.index['b']]) == ['y', 'z', 'w'])
+        assert_array_equal(t.leaf_inds(t.leaf_bits[t.index['a']]), [0, 1])
+
+        position = dict((node, i) for i, node in enumerate(t.order))
+        for p in range(len(self.nodes)):
+            for c in t.child_indices[t.child_indptr[p]:t.child_indptr[p + 1]]:
+                assert(position[p] < position[c])
+
+    def test_arrays(self):
+        t = self.taxonomy
+        assert_array_equal(t.heights, [0, 0, 0, 0, 1, 1, 2])
+        assert_array_almost_equal(t.rewards, np.log2(4. / t.num_leaves))
+        leaf_membership = t.leaf_membership.toarray()
+        assert_array_equal(leaf_membership[1], [0, 1, 0, 0, 1, 1, 1])
+        assert_array_equal(leaf_membership.sum(0), t.num_leaves)
+        assert_array_equal(
+            np.unpackbits(t.ancestor_bits, axis=1)[:, :7], leaf_membership)
+        b = t.index['b']
+        parents = t.parent_indices[t.parent_indptr[1]:t.parent_indptr[2]]
+        assert(sorted(parents) == [t.index['a'], b])
+
+    def test_save_load(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dirname, 'tax.npz')
+            source_filename = os.path.join(dirname, 'source')
+            open(source_filename, 'w').close()
+            compiled = []
+
+            def compile_taxonomy():
+                compiled.append(1)
+                return self.taxonomy
+
+            t = tc.taxonomy.compiled(
+                filename, source_filename, compile_taxonomy)
+            t = tc.taxonomy.compiled(
+                filename, source_filename, compile_taxonomy)
+            assert(len(compiled) == 1)
+            assert(isinstance(t.leaf_bits, np.memmap))
+            assert(t.nodes == self.nodes and t.index == self.taxonomy.index)
+            for name in tc.taxonomy.compiled_arrays:
+                assert_array_equal(
+                    getattr(t, name), getattr(self.taxonomy, name))
+            assert_array_equal(
+                t.leaf_membership.toarray(),
+                self.taxonomy.leaf_membership.toarray())
+            assert(t.select_groups_by_size(2) ==
+                   self.taxonomy.select_groups_by_size(2))
+
+            # Without its source, the compiled file is used.
+            os.remove(source_filename)
+            t = tc.taxonomy.compiled(
+                filename, source_filename, compile_taxonomy)
+            assert(len(compiled) == 1)
+            assert(t.nodes == self.nodes)
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_cycles(self):
+        assert_raises(
+            ValueError, tc.taxonomy.Taxonomy,
+            ['a', 'b'], [('a', 'b'), ('b', 'a')])
+
+    def test_select_groups_by_size(self):
+        groups = self.taxonomy.select_groups_by_size(3)
+        assert(groups == [('b', set(['y', 'z', 'w'])), ('x', set(['x']))])
+        groups = self.taxonomy.select_groups_by_size(2)
+        assert(groups == [('a', set(['x', 'y'])), ('b', set(['z', 'w']))])
+        groups = self.taxonomy.select_groups_by_size(4)
+        assert(len(groups) == 1 and groups[0][0] == 'root')
+
+    def test_popcount(self):
+        bits = np.array([[255, 1], [0, 6]], dtype='uint8')
+        assert_array_equal(tc.taxonomy.popcount(bits), [9, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ import json
 import networkx as nx
 import numpy as np
 from os import path
+import unittest
 import wordnet
 
 __BIRD_FILENAME = path.join(path.dirname(__file__), 'taxCUB.json')
@@ -196,82 +197,155 @@ def pairwise_info_gain(graph, root = None):
     function returns a dictionary where the pairwise info gain between leaf
     nodes can be accessed using a tuple.
 
-    During the execution of the graph, we create a key "_leaves" for each
-    node in the graph, which contains the list of leaf nodes under the node.
-    It is cleaned once we have the information gain computed.
+    This is kept for old callers: it has one entry per ordered pair of
+    leaves, so use pairwise_info_gain_matrix for large graphs.
     """
+    leaves = [n for n in graph.nodes() if len(graph.successors(n)) == 0]
+    mat = pairwise_info_gain_matrix(graph, leaves, root = root)
     infogain = {}
+    for i, leaf_1 in enumerate(leaves):
+        for j, leaf_2 in enumerate(leaves):
+            infogain[(leaf_1, leaf_2)] = mat[i, j]
+    return infogain
+
+def pairwise_info_gain_matrix(graph, leaves = None, root = None,
+                              out = None, block_size = 1024):
+    """Compute the info gain between the leaf nodes for a given graph as a
+    matrix: the info gain between leaves a and b is log(L) - log(n), where L
+    is the number of leaves under the root and n the number of leaves under
+    the lowest common ancestor of a and b.
+
+    The lowest common ancestor is the common ancestor with the fewest
+    leaves. For leaves whose ancestors form a chain, it is found with range
+    minimum queries on an Euler tour of the graph, answered in constant time
+    by a sparse table. If the graph is a DAG and not a tree, the tour follows
+    a spanning tree in which each node keeps the parent of largest depth,
+    which loses ancestors of nodes with several parents: the rows and
+    columns of leaves below such nodes are then recomputed from the leaf
+    sets of all their ancestors.
+
+    Input:
+        leaves: the leaves, in the order of the rows and columns of the
+            output. By default, all nodes without successors.
+        out: an optional [len(leaves) * len(leaves)] float array to write the
+            matrix into, such as a np.memmap for large graphs.
+        block_size: number of rows computed at once.
+    Output:
+        mat: the [len(leaves) * len(leaves)] matrix.
+    """
+    if leaves is None:
+        leaves = [n for n in graph.nodes() if len(graph.successors(n)) == 0]
     if root is None:
         root = [n for n in graph.nodes() if len(graph.predecessors(n)) == 0]
         if len(root) != 1:
             raise ValueError, "The graph must only have one root!"
         root = root[0]
-    _pairwise_info_gain(graph, root, infogain)
-    # in the end, we need to compute the offset, which is the log of the size
-    # of the tree
-    offset = np.log(len(graph.node[root]['_leaves']))
-    del graph.node[root]['_leaves']
-    for key in infogain:
-        infogain[key] = offset - infogain[key]
-    # for each key (a,b), we add key (b,a) as well
-    for key in infogain.keys():
-        infogain[(key[1],key[0])] = infogain[key]
-    return infogain
+    # depth in topological order, the spanning tree of deepest parents, and
+    # the ancestors of each node in the graph itself
+    order = get_topological_order(graph)
+    depth = {}
+    ancestors = {}
+    children = dict((n, []) for n in order)
+    for n in order:
+        parents = graph.predecessors(n)
+        ancestors[n] = set(parents)
+        for p in parents:
+            ancestors[n].update(ancestors[p])
+        if len(parents) == 0:
+            depth[n] = 0
+            continue
+        parent = max(parents, key = lambda p: depth[p])
+        depth[n] = depth[parent] + 1
+        children[parent].append(n)
+    # a leaf has as many ancestors along the spanning tree as its depth: if it
+    # has more in the graph, the tour cannot be trusted for its pairs
+    leaf_index = dict((leaf, i) for i, leaf in enumerate(leaves))
+    dag_rows = [i for i, leaf in enumerate(leaves)
+                if len(ancestors[leaf]) != depth[leaf]]
+    dag_nodes = set()
+    for i in dag_rows:
+        dag_nodes.update(ancestors[leaves[i]])
+        dag_nodes.add(leaves[i])
+    # the number of leaves under each node, in the graph itself, and the
+    # indices of the leaves under the nodes needed for the DAG rows
+    compute_leave_sets(graph, key = '_leaves')
+    num_leaves = dict((n, len(graph.node[n]['_leaves'])) for n in order)
+    leaf_inds = {}
+    for n in dag_nodes:
+        leaf_inds[n] = np.array([leaf_index[leaf]
+                                 for leaf in graph.node[n]['_leaves']
+                                 if leaf in leaf_index], dtype = np.int)
+    for n in order:
+        del graph.node[n]['_leaves']
+    offset = np.log(num_leaves[root])
 
-def _pairwise_info_gain(graph, node, infogain):
-    """This is the main routine that carries out the pairwise info gain
-    computation. It also works on DAGs - when the hierarchy is not a tree.
-    """
-    if len(graph.successors(node)) == 0:
-        graph.node[node]['_leaves'] = set([node])
-        infogain[(node,node)] = 0.
-        return
-    children = graph.successors(node)
-    # run pairwise info gain for the children first
-    for c in children:
-        _pairwise_info_gain(graph, c, infogain)
-    leaves = set()
-    for c in children:
-        leaves.update(graph.node[c]['_leaves'])
-    graph.node[node]['_leaves'] = leaves
-    size = len(graph.node[node]['_leaves'])
-    gain = np.log(size)
-    for i in range(len(children)):
-        for j in range(i+1, len(children)):
-            leaves_i = graph.node[children[i]]['_leaves']
-            leaves_j = graph.node[children[j]]['_leaves']
-            for leaf_1 in leaves_i:
-                for leaf_2 in leaves_j:
-                    if (leaf_1,leaf_2) not in infogain and \
-                            (leaf_2, leaf_1) not in infogain:
-                        infogain[(leaf_1, leaf_2)] = gain
-    # after computing the pairwise infogain between children, the _leaves
-    # key is no longer needed
-    for c in children:
-        del graph.node[c]['_leaves']
-    return
+    # Euler tour of the spanning tree
+    tour = []
+    first = {}
+    stack = [(root, 0)]
+    while len(stack) > 0:
+        node, i = stack.pop()
+        if i == 0:
+            first[node] = len(tour)
+        tour.append(node)
+        if i < len(children[node]):
+            stack.append((node, i + 1))
+            stack.append((children[node][i], 0))
+    tour_depth = np.array([depth[n] for n in tour])
+    tour_gain = offset - np.log([num_leaves[n] for n in tour])
+
+    # sparse table: table[k, i] is the position of the shallowest node in
+    # tour[i:i + 2 ** k]
+    num_levels = int(np.log2(len(tour))) + 1
+    table = np.zeros((num_levels, len(tour)), dtype = np.int)
+    table[0] = np.arange(len(tour))
+    for k in range(1, num_levels):
+        half = 2 ** (k - 1)
+        left = table[k - 1, :-half]
+        right = table[k - 1, half:]
+        table[k, :len(left)] = np.where(
+            tour_depth[left] <= tour_depth[right], left, right)
+
+    positions = np.array([first[n] for n in leaves])
+    if out is None:
+        out = np.empty((len(leaves), len(leaves)))
+    for start in range(0, len(leaves), block_size):
+        rows = positions[start:start + block_size, np.newaxis]
+        low = np.minimum(rows, positions)
+        high = np.maximum(rows, positions)
+        k = np.log2(high - low + 1).astype(np.int)
+        left = table[k, low]
+        right = table[k, high - 2 ** k + 1]
+        lca = np.where(tour_depth[left] <= tour_depth[right], left, right)
+        out[start:start + block_size] = tour_gain[lca]
+    # rows and columns of the leaves below nodes with several parents: write
+    # the number of leaves of all ancestors from the largest down, so that
+    # the smallest common one is left for each pair
+    for i in dag_rows:
+        sizes = np.empty(len(leaves))
+        sizes.fill(num_leaves[root])
+        nodes = list(ancestors[leaves[i]]) + [leaves[i]]
+        for n in sorted(nodes, key = lambda n: -num_leaves[n]):
+            sizes[leaf_inds[n]] = num_leaves[n]
+        row = offset - np.log(sizes)
+        out[i] = row
+        out[:, i] = row
+    return out
 
 def bird_info_gain():
     """This function returns a 200*200 matrix that contains the information
     gain between each bird class.
     """
-    mat = np.zeros((200,200))
-    infogain = pairwise_info_gain(get_bird_taxonomy(), root = __ROOT_NAME)
-    for key in infogain:
-        i = int(key[0][:3]) - 1
-        j = int(key[1][:3]) - 1
-        mat[i,j] = infogain[key]
-    return mat
+    graph = get_bird_taxonomy()
+    leaves = [n for n in graph.nodes() if len(graph.successors(n)) == 0]
+    leaves.sort(key = lambda n: int(n[:3]))
+    return pairwise_info_gain_matrix(graph, leaves, root = __ROOT_NAME)
 
 def cifar_info_gain():
     """This function returns a 100*100 matrix that contains the information gain
     between each cifar class.
     """
-    mat = np.zeros((100,100))
-    infogain = pairwise_info_gain(get_cifar_taxonomy())
-    for key in infogain:
-        mat[key[0],key[1]] = infogain[key]
-    return mat
+    return pairwise_info_gain_matrix(get_cifar_taxonomy(), range(100))
 
 def get_bird_ancestor_matrix(graph = None):
     """Returns a matrix of [num_nodes * num_leaves], where the leaves are 
@@ -353,5 +427,71 @@ def get_topological_order(graph):
     return order
             
 
+class TaxTest(unittest.TestCase):
+    """Tests of the taxonomy computations
+    """
+    def setUp(self):
+        # root -> a -> {x, y, d}, d -> b, root -> c -> {b, w, u},
+        # b -> {z, v}: b has two parents at different depths, and the
+        # spanning tree of deepest parents loses c as an ancestor of z and v
+        self.graph = nx.DiGraph()
+        self.graph.add_edges_from([
+            ('root', 'a'), ('root', 'c'), ('a', 'x'), ('a', 'y'),
+            ('a', 'd'), ('d', 'b'), ('c', 'b'), ('c', 'w'), ('b', 'z'),
+            ('b', 'v'), ('c', 'u')])
+
+    @staticmethod
+    def recursive_info_gain(graph, root):
+        """The original recursive computation, for reference.
+        """
+        infogain = {}
+        def visit(node):
+            if len(graph.successors(node)) == 0:
+                graph.node[node]['_ref_leaves'] = set([node])
+                infogain[(node, node)] = 0.
+                return
+            children = graph.successors(node)
+            for c in children:
+                visit(c)
+            leaves = set()
+            for c in children:
+                leaves.update(graph.node[c]['_ref_leaves'])
+            graph.node[node]['_ref_leaves'] = leaves
+            gain = np.log(len(leaves))
+            for i in range(len(children)):
+                for j in range(i + 1, len(children)):
+                    for leaf_1 in graph.node[children[i]]['_ref_leaves']:
+                        for leaf_2 in graph.node[children[j]]['_ref_leaves']:
+                            if (leaf_1, leaf_2) not in infogain and \
+                                    (leaf_2, leaf_1) not in infogain:
+                                infogain[(leaf_1, leaf_2)] = gain
+        visit(root)
+        offset = np.log(len(graph.node[root]['_ref_leaves']))
+        for n in graph.nodes():
+            graph.node[n].pop('_ref_leaves', None)
+        for key in infogain.keys():
+            infogain[key] = offset - infogain[key]
+            infogain[(key[1], key[0])] = infogain[key]
+        return infogain
+
+    def test_pairwise_info_gain_dag(self):
+        reference = self.recursive_info_gain(self.graph, 'root')
+        infogain = pairwise_info_gain(self.graph)
+        self.assertEqual(set(infogain), set(reference))
+        for key in reference:
+            self.assertAlmostEqual(infogain[key], reference[key])
+        # z and v meet at b, and z and w at c, not at the root
+        self.assertAlmostEqual(infogain[('z', 'w')], np.log(6) - np.log(4))
+        self.assertAlmostEqual(infogain[('z', 'v')], np.log(6) - np.log(2))
+
+    def test_pairwise_info_gain_matrix_blocks(self):
+        leaves = ['v', 'x', 'w', 'z', 'y', 'u']
+        mat = pairwise_info_gain_matrix(self.graph, leaves, block_size = 2)
+        reference = self.recursive_info_gain(self.graph, 'root')
+        for i, leaf_1 in enumerate(leaves):
+            for j, leaf_2 in enumerate(leaves):
+                self.assertAlmostEqual(mat[i, j], reference[(leaf_1, leaf_2)])
+
+
 if __name__ == '__main__':
-    pass
+    unittest.main()
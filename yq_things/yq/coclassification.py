@@ -1,11 +1,58 @@
 from birdmix import tax
 from collections import Counter, defaultdict
 from iceberk import classifier, mathutil
+import networkx as nx
 import numpy as np
 import random
 from sklearn import metrics
 import unittest
 
+
+def _sample_rows(n, k, m):
+    """Returns a [m * k] matrix whose rows are each k distinct integers
+    sampled uniformly from range(n).
+    """
+    if k == 0:
+        return np.zeros((m, 0), dtype=np.int)
+    if 2 * k > n:
+        return np.argsort(np.random.rand(m, n), axis=1)[:, :k]
+    # resample the rows that have duplicates, which are few when k <= n/2
+    out = np.random.randint(n, size=(m, k))
+    while True:
+        sorted_out = np.sort(out, axis=1)
+        bad = np.flatnonzero((sorted_out[:, 1:] == sorted_out[:, :-1]).any(1))
+        if len(bad) == 0:
+            return out
+        out[bad] = np.random.randint(n, size=(len(bad), k))
+
+
+def _sample_segments(starts, lengths, num):
+    """For each segment [starts[i], starts[i] + lengths[i]), samples
+    min(num, lengths[i]) distinct positions, by sorting random keys within
+    the segments.
+    Output:
+        positions: the sampled positions, segment by segment.
+        counts: the number of positions sampled from each segment.
+    """
+    counts = np.minimum(lengths, num)
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    seg_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    rank = np.arange(len(segment)) - seg_starts
+    positions = np.repeat(starts, lengths) + rank
+    order = np.lexsort((np.random.rand(len(segment)), segment))
+    take = rank < np.repeat(counts, lengths)
+    return positions[order][take], counts
+
+
+def set_sums(x, offsets):
+    """Sums the rows of x within each set, where set i is made of rows
+    offsets[i] to offsets[i+1].
+    """
+    if np.any(np.diff(offsets) <= 0):
+        raise ValueError, "All sets should be nonempty."
+    return np.add.reduceat(x, offsets[:-1], axis=0)
+
+
 class Concept(object):
     """The class that stores the concept model parameters
     """
@@ -78,6 +125,53 @@ class Concept(object):
             self.toporder = tax.get_topological_order(self.graph)
             self.invtoporder = list(self.toporder)
             self.invtoporder.reverse()
+            self.compile_dag()
+
+    def compile_dag(self):
+        """Compile the concept DAG into levels for coclassify_dag: level 0
+        holds the leaves, and every other concept is on the level above its
+        highest child. For each level above 0, we store the concept ids, the
+        concatenated child ids of these concepts, and the offsets of each
+        concept's children in them, so that the max over children of a
+        level is a single np.maximum.reduceat.
+        """
+        level = {}
+        for c in self.invtoporder:
+            succ = self.graph.successors(c)
+            if len(succ) == 0:
+                level[c] = 0
+            else:
+                level[c] = max(level[s] for s in succ) + 1
+        leaves = [c for c in self.toporder if level[c] == 0]
+        self.dag_leaf_cids = np.array([self.concept2id[c] for c in leaves],
+                                      dtype=np.int)
+        self.dag_leaf_labels = np.array([self.leaf2id[c] for c in leaves],
+                                        dtype=np.int)
+        self.dag_levels = []
+        for l in range(1, max(level.values()) + 1):
+            concepts = [c for c in self.toporder if level[c] == l]
+            children = [[self.concept2id[s] for s in self.graph.successors(c)]
+                        for c in concepts]
+            offsets = np.cumsum([0] + [len(s) for s in children[:-1]])
+            self.dag_levels.append((
+                np.array([self.concept2id[c] for c in concepts], dtype=np.int),
+                np.array(sum(children, []), dtype=np.int),
+                offsets.astype(np.int)))
+
+    def max_prob_in_concepts(self, prob_ys):
+        """Computes max_{y in c} prob_ys[:, y] for every concept c, level by
+        level up the compiled DAG.
+        Input:
+            prob_ys: a [num_data * num_classes] matrix.
+        Output:
+            max_prob: a [num_data * num_concepts] matrix.
+        """
+        max_prob = np.zeros((prob_ys.shape[0], len(self.toporder)))
+        max_prob[:, self.dag_leaf_cids] = prob_ys[:, self.dag_leaf_labels]
+        for cids, child_cids, offsets in self.dag_levels:
+            max_prob[:, cids] = np.maximum.reduceat(
+                max_prob[:, child_cids], offsets, axis=1)
+        return max_prob
     
     def hedging_accuracy(self):
         """Returns the hedging accuracy computed from the raw confusion
@@ -125,13 +219,19 @@ class Concept(object):
         else:
             raise ValueError, "Unknown smoothing method %s" % method
 
-    def coclassify_oracle(self, prob, cid):
-        """Perform coclassification when the hidden concept is just given in cid
+    def log_prob_ys(self, prob):
+        """Computes log(prob(y|s)) for the classifier outputs prob.
         """
         prob_ys = mathutil.dot(prob, self.invconfprob.T)
         prob_ys /= prob_ys.sum(1)[:, np.newaxis]
         prob_ys += np.finfo(np.float64).eps
         np.log(prob_ys, out=prob_ys)
+        return prob_ys
+
+    def coclassify_oracle(self, prob, cid):
+        """Perform coclassification when the hidden concept is just given in cid
+        """
+        prob_ys = self.log_prob_ys(prob)
         slice = np.array(list(self.membership_map[cid]))
         best_labels = slice[prob_ys[:, slice].argmax(1)]
         return cid, best_labels
@@ -188,23 +288,10 @@ class Concept(object):
         if self.graph == None:
             raise ValueError, "No graph given."
         # compute log(prob(y|s)) first
-        prob_ys = mathutil.dot(prob, self.invconfprob.T)
-        prob_ys /= prob_ys.sum(1)[:, np.newaxis]
-        prob_ys += np.finfo(np.float64).eps
-        np.log(prob_ys, out=prob_ys)
-        # using the tree structure to compute the max_{y\in c} prob_ys for
-        # each concept.
-        # basically, we need to follow the inverse topological order
-        max_prob_ys_in_c = np.zeros((prob_ys.shape[0], len(self.graph.nodes())))
-        for c in self.invtoporder:
-            cid = self.concept2id[c]
-            succ = [self.concept2id[s] for s in self.graph.successors(c)]
-            if len(succ) == 0:
-                # I am a leaf node
-                max_prob_ys_in_c[:,cid] = prob_ys[:, self.leaf2id[c]]
-            else:
-                max_prob_ys_in_c[:,cid] = np.max(\
-                        max_prob_ys_in_c[:, succ], axis=1)
+        prob_ys = self.log_prob_ys(prob)
+        # using the DAG structure to compute the max_{y\in c} prob_ys for
+        # each concept, bottom up.
+        max_prob_ys_in_c = self.max_prob_in_concepts(prob_ys)
         # now, combine the upstream probability and downstream probability to find
         # the argmax
         score = self.logprior + max_prob_ys_in_c.sum(0) * classifier_weight \
@@ -214,7 +301,62 @@ class Concept(object):
         best_labels = slice[prob_ys[:, slice].argmax(1)]
         return best_cid, best_labels
 
-    def generate_testsets(self, labels, num_sets, set_size, class_ratio = 0):
+    # Batched coclassification: the *_batch methods take a ragged batch of
+    # sets as the classifier outputs of all their images stacked in one
+    # matrix prob, and offsets of length num_sets + 1 such that set i is
+    # made of rows offsets[i] to offsets[i+1], as returned by
+    # generate_testsets(..., ragged=True). They return the best concept of
+    # each set and the best labels of all images.
+
+    def best_labels_batch(self, prob_ys, offsets, cids):
+        """Returns the labels maximizing prob_ys among the members of the
+        concept of the set of each row.
+        """
+        row_cids = np.repeat(cids, np.diff(offsets))
+        masked = np.where(self.membership[row_cids], prob_ys, -np.inf)
+        return masked.argmax(1)
+
+    def coclassify_oracle_batch(self, prob, offsets, cids):
+        """Batched coclassify_oracle, with the concept of each set given in
+        cids.
+        """
+        cids = np.asarray(cids)
+        prob_ys = self.log_prob_ys(prob)
+        return cids, self.best_labels_batch(prob_ys, offsets, cids)
+
+    def coclassify_baseline_batch(self, prob, offsets):
+        """Batched coclassify_baseline.
+        """
+        num_sets = len(offsets) - 1
+        return np.repeat(self.root_id, num_sets), prob.argmax(1)
+
+    def coclassify_hedging_batch(self, prob, offsets, thres, accuracies):
+        """Batched coclassify_hedging.
+        """
+        sizes = np.diff(offsets).astype(np.float64)
+        thres = min(thres, 1)
+        counts = np.dot(set_sums(prob, offsets), self.membership.T)
+        correct = counts * accuracies / sizes[:, np.newaxis]
+        # among the concepts above the threshold, find the smallest one
+        masked_sizes = np.where(correct >= thres, self.concept_sizes, np.inf)
+        best_cids = masked_sizes.argmin(1)
+        return self.coclassify_oracle_batch(prob, offsets, best_cids)
+
+    def coclassify_dag_batch(self, prob, offsets, classifier_weight = 1.):
+        """Batched coclassify_dag.
+        """
+        if self.graph == None:
+            raise ValueError, "No graph given."
+        prob_ys = self.log_prob_ys(prob)
+        max_prob_ys_in_c = set_sums(self.max_prob_in_concepts(prob_ys),
+                                    offsets)
+        score = self.logprior + max_prob_ys_in_c * classifier_weight \
+                - np.outer(np.diff(offsets), self.log_concept_sizes)
+        best_cids = score.argmax(1)
+        return best_cids, self.best_labels_batch(prob_ys, offsets, best_cids)
+
+    def generate_testsets(self, labels, num_sets, set_size, class_ratio = 0,
+                          ragged = False):
         """Generate a bunch of testing sets for coclassification
         Input:
             labels: a vector of integer ground truth labels for the test
@@ -229,49 +371,60 @@ class Concept(object):
                 down.
 
                 All sampling are carried out WITHOUT replacement.
+            ragged: if True, return the sets as flat arrays and offsets, for
+                the *_batch coclassification methods.
         Returns:
             concept_gt: the ground truth concept indices, a vector of
                 length num_sets
             label_gt: the ground truth labels.
             indices: the indices for the data points
+            offsets: only if ragged, the vector of length num_sets + 1 such
+                that set i is label_gt[offsets[i]:offsets[i+1]] and
+                indices[offsets[i]:offsets[i+1]].
+        The sets are sampled concept by concept: all sets of a concept are
+        drawn at once as rows of distinct random positions in the data of
+        the concept, or, with class_ratio, as random positions within the
+        data of each sampled class.
         """
-        # crate the label to index map and concept to index map
-        label2idx = defaultdict(list)
-        for i,y in enumerate(labels):
-            label2idx[y].append(i)
-        concept2idx = defaultdict(list)
-        for c in range(self.C):
-            for k in self.membership_map[c]:
-                concept2idx[c] += label2idx[k]
+        labels = np.asarray(labels)
+        # the data indices sorted by label, and the range of each label
+        label_order = np.argsort(labels, kind='mergesort')
+        label_counts = np.bincount(labels, minlength=self.membership.shape[1])
+        label_starts = np.cumsum(label_counts) - label_counts
         # first, generate the concepts
         counts = np.random.multinomial(num_sets, self.prior)
-        concept_gt = np.hstack(([i]*c for i,c in enumerate(counts)))\
-                .astype(int)
-        label_gt = []
+        concept_gt = np.repeat(np.arange(len(counts)), counts)
+        # then sample the sets of each concept together
         indices = []
-        if class_ratio == 0:
-            # randomly sample labels
-            for i,c in enumerate(concept_gt):
-                idxlist = concept2idx[c]
-                np.random.shuffle(idxlist)
-                indices.append(idxlist[:min(set_size, len(idxlist))])
-                label_gt.append(labels[indices[i]])
-        else:
-            # randomly sample classes first, and then labels
-            for i, c in enumerate(concept_gt):
-                label_gt.append([])
-                indices.append([])
-                clslist = list(self.membership_map[c])
-                np.random.shuffle(clslist)
-                num_classes = max(int(len(clslist) * class_ratio + 0.5), 1)
-                for k in clslist[:num_classes]:
-                    idxlist = label2idx[k]
-                    np.random.shuffle(idxlist)
-                    idxlist = idxlist[:min(set_size, len(idxlist))]
-                    indices[i] += idxlist
-                    label_gt[i] += labels[idxlist]
-        label_gt = [np.asarray(s) for s in label_gt]
-        indices = [np.asarray(s) for s in indices]
+        sizes = []
+        for c in np.flatnonzero(counts):
+            members = np.flatnonzero(self.membership[c])
+            m = counts[c]
+            if class_ratio == 0:
+                # randomly sample labels
+                pool = np.hstack([label_order[label_starts[k]:
+                                              label_starts[k] + label_counts[k]]
+                                  for k in members])
+                k = min(set_size, len(pool))
+                indices.append(pool[_sample_rows(len(pool), k, m)].flatten())
+                sizes.append(np.repeat(k, m))
+            else:
+                # randomly sample classes first, and then labels
+                num_classes = max(int(len(members) * class_ratio + 0.5), 1)
+                num_classes = min(num_classes, len(members))
+                classes = members[_sample_rows(len(members), num_classes, m)]
+                positions, class_sizes = _sample_segments(
+                        label_starts[classes.flatten()],
+                        label_counts[classes.flatten()], set_size)
+                indices.append(label_order[positions])
+                sizes.append(class_sizes.reshape(m, num_classes).sum(1))
+        indices = np.hstack(indices).astype(np.int)
+        offsets = np.hstack(([0], np.cumsum(np.hstack(sizes)))).astype(np.int)
+        label_gt = labels[indices]
+        if ragged:
+            return concept_gt, label_gt, indices, offsets
+        label_gt = np.split(label_gt, offsets[1:-1])
+        indices = np.split(indices, offsets[1:-1])
         return concept_gt, label_gt, indices
 
 
@@ -341,3 +494,90 @@ class CoClassifyTest(unittest.TestCase):
                 self.concept.generate_testsets(labels, 100, 5)
         np.testing.assert_array_equal(np.tile(concept_gt, (5,1)).T, label_gt)
         np.testing.assert_array_equal(labels[indices.flatten()], label_gt.flat)
+
+    def _dag_concept(self):
+        """A concept DAG in which b has two parents, d and c.
+        """
+        graph = nx.DiGraph()
+        graph.add_edges_from([('root', 'a'), ('root', 'c'), ('a', 'x'),
+                              ('a', 'y'), ('a', 'd'), ('d', 'b'), ('c', 'b'),
+                              ('c', 'w'), ('b', 'z'), ('b', 'v'), ('c', 'u')])
+        tax.compute_leave_sets(graph)
+        concepts = tax.get_topological_order(graph)
+        leaves = [c for c in concepts if len(graph.successors(c)) == 0]
+        concept2id = dict((c, i) for i, c in enumerate(concepts))
+        leaf2id = dict((c, i) for i, c in enumerate(leaves))
+        conditional = np.zeros((len(concepts), len(leaves)))
+        for c in concepts:
+            for leaf in graph.node[c]['leaves']:
+                conditional[concept2id[c], leaf2id[leaf]] = 1
+        confmat = np.eye(len(leaves)) * 5 + np.random.randint(
+                3, size=(len(leaves), len(leaves)))
+        return Concept(np.ones(len(concepts)), conditional, confmat,
+                       graph=graph, concept2id=concept2id, leaf2id=leaf2id)
+
+    def test_max_prob_in_concepts(self):
+        concept = self._dag_concept()
+        prob_ys = np.log(np.random.dirichlet(np.ones(concept.K), 20))
+        # the bottom-up loop over the inverse topological order
+        expected = np.zeros((prob_ys.shape[0], len(concept.graph.nodes())))
+        for c in concept.invtoporder:
+            cid = concept.concept2id[c]
+            succ = [concept.concept2id[s] for s in concept.graph.successors(c)]
+            if len(succ) == 0:
+                expected[:, cid] = prob_ys[:, concept.leaf2id[c]]
+            else:
+                expected[:, cid] = np.max(expected[:, succ], axis=1)
+        np.testing.assert_array_equal(concept.max_prob_in_concepts(prob_ys),
+                                      expected)
+        # which is the max over the members of each concept
+        for cid in range(concept.C):
+            np.testing.assert_array_equal(
+                expected[:, cid], prob_ys[:, concept.membership[cid]].max(1))
+
+    def test_batch_coclassify(self):
+        concept = self._dag_concept()
+        labels = np.random.randint(concept.K, size=300)
+        prob = np.random.dirichlet(np.ones(concept.K), 300)
+        _, _, indices, offsets = \
+                concept.generate_testsets(labels, 40, 5, ragged=True)
+        batch_prob = prob[indices]
+        sets = [batch_prob[offsets[i]:offsets[i+1]]
+                for i in range(len(offsets) - 1)]
+        accuracies = concept.hedging_accuracy()
+        cids = np.random.randint(concept.C, size=len(sets))
+        methods = [
+            (lambda p, i: concept.coclassify_oracle(p, cids[i]),
+             concept.coclassify_oracle_batch(batch_prob, offsets, cids)),
+            (lambda p, i: concept.coclassify_baseline(p),
+             concept.coclassify_baseline_batch(batch_prob, offsets)),
+            (lambda p, i: concept.coclassify_hedging(p, 0.5, accuracies),
+             concept.coclassify_hedging_batch(batch_prob, offsets, 0.5,
+                                              accuracies)),
+            (lambda p, i: concept.coclassify_dag(p, 2.),
+             concept.coclassify_dag_batch(batch_prob, offsets, 2.))]
+        for single, (best_cids, best_labels) in methods:
+            for i, p in enumerate(sets):
+                cid, set_labels = single(p, i)
+                self.assertEqual(best_cids[i], cid)
+                np.testing.assert_array_equal(
+                        best_labels[offsets[i]:offsets[i+1]], set_labels)
+
+    def test_generate_testsets_ragged(self):
+        concept = self._dag_concept()
+        # few images per class, so that sets exhaust small concepts
+        labels = np.repeat(np.arange(concept.K), 3)
+        for class_ratio in [0, 0.5]:
+            concept_gt, label_gt, indices, offsets = \
+                    concept.generate_testsets(labels, 100, 4, class_ratio,
+                                              ragged=True)
+            self.assertEqual(len(concept_gt), 100)
+            self.assertEqual(len(offsets), 101)
+            np.testing.assert_array_equal(labels[indices], label_gt)
+            for i in range(100):
+                set_indices = indices[offsets[i]:offsets[i+1]]
+                # the images are of classes inside the concept
+                members = concept.membership_map[concept_gt[i]]
+                self.assertTrue(set(labels[set_indices]) <= members)
+                # and are sampled without replacement
+                self.assertEqual(len(set(set_indices)), len(set_indices))
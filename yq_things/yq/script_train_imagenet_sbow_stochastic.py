@@ -67,12 +67,7 @@ if FLAGS.hier:
     graph = tax.get_imagenet_taxonomy(1000)
     leaves = [n for n in graph.nodes() if len(graph.successors(n)) == 0]
     leaves.sort()
-    leaf2id = dict((n,i) for i, n in enumerate(leaves))
-    infogain = tax.pairwise_info_gain(graph)
-    # convert to mat
-    igmat = np.zeros((1000,1000))
-    for key in infogain:
-        igmat[leaf2id[key[0]], leaf2id[key[1]]] = infogain[key]
+    igmat = tax.pairwise_info_gain_matrix(graph, leaves)
     np.exp(igmat, igmat)
     # normalize
     igmat /= igmat.sum(1)[:, np.newaxis]